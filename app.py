@@ -2,23 +2,23 @@
 Medication Adherence Support System - Flask Backend API
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import json
 import os
+from io import BytesIO
 from dotenv import load_dotenv
 from functools import wraps
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
 # Import our modules
 from db_connection import (
     get_db_connection, 
     close_db_connection, 
     execute_query, 
-    execute_update
+    execute_update,
+    release_thread_connections,
+    get_pool_stats
 )
 from medication_kb import (
     get_medication_info,
@@ -28,6 +28,24 @@ from medication_kb import (
     format_daily_schedule
 )
 from ocr_processor import PrescriptionOCR, validate_prescription_input
+from ocr_jobs import get_job_queue, QueueFull
+from image_ingest import claim_upload, UploadTooLarge
+from bulk_import import detach_uploads, close_uploads, iter_upload_images, run_bulk_import
+from dose_scheduler import (
+    materialize_doses,
+    materialize_plan_doses,
+    plan_schedule,
+    extend_dose_horizon,
+    start_horizon_extender
+)
+from db_migrations import ensure_schema
+from interaction_engine import check_user_interactions, check_new_medicine_interactions, scan_all_patients
+from medical_info import save_medical_info_row, load_medical_info, check_prescriptions
+from contraindication_scanner import run_scan as run_contraindication_scan
+from email_outbox import email_configured, enqueue_email, wake_sender, start_email_sender
+from reminder_dispatcher import dispatch_due, start_reminder_dispatcher
+from change_stream import get_change_hub, stream_events
+from pagination import Keyset, InvalidPageRequest, fetch_page, page_params, page_info
 
 
 def _create_reminder_for_dose(cursor, dose_tracking_id, user_id, scheduled_time, medicine_name, dosage=""):
@@ -57,6 +75,11 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 # Initialize OCR processor
 ocr = PrescriptionOCR()
 
+@app.teardown_request
+def return_leaked_connections(exc):
+    """Hand back any pooled DB connection a route forgot to close (e.g. on an error path)"""
+    release_thread_connections()
+
 # ===== GLOBAL ERROR HANDLERS (always return JSON, never HTML) =====
 
 @app.errorhandler(404)
@@ -79,11 +102,15 @@ def handle_exception(e):
     print(f"Unhandled exception: {str(e)}")
     return jsonify({"status": "error", "message": "An unexpected error occurred", "error": str(e)}), 500
 
-# Email Configuration
-SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
-SMTP_EMAIL = os.getenv('SMTP_EMAIL', None)
-SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', None)
+# OCR requests: how long POST /api/prescriptions/ocr waits before handing back a
+# job id, and the cap on ?wait= long-polls (both stay under gunicorn's --timeout)
+OCR_SYNC_WAIT_SECONDS = int(os.getenv('OCR_SYNC_WAIT_SECONDS', 90))
+OCR_JOB_MAX_WAIT_SECONDS = int(os.getenv('OCR_JOB_MAX_WAIT_SECONDS', 25))
+# Request body limit for /api/prescriptions/bulk-import (everything else: MAX_CONTENT_LENGTH)
+OCR_BULK_MAX_UPLOAD_BYTES = int(os.getenv('OCR_BULK_MAX_UPLOAD_MB', 200)) * 1024 * 1024
+
+# Apply pending schema migrations at startup (set false to run db_migrations.py by hand)
+AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', 'true').lower() == 'true'
 
 # ===== UTILITY FUNCTIONS =====
 
@@ -95,32 +122,6 @@ def success_response(data, message="Success", status_code=200):
         "data": data
     }), status_code
 
-def send_email(recipient_email, subject, body):
-    """Send email via SMTP"""
-    try:
-        if not SMTP_EMAIL or not SMTP_PASSWORD:
-            print("⚠ Email not configured. Set SMTP_EMAIL and SMTP_PASSWORD in .env")
-            return False
-        
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = SMTP_EMAIL
-        msg['To'] = recipient_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Send email
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_EMAIL, SMTP_PASSWORD)
-            server.send_message(msg)
-        
-        print(f"✓ Email sent successfully to {recipient_email}")
-        return True
-    except Exception as e:
-        print(f"✗ Error sending email: {str(e)}")
-        return False
-
 def error_response(error, message="Error", status_code=400):
     """Return standardized error response"""
     return jsonify({
@@ -129,6 +130,11 @@ def error_response(error, message="Error", status_code=400):
         "error": error
     }), status_code
 
+# Keyset orderings for the paginated listings (indexes: migrations/0008_keyset_indexes.sql)
+PRESCRIPTION_PAGES = Keyset("prescriptions", [("id", "int")])
+REMINDER_PAGES = Keyset("reminders", [("r.reminder_time", "timestamp"), ("r.id", "int")])
+DOSE_PAGES = Keyset("doses", [("dt.scheduled_time", "timestamp"), ("dt.id", "int")])
+
 # ===== STEP 1: USER MANAGEMENT =====
 
 @app.route('/api/users/login', methods=['POST'])
@@ -305,35 +311,9 @@ def save_medical_info(user_id):
         if not conn:
             return error_response("Database connection failed")
         
-        # Check if medical info exists
+        # Allergy / condition text is stored with its normalized terms for fast checks
         cursor = conn.cursor()
-        cursor.execute("SELECT id FROM user_medical_info WHERE user_id = %s", (user_id,))
-        existing = cursor.fetchone()
-        
-        drug_allergies = data.get("drug_allergies", "")
-        food_allergies = data.get("food_allergies", "")
-        existing_conditions = data.get("existing_conditions", "")
-        current_medications = data.get("current_medications", "")
-        is_pregnant = data.get("is_pregnant", False)
-        is_breastfeeding = data.get("is_breastfeeding", False)
-
-        if existing:
-            cursor.execute("""
-                UPDATE user_medical_info 
-                SET drug_allergies = %s, food_allergies = %s, existing_conditions = %s,
-                    current_medications = %s, is_pregnant = %s, is_breastfeeding = %s,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE user_id = %s
-            """, (drug_allergies, food_allergies, existing_conditions,
-                   current_medications, is_pregnant, is_breastfeeding, user_id))
-        else:
-            cursor.execute("""
-                INSERT INTO user_medical_info 
-                (user_id, drug_allergies, food_allergies, existing_conditions,
-                 current_medications, is_pregnant, is_breastfeeding)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (user_id, drug_allergies, food_allergies, existing_conditions,
-                   current_medications, is_pregnant, is_breastfeeding))
+        save_medical_info_row(cursor, user_id, data)
         
         conn.commit()
         cursor.close()
@@ -501,9 +481,231 @@ def test_prescription_ocr():
 
 # ===== STEPS 2-3: PRESCRIPTION INPUT & PROCESSING =====
 
+def _save_ocr_prescriptions(prescription_list, user_id, username):
+    """Save each extracted medicine with its adherence plan and doses.
+    Marks every rx dict with saved / prescription_id (or save_error) in place."""
+    conn = get_db_connection()
+    if conn:
+        cursor = conn.cursor()
+
+        # Ensure user exists
+        try:
+            cursor.execute("SELECT id FROM users WHERE id = %s", (user_id,))
+            if not cursor.fetchone():
+                cursor.execute("""
+                    INSERT INTO users (id, username, email, password_hash)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (id) DO NOTHING
+                """, (user_id, username, f"{username}@demo.local", "demo"))
+                conn.commit()
+        except Exception as e:
+            print(f"User check note: {e}")
+
+        for rx in prescription_list:
+            if not rx.get("medicine_name"):
+                continue
+
+            start_date = datetime.now().date()
+            duration_val = rx.get("duration") or 30
+            end_date = (start_date + timedelta(days=int(duration_val))).isoformat()
+
+            # Look up instructions from medication KB
+            med_info = get_medication_info(rx.get("medicine_name", ""))
+            instructions = None
+            special_instructions = None
+            if med_info:
+                instructions = f"{med_info.get('how_to_take', '')}. {med_info.get('with_food', '')}. {med_info.get('duration_instruction', '')}".strip('. ')
+                special_instructions = f"Contraindications: {', '.join(med_info.get('contraindications', []))}. {med_info.get('risks_of_skipping', '')}".strip('. ')
+
+            try:
+                query = """
+                INSERT INTO prescriptions 
+                (user_id, medication_id, medicine_name, dosage, dosage_unit, frequency, duration,
+                 start_date, end_date, route, instructions, special_instructions,
+                 prescription_image_url, ocr_confidence, is_confirmed)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+                """
+
+                cursor.execute(query, (
+                    user_id,
+                    None,
+                    rx.get("medicine_name"),
+                    rx.get("dosage"),
+                    rx.get("dosage_unit", "mg"),
+                    rx.get("frequency", "Once daily"),
+                    duration_val,
+                    start_date,
+                    end_date,
+                    rx.get("route", "oral"),
+                    instructions or rx.get("instructions"),
+                    special_instructions or rx.get("special_instructions"),
+                    f"ocr_upload_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                    rx.get("ocr_confidence", 0.5),
+                    False
+                ))
+
+                prescription_id = cursor.fetchone()[0]
+                conn.commit()
+                rx["prescription_id"] = prescription_id
+                rx["saved"] = True
+                rx["instructions"] = instructions or rx.get("instructions")
+                rx["special_instructions"] = special_instructions or rx.get("special_instructions")
+
+                # Auto-create adherence plan & dose tracking
+                try:
+                    frequency = rx.get("frequency", "Once daily")
+                    daily_schedule = format_daily_schedule("1", frequency)
+                    nudges = get_adherence_nudge(rx.get("medicine_name", ""), frequency)
+                    why_important = med_info.get("why_important") if med_info else "Follow your medication schedule."
+                    nudge_reason = nudges[0].get("message") if nudges else "Taking medication as prescribed is important."
+
+                    cursor.execute("""
+                        INSERT INTO adherence_plans
+                        (prescription_id, user_id, daily_schedule, why_important, nudge_reason)
+                        VALUES (%s, %s, %s, %s, %s)
+                        RETURNING id
+                    """, (prescription_id, user_id, daily_schedule, why_important, nudge_reason))
+                    plan_id = cursor.fetchone()[0]
+                    conn.commit()
+
+                    medicine_name_ocr = rx.get('medicine_name', 'Medication')
+                    dosage_ocr = f"{rx.get('dosage', '')} {rx.get('dosage_unit', 'mg')}".strip()
+                    materialize_plan_doses(cursor, plan_id, prescription_id, user_id, start_date,
+                                           int(duration_val), daily_schedule, medicine_name_ocr, dosage_ocr)
+                    conn.commit()
+                except Exception as plan_err:
+                    print(f"Adherence plan creation note for {rx.get('medicine_name')}: {plan_err}")
+            except Exception as save_err:
+                print(f"Error saving {rx.get('medicine_name')}: {save_err}")
+                rx["saved"] = False
+                rx["save_error"] = str(save_err)
+
+        # Contraindication checks for everything just saved (one medical info read)
+        saved = [rx for rx in prescription_list if rx.get("saved")]
+        try:
+            found = check_prescriptions(cursor, user_id,
+                                        [(rx["prescription_id"], rx.get("medicine_name")) for rx in saved])
+            conn.commit()
+            for rx in saved:
+                rx["warnings"] = found.get(rx["prescription_id"], [])
+        except Exception as check_err:
+            conn.rollback()
+            print(f"Contraindication check note: {check_err}")
+
+        cursor.close()
+        close_db_connection(conn)
+
+
+def _process_ocr_image(image_file, user_id, username, save_to_db):
+    """OCR an uploaded image and (optionally) save what it found.
+    Returns the response body as a dict; runs on an OCR job worker."""
+    # Process OCR — returns a LIST of prescription dicts
+    try:
+        prescription_list = ocr.extract_from_image(image_file)
+    finally:
+        image_file.close()  # Free the spooled upload immediately
+    
+    # Handle legacy single-dict return (shouldn't happen but be safe)
+    if isinstance(prescription_list, dict):
+        prescription_list = [prescription_list]
+    
+    if not prescription_list or len(prescription_list) == 0:
+        return {"status": "error", "message": "OCR Error", "error": "Could not extract any data from image"}
+    
+    # Check if first entry has an error
+    if prescription_list[0].get("error"):
+        err_msg = prescription_list[0].get("error", "OCR processing failed")
+        print(f"[OCR API] Returning error to client: {err_msg}")
+        prescription_list[0]["requires_manual_confirmation"] = True
+        return {"status": "success", "message": err_msg,
+                "data": {"medicines": prescription_list, "count": 0}}
+    
+    # Log successful extraction
+    med_names = [rx.get('medicine_name', '?') for rx in prescription_list]
+    print(f"[OCR API] Extracted {len(prescription_list)} medicines: {', '.join(med_names)}")
+    
+    # Tag each medicine with user info
+    for rx in prescription_list:
+        rx["user_id"] = int(user_id)
+        rx["username"] = username
+    
+    # Auto-save ALL medicines to database if requested
+    if save_to_db:
+        _save_ocr_prescriptions(prescription_list, user_id, username)
+    
+    count = len(prescription_list)
+    saved_count = sum(1 for rx in prescription_list if rx.get("saved"))
+    msg = f"Found {count} medicine(s) in prescription"
+    if save_to_db:
+        msg += f", saved {saved_count} to database"
+    return {"status": "success", "message": msg,
+            "data": {"medicines": prescription_list, "count": count}}
+
+
+def _read_ocr_upload():
+    """Validate the multipart upload shared by the OCR endpoints.
+    The OCR job takes over the file Werkzeug spooled the image into (size checked
+    with seek/tell, no copy), so it stays open after the request ends.
+    Returns ((image_file, user_id, username, save_to_db), None) or (None, error response)."""
+    if 'image' not in request.files:
+        return None, error_response("No image provided", "Validation Error", 400)
+    
+    user_id = request.form.get('user_id')
+    username = request.form.get('username', f'user_{user_id}')
+    save_to_db = request.form.get('save_to_db', 'true').lower() == 'true'
+    
+    if not user_id:
+        return None, error_response("user_id required", "Validation Error", 400)
+    
+    image_file = request.files['image']
+    try:
+        image_spool, file_size = claim_upload(image_file.stream)
+    except UploadTooLarge:
+        image_file.close()  # Free file handle
+        return None, error_response("Image too large. Please use an image under 10 MB.", "Validation Error", 400)
+    # Flask closes request.files when the request ends; the job owns the stream now
+    image_file.stream = BytesIO()
+    if file_size == 0:
+        image_spool.close()
+        return None, error_response("Empty image file", "Validation Error", 400)
+    return (image_spool, user_id, username, save_to_db), None
+
+
+def _ocr_job_payload(job):
+    """Public view of an OCR job; result is the same body the synchronous endpoint returns"""
+    payload = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/api/prescriptions/ocr/jobs/{job['id']}",
+    }
+    if "queue_depth" in job:
+        payload["queue_depth"] = job["queue_depth"]
+    if job["status"] == "done":
+        payload["result"] = job["result"]
+    elif job["status"] == "failed":
+        payload["error"] = job["error"]
+    elif job["status"] == "lost":
+        # The worker that ran it was recycled; the client should submit the image again
+        payload["error"] = job["error"]
+        payload["resubmit"] = True
+    return payload
+
+
+def _queue_full_response(retry_after):
+    response, status_code = error_response(
+        "Too many prescriptions are being analyzed right now. Please retry shortly.",
+        "OCR Busy", 429
+    )
+    response.headers['Retry-After'] = str(retry_after)
+    return response, status_code
+
+
 @app.route('/api/prescriptions/ocr', methods=['POST', 'OPTIONS'])
 def process_prescription_image():
-    """Process prescription image via OCR and save ALL medicines to database"""
+    """Process prescription image via OCR and save ALL medicines to database.
+    Runs on the OCR job queue and waits for the result; if that takes longer
+    than OCR_SYNC_WAIT_SECONDS it answers 202 with a job to poll instead."""
     # Handle CORS preflight
     if request.method == 'OPTIONS':
         response = jsonify({'status': 'ok'})
@@ -513,185 +715,96 @@ def process_prescription_image():
         return response, 200
     
     try:
-        if 'image' not in request.files:
-            return error_response("No image provided", "Validation Error", 400)
-        
-        image_file = request.files['image']
-        
-        # Check file size early (max 10 MB for images)
-        image_file.seek(0, 2)  # Seek to end
-        file_size = image_file.tell()
-        image_file.seek(0)  # Reset
-        if file_size > 10 * 1024 * 1024:
-            return error_response("Image too large. Please use an image under 10 MB.", "Validation Error", 400)
-        if file_size == 0:
-            return error_response("Empty image file", "Validation Error", 400)
+        upload, invalid = _read_ocr_upload()
+        if invalid:
+            return invalid
+        jobs = get_job_queue()
+        try:
+            job_id = jobs.submit(_process_ocr_image, *upload)
+        except QueueFull as full:
+            return _queue_full_response(full.retry_after)
+        del upload
+        
+        job = jobs.wait(job_id, OCR_SYNC_WAIT_SECONDS)
+        if job["status"] == "done":
+            body = job["result"]
+            return jsonify(body), 200 if body.get("status") == "success" else 400
+        if job["status"] == "failed":
+            return error_response(job["error"], "OCR Processing Error")
+        return success_response(_ocr_job_payload(job), "Still processing; poll status_url for the result", 202)
+    
+    except Exception as e:
+        print(f"OCR error: {str(e)}")
+        return error_response(str(e), "OCR Processing Error")
+
+
+@app.route('/api/prescriptions/ocr/jobs', methods=['POST'])
+def submit_ocr_job():
+    """Queue a prescription image for OCR; returns a job id immediately (202)"""
+    try:
+        upload, invalid = _read_ocr_upload()
+        if invalid:
+            return invalid
+        try:
+            job_id = get_job_queue().submit(_process_ocr_image, *upload)
+        except QueueFull as full:
+            return _queue_full_response(full.retry_after)
+        del upload
+        return success_response(_ocr_job_payload(get_job_queue().status(job_id)), "OCR job queued", 202)
+    except Exception as e:
+        print(f"OCR job submit error: {str(e)}")
+        return error_response(str(e), "OCR Processing Error")
+
+
+@app.route('/api/prescriptions/ocr/jobs/<job_id>', methods=['GET'])
+def get_ocr_job(job_id):
+    """OCR job status. ?wait=N long-polls up to N seconds (capped) for completion."""
+    try:
+        wait = min(max(request.args.get('wait', 0, type=float), 0), OCR_JOB_MAX_WAIT_SECONDS)
+        job = get_job_queue().wait(job_id, wait)
+        if job is None:
+            return error_response("Unknown or expired OCR job", "Not Found", 404)
+        return success_response(_ocr_job_payload(job), f"OCR job {job['status']}")
+    except Exception as e:
+        return error_response(str(e), "OCR Job Error")
+
+@app.route('/api/prescriptions/bulk-import', methods=['POST'])
+def bulk_import_prescriptions():
+    """Import many prescription images at once (multipart "images" files and/or
+    "archive" zip files). Streams one JSON object per line (application/x-ndjson):
+    an "image" event per file as its OCR finishes, a "saved" event per database
+    batch, and a final "done" event with totals."""
+    try:
+        # Bulk uploads may exceed the app-wide MAX_CONTENT_LENGTH (must be set
+        # before the form is parsed; needs Flask 3.1+, older versions keep the default)
+        try:
+            request.max_content_length = OCR_BULK_MAX_UPLOAD_BYTES
+        except AttributeError:
+            pass
         user_id = request.form.get('user_id')
         username = request.form.get('username', f'user_{user_id}')
         save_to_db = request.form.get('save_to_db', 'true').lower() == 'true'
-        
         if not user_id:
             return error_response("user_id required", "Validation Error", 400)
+        if not request.files.getlist('images') and not request.files.getlist('archive'):
+            return error_response("No images or archive provided", "Validation Error", 400)
+        # The response streams after this view returns, so keep the uploads open ourselves
+        files = detach_uploads(request.files.getlist('images'))
+        archives = detach_uploads(request.files.getlist('archive'))
         
-        # Process OCR — now returns a LIST of prescription dicts
-        image_bytes = image_file.read()
-        image_file.close()  # Free file handle
-        prescription_list = ocr.extract_from_image(image_bytes)
-        del image_bytes  # Free memory immediately
-        
-        # Handle legacy single-dict return (shouldn't happen but be safe)
-        if isinstance(prescription_list, dict):
-            prescription_list = [prescription_list]
-        
-        if not prescription_list or len(prescription_list) == 0:
-            return error_response("Could not extract any data from image", "OCR Error")
-        
-        # Check if first entry has an error
-        if prescription_list[0].get("error"):
-            err_msg = prescription_list[0].get("error", "OCR processing failed")
-            print(f"[OCR API] Returning error to client: {err_msg}")
-            prescription_list[0]["requires_manual_confirmation"] = True
-            return success_response(
-                {"medicines": prescription_list, "count": 0},
-                err_msg
-            )
-        
-        # Log successful extraction
-        med_names = [rx.get('medicine_name', '?') for rx in prescription_list]
-        print(f"[OCR API] Extracted {len(prescription_list)} medicines: {', '.join(med_names)}")
-        
-        # Tag each medicine with user info
-        for rx in prescription_list:
-            rx["user_id"] = int(user_id)
-            rx["username"] = username
-        
-        # Auto-save ALL medicines to database if requested
-        if save_to_db:
-            conn = get_db_connection()
-            if conn:
-                cursor = conn.cursor()
-                
-                # Ensure user exists
-                try:
-                    cursor.execute("SELECT id FROM users WHERE id = %s", (user_id,))
-                    if not cursor.fetchone():
-                        cursor.execute("""
-                            INSERT INTO users (id, username, email, password_hash)
-                            VALUES (%s, %s, %s, %s)
-                            ON CONFLICT (id) DO NOTHING
-                        """, (user_id, username, f"{username}@demo.local", "demo"))
-                        conn.commit()
-                except Exception as e:
-                    print(f"User check note: {e}")
-                
-                for rx in prescription_list:
-                    if not rx.get("medicine_name"):
-                        continue
-                    
-                    start_date = datetime.now().date()
-                    duration_val = rx.get("duration") or 30
-                    end_date = (start_date + timedelta(days=int(duration_val))).isoformat()
-                    
-                    # Look up instructions from medication KB
-                    med_info = get_medication_info(rx.get("medicine_name", ""))
-                    instructions = None
-                    special_instructions = None
-                    if med_info:
-                        instructions = f"{med_info.get('how_to_take', '')}. {med_info.get('with_food', '')}. {med_info.get('duration_instruction', '')}".strip('. ')
-                        special_instructions = f"Contraindications: {', '.join(med_info.get('contraindications', []))}. {med_info.get('risks_of_skipping', '')}".strip('. ')
-                    
-                    try:
-                        query = """
-                        INSERT INTO prescriptions 
-                        (user_id, medication_id, medicine_name, dosage, dosage_unit, frequency, duration,
-                         start_date, end_date, route, instructions, special_instructions,
-                         prescription_image_url, ocr_confidence, is_confirmed)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        RETURNING id
-                        """
-                        
-                        cursor.execute(query, (
-                            user_id,
-                            None,
-                            rx.get("medicine_name"),
-                            rx.get("dosage"),
-                            rx.get("dosage_unit", "mg"),
-                            rx.get("frequency", "Once daily"),
-                            duration_val,
-                            start_date,
-                            end_date,
-                            rx.get("route", "oral"),
-                            instructions or rx.get("instructions"),
-                            special_instructions or rx.get("special_instructions"),
-                            f"ocr_upload_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                            rx.get("ocr_confidence", 0.5),
-                            False
-                        ))
-                        
-                        prescription_id = cursor.fetchone()[0]
-                        conn.commit()
-                        rx["prescription_id"] = prescription_id
-                        rx["saved"] = True
-                        rx["instructions"] = instructions or rx.get("instructions")
-                        rx["special_instructions"] = special_instructions or rx.get("special_instructions")
-                        
-                        # Auto-create adherence plan & dose tracking
-                        try:
-                            frequency = rx.get("frequency", "Once daily")
-                            daily_schedule = format_daily_schedule("1", frequency)
-                            nudges = get_adherence_nudge(rx.get("medicine_name", ""), frequency)
-                            why_important = med_info.get("why_important") if med_info else "Follow your medication schedule."
-                            nudge_reason = nudges[0].get("message") if nudges else "Taking medication as prescribed is important."
-                            
-                            cursor.execute("""
-                                INSERT INTO adherence_plans
-                                (prescription_id, user_id, daily_schedule, why_important, nudge_reason)
-                                VALUES (%s, %s, %s, %s, %s)
-                                RETURNING id
-                            """, (prescription_id, user_id, daily_schedule, why_important, nudge_reason))
-                            plan_id = cursor.fetchone()[0]
-                            conn.commit()
-                            
-                            medicine_name_ocr = rx.get('medicine_name', 'Medication')
-                            dosage_ocr = f"{rx.get('dosage', '')} {rx.get('dosage_unit', 'mg')}".strip()
-                            for day in range(int(duration_val)):
-                                current_date = start_date + timedelta(days=day)
-                                for time_str in daily_schedule:
-                                    hour, minute = map(int, time_str.split(':'))
-                                    scheduled_time = datetime.combine(current_date, datetime.min.time().replace(hour=hour, minute=minute))
-                                    cursor.execute("""
-                                        INSERT INTO dose_tracking
-                                        (adherence_plan_id, prescription_id, user_id, scheduled_time)
-                                        VALUES (%s, %s, %s, %s)
-                                        RETURNING id
-                                    """, (plan_id, prescription_id, user_id, scheduled_time))
-                                    dt_id = cursor.fetchone()[0]
-                                    _create_reminder_for_dose(cursor, dt_id, user_id, scheduled_time, medicine_name_ocr, dosage_ocr)
-                            conn.commit()
-                        except Exception as plan_err:
-                            print(f"Adherence plan creation note for {rx.get('medicine_name')}: {plan_err}")
-                    except Exception as save_err:
-                        print(f"Error saving {rx.get('medicine_name')}: {save_err}")
-                        rx["saved"] = False
-                        rx["save_error"] = str(save_err)
-                
-                cursor.close()
-                close_db_connection(conn)
-        
-        count = len(prescription_list)
-        saved_count = sum(1 for rx in prescription_list if rx.get("saved"))
-        msg = f"Found {count} medicine(s) in prescription"
-        if save_to_db:
-            msg += f", saved {saved_count} to database"
-        
-        return success_response(
-            {"medicines": prescription_list, "count": count},
-            msg
-        )
-    
+        def generate():
+            try:
+                images = iter_upload_images(files, archives)
+                for event in run_bulk_import(ocr, images, int(user_id), username, save_to_db):
+                    yield json.dumps(event, default=str) + "\n"
+            finally:
+                close_uploads(files + archives)
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                        headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
     except Exception as e:
-        print(f"OCR error: {str(e)}")
-        return error_response(str(e), "OCR Processing Error")
+        print(f"Bulk import error: {str(e)}")
+        return error_response(str(e), "Bulk Import Error")
 
 @app.route('/api/prescriptions/manual-entry', methods=['POST'])
 def manual_prescription_entry():
@@ -829,28 +942,11 @@ def save_prescription():
             print(f"✓ Created adherence plan {plan_id}")
             
             # Create dose tracking entries
-            if isinstance(start_date, str):
-                sd = datetime.strptime(start_date, "%Y-%m-%d").date()
-            else:
-                sd = start_date
-            
-            dose_count = 0
             med_name = data.get("medicine_name", "Medication")
             med_dosage = f"{data.get('dosage', '')} {data.get('dosage_unit', 'mg')}".strip()
-            for day in range(duration_days):
-                current_date = sd + timedelta(days=day)
-                for time_str in daily_schedule:
-                    hour, minute = map(int, time_str.split(':'))
-                    scheduled_time = datetime.combine(current_date, datetime.min.time().replace(hour=hour, minute=minute))
-                    cursor.execute("""
-                        INSERT INTO dose_tracking 
-                        (adherence_plan_id, prescription_id, user_id, scheduled_time)
-                        VALUES (%s, %s, %s, %s)
-                        RETURNING id
-                    """, (plan_id, prescription_id, user_id, scheduled_time))
-                    dt_id = cursor.fetchone()[0]
-                    _create_reminder_for_dose(cursor, dt_id, user_id, scheduled_time, med_name, med_dosage)
-                    dose_count += 1
+            dose_ids = materialize_plan_doses(cursor, plan_id, prescription_id, user_id, start_date,
+                                              duration_days, daily_schedule, med_name, med_dosage)
+            dose_count = len(dose_ids)
             
             conn.commit()
             print(f"✓ Created {dose_count} dose tracking + reminder entries for prescription {prescription_id}")
@@ -932,23 +1028,11 @@ def init_dose_tracking_for_user(user_id):
                 created_count += 1
 
                 # Create dose tracking + reminders for this new plan
-                sd = start_date if start_date else datetime.now().date()
-                for day in range(duration_days):
-                    current_date = sd + timedelta(days=day)
-                    for time_str in daily_schedule:
-                        hour, minute = map(int, time_str.split(':'))
-                        scheduled_time = datetime.combine(current_date, datetime.min.time().replace(hour=hour, minute=minute))
-                        cursor.execute("""
-                            INSERT INTO dose_tracking
-                            (adherence_plan_id, prescription_id, user_id, scheduled_time)
-                            VALUES (%s, %s, %s, %s)
-                            RETURNING id
-                        """, (plan_id, presc_id, user_id, scheduled_time))
-                        dt_id = cursor.fetchone()[0]
-                        _create_reminder_for_dose(cursor, dt_id, user_id, scheduled_time, medicine_name)
-                        dose_count += 1
+                dose_ids = materialize_plan_doses(cursor, plan_id, presc_id, user_id, start_date,
+                                                  duration_days, daily_schedule, medicine_name)
+                dose_count += len(dose_ids)
                 conn.commit()
-                print(f"✓ Created {duration_days * len(daily_schedule)} dose + reminder entries for plan {plan_id}")
+                print(f"✓ Created {len(dose_ids)} dose + reminder entries for plan {plan_id}")
             except Exception as e:
                 print(f"Error processing prescription {presc_id}: {e}")
                 try:
@@ -956,37 +1040,32 @@ def init_dose_tracking_for_user(user_id):
                 except:
                     pass
 
-        # Create dose tracking + reminders for prescriptions with plans but no tracking
-        for presc_id, plan_id, medicine_name, frequency, duration_days, start_date in prescriptions_without_tracking:
+        # Create dose tracking + reminders for prescriptions with plans but no tracking (one statement for all)
+        schedules = [
+            plan_schedule(plan_id, presc_id, user_id, start_date, duration_days or 30,
+                          format_daily_schedule("1", frequency or "Once daily"), medicine_name)
+            for presc_id, plan_id, medicine_name, frequency, duration_days, start_date in prescriptions_without_tracking
+        ]
+        if schedules:
             try:
-                frequency = frequency or "Once daily"
-                duration_days = duration_days or 30
-                daily_schedule = format_daily_schedule("1", frequency)
-
-                sd = start_date if start_date else datetime.now().date()
-                for day in range(duration_days):
-                    current_date = sd + timedelta(days=day)
-                    for time_str in daily_schedule:
-                        hour, minute = map(int, time_str.split(':'))
-                        scheduled_time = datetime.combine(current_date, datetime.min.time().replace(hour=hour, minute=minute))
-                        cursor.execute("""
-                            INSERT INTO dose_tracking
-                            (adherence_plan_id, prescription_id, user_id, scheduled_time)
-                            VALUES (%s, %s, %s, %s)
-                            RETURNING id
-                        """, (plan_id, presc_id, user_id, scheduled_time))
-                        dt_id = cursor.fetchone()[0]
-                        _create_reminder_for_dose(cursor, dt_id, user_id, scheduled_time, medicine_name)
-                        dose_count += 1
+                dose_ids = materialize_doses(cursor, schedules)
+                dose_count += len(dose_ids)
                 conn.commit()
-                print(f"✓ Created {duration_days * len(daily_schedule)} dose + reminder entries for prescription {presc_id}")
+                print(f"✓ Created {len(dose_ids)} dose + reminder entries for {len(schedules)} existing plan(s)")
             except Exception as e:
-                print(f"Error creating dose tracking for prescription {presc_id}: {e}")
+                print(f"Error creating dose tracking for existing plans: {e}")
                 try:
                     conn.rollback()
                 except:
                     pass
 
+        # Top up the rolling dose window for this user's existing plans
+        try:
+            _, extended_doses = extend_dose_horizon(conn, user_id=user_id)
+            dose_count += extended_doses
+        except Exception as e:
+            print(f"Dose horizon extension note for user {user_id}: {e}")
+
         cursor.close()
         close_db_connection(conn)
 
@@ -1035,7 +1114,7 @@ def rebuild_all_tracking():
                 try:
                     frequency = frequency or "Once daily"
                     duration_days = duration_days or 30
-                    daily_schedule = format_daily_schedule("1", medicine_name)
+                    daily_schedule = format_daily_schedule("1", frequency)
                     
                     cursor.execute("""
                         INSERT INTO adherence_plans
@@ -1047,21 +1126,9 @@ def rebuild_all_tracking():
                     conn.commit()
                     total_initialized += 1
 
-                    sd = start_date if start_date else datetime.now().date()
-                    for day in range(duration_days):
-                        current_date = sd + timedelta(days=day)
-                        for time_str in daily_schedule:
-                            hour, minute = map(int, time_str.split(':'))
-                            scheduled_time = datetime.combine(current_date, datetime.min.time().replace(hour=hour, minute=minute))
-                            cursor.execute("""
-                                INSERT INTO dose_tracking
-                                (adherence_plan_id, prescription_id, user_id, scheduled_time)
-                                VALUES (%s, %s, %s, %s)
-                                RETURNING id
-                            """, (plan_id, presc_id, user_id, scheduled_time))
-                            dt_id = cursor.fetchone()[0]
-                            _create_reminder_for_dose(cursor, dt_id, user_id, scheduled_time, medicine_name)
-                            total_doses += 1
+                    dose_ids = materialize_plan_doses(cursor, plan_id, presc_id, user_id, start_date,
+                                                      duration_days, daily_schedule, medicine_name)
+                    total_doses += len(dose_ids)
                     conn.commit()
                 except Exception as e:
                     print(f"Error: {e}")
@@ -1083,24 +1150,50 @@ def rebuild_all_tracking():
         print(f"Error rebuilding tracking: {str(e)}")
         return error_response(str(e), "Error")
 
+@app.route('/api/doses/extend-horizon', methods=['POST'])
+def extend_all_dose_horizons():
+    """Top up the rolling dose window for every plan (admin / cron trigger)"""
+    try:
+        conn = get_db_connection()
+        if not conn:
+            return error_response("Database connection failed")
+
+        plans_extended, doses_created = extend_dose_horizon(conn)
+        close_db_connection(conn)
+
+        return success_response({
+            "plans_extended": plans_extended,
+            "doses_created": doses_created,
+            "message": f"Extended {plans_extended} plans with {doses_created} new doses"
+        })
+
+    except Exception as e:
+        print(f"Error extending dose horizon: {str(e)}")
+        return error_response(str(e), "Error")
+
 @app.route('/api/prescriptions/user/<int:user_id>', methods=['GET'])
 def get_user_prescriptions(user_id):
-    """Get all prescriptions for a user"""
+    """Get a user's prescriptions, newest first (?limit=, ?cursor= from next_cursor).
+    total is counted on the first page only (null on cursor pages)."""
     try:
+        after, limit = page_params(request.args)
         conn = get_db_connection()
         if not conn:
             return error_response("Database connection failed")
 
         cursor = conn.cursor()
-        cursor.execute("""
+        rows, next_cursor = fetch_page(cursor, PRESCRIPTION_PAGES, """
             SELECT id, medication_id, medicine_name, dosage, dosage_unit, frequency, duration,
                    start_date, end_date, route, instructions, special_instructions, 
                    prescribed_by, prescription_image_url, is_confirmed, created_at
             FROM prescriptions 
-            WHERE user_id = %s 
-            ORDER BY created_at DESC
-        """, (user_id,))
-        rows = cursor.fetchall()
+            WHERE user_id = %s AND {keyset}
+        """, (user_id,), key=lambda r: (r[0],), after=after, limit=limit)
+        total = None
+        if after is None:
+            # Deep pages stay one index range scan: no count on "Show more"
+            cursor.execute("SELECT COUNT(*) FROM prescriptions WHERE user_id = %s", (user_id,))
+            total = cursor.fetchone()[0]
         cursor.close()
         close_db_connection(conn)
 
@@ -1127,9 +1220,13 @@ def get_user_prescriptions(user_id):
 
         return success_response({
             "prescriptions": prescriptions,
-            "total": len(prescriptions)
+            "count": len(prescriptions),
+            "total": total,
+            **page_info(next_cursor, limit)
         })
 
+    except InvalidPageRequest as e:
+        return error_response(str(e), "Validation Error", 400)
     except Exception as e:
         print(f"Error fetching prescriptions: {str(e)}")
         return error_response(f"Error fetching prescriptions: {str(e)}", "Database Error")
@@ -1211,28 +1308,17 @@ def check_drug_contraindications():
         if not conn:
             return error_response("Database connection failed")
         
-        # Get user's medical info
-        query = "SELECT * FROM user_medical_info WHERE user_id = %s"
+        # Get user's medical info (with its precomputed allergy / condition terms)
         cursor = conn.cursor()
-        cursor.execute(query, (user_id,))
-        med_info_result = cursor.fetchone()
+        user_medical_info = load_medical_info(cursor, user_id) if user_id else {}
+        # Interactions between this medicine and everything the user already takes
+        interactions = check_new_medicine_interactions(cursor, user_id, medicine_name) if user_id else []
         cursor.close()
         close_db_connection(conn)
         
-        # Create medical info dict
-        user_medical_info = {}
-        if med_info_result:
-            user_medical_info = {
-                "drug_allergies": med_info_result[2],
-                "food_allergies": med_info_result[3],
-                "existing_conditions": med_info_result[4],
-                "current_medications": med_info_result[5],
-                "is_pregnant": med_info_result[6],
-                "is_breastfeeding": med_info_result[7],
-            }
-        
         # Check contraindications
         warnings = check_contraindications(medicine_name, user_medical_info)
+        warnings += interactions
         
         return success_response({
             "medicine_name": medicine_name,
@@ -1244,6 +1330,69 @@ def check_drug_contraindications():
     except Exception as e:
         return error_response(str(e), "Error checking contraindications")
 
+@app.route('/api/interactions/<int:user_id>', methods=['GET'])
+def get_user_interactions(user_id):
+    """Check all of a user's active prescriptions and listed current medications
+    against each other for drug interactions"""
+    try:
+        conn = get_db_connection()
+        if not conn:
+            return error_response("Database connection failed")
+
+        cursor = conn.cursor()
+        medications, interactions = check_user_interactions(cursor, user_id)
+        cursor.close()
+        close_db_connection(conn)
+
+        return success_response({
+            "medications": medications,
+            "interactions": interactions,
+            "has_interactions": len(interactions) > 0,
+            "requires_confirmation": any(w["risk"] in ["HIGH", "MEDIUM"] for w in interactions)
+        })
+
+    except Exception as e:
+        print(f"Error checking interactions: {str(e)}")
+        return error_response(str(e), "Error checking interactions")
+
+@app.route('/api/interactions/rescan', methods=['POST'])
+def rescan_all_interactions():
+    """Re-run the interaction check for every patient (admin / after a KB update)"""
+    try:
+        conn = get_db_connection()
+        if not conn:
+            return error_response("Database connection failed")
+
+        totals = scan_all_patients(conn)
+        close_db_connection(conn)
+
+        return success_response(dict(totals, message=(
+            f"Checked {totals['patients']} patients, found {totals['interactions']} interactions, "
+            f"removed {totals['stale_rows_removed']} stale warnings")))
+
+    except Exception as e:
+        print(f"Error rescanning interactions: {str(e)}")
+        return error_response(str(e), "Error")
+
+@app.route('/api/contraindications/scan', methods=['POST'])
+def scan_all_contraindications():
+    """Check prescriptions / medical info changed since the last scan and update
+    contraindication_checks. Body {"full": true} re-checks everything (after a KB update)."""
+    try:
+        data = request.get_json(silent=True) or {}
+        # In-process: a process pool here would re-import app.py in every worker.
+        # Large rescans belong in `python contraindication_scanner.py --full`.
+        totals = run_contraindication_scan(full=bool(data.get("full")), workers=1)
+        if totals is None:
+            return error_response("Database connection failed")
+
+        return success_response(dict(totals, message=(
+            f"Checked {totals['prescriptions']} prescriptions, {totals['warnings']} warnings")))
+
+    except Exception as e:
+        print(f"Error scanning contraindications: {str(e)}")
+        return error_response(str(e), "Error")
+
 # ===== STEP 7: PERSONALIZED ADHERENCE PLAN =====
 
 @app.route('/api/adherence-plans', methods=['POST'])
@@ -1303,25 +1452,8 @@ def create_adherence_plan():
         # Create dose tracking entries for the prescription period
         start_date = datetime.now().date()
         duration_days = duration if duration else 30
-        
-        for day in range(duration_days):
-            current_date = start_date + timedelta(days=day)
-            
-            for time_str in daily_schedule:
-                hour, minute = map(int, time_str.split(':'))
-                scheduled_time = datetime.combine(current_date, datetime.min.time().replace(hour=hour, minute=minute))
-                
-                cursor.execute(
-                    """
-                    INSERT INTO dose_tracking 
-                    (adherence_plan_id, prescription_id, user_id, scheduled_time)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id
-                    """,
-                    (plan_id, prescription_id, user_id, scheduled_time)
-                )
-                dt_id = cursor.fetchone()[0]
-                _create_reminder_for_dose(cursor, dt_id, user_id, scheduled_time, medicine_name)
+        materialize_plan_doses(cursor, plan_id, prescription_id, user_id, start_date,
+                               duration_days, daily_schedule, medicine_name)
         
         conn.commit()
         cursor.close()
@@ -1434,11 +1566,13 @@ def get_upcoming_reminders(user_id):
         SELECT dt.id AS dose_id, dt.scheduled_time, dt.status,
                pr.medicine_name, pr.dosage, pr.dosage_unit,
                r.id AS reminder_id, r.reminder_text, r.reminder_time,
-               r.is_sent, r.sent_at, r.reminder_method
+               r.is_sent, r.sent_at, r.reminder_method, r.delivery_status
         FROM dose_tracking dt
         JOIN prescriptions pr ON dt.prescription_id = pr.id
         LEFT JOIN reminders r ON r.dose_tracking_id = dt.id
-        WHERE dt.user_id = %s AND DATE(dt.scheduled_time) = CURRENT_DATE
+        WHERE dt.user_id = %s
+          AND dt.scheduled_time >= CURRENT_DATE
+          AND dt.scheduled_time < CURRENT_DATE + INTERVAL '1 day'
         ORDER BY dt.scheduled_time
         """
         
@@ -1461,7 +1595,9 @@ def get_upcoming_reminders(user_id):
                 "reminder_time": result[8].isoformat() if result[8] else None,
                 "is_sent": result[9] if result[9] is not None else False,
                 "sent_at": result[10].isoformat() if result[10] else None,
-                "reminder_method": result[11] or "app"
+                "reminder_method": result[11] or "app",
+                # is_sent only means the reminder left the queue; this says how
+                "delivery_status": result[12]
             })
         
         return success_response({
@@ -1476,26 +1612,24 @@ def get_upcoming_reminders(user_id):
 
 @app.route('/api/reminders/all/<int:user_id>', methods=['GET'])
 def get_all_reminders(user_id):
-    """Get all reminders for user — full history from the reminders table"""
+    """Get the user's reminder history, newest first (?limit=, ?cursor= from next_cursor)"""
     try:
+        after, limit = page_params(request.args)
         conn = get_db_connection()
         if not conn:
             return error_response("Database connection failed")
         
         cursor = conn.cursor()
-        cursor.execute("""
+        results, next_cursor = fetch_page(cursor, REMINDER_PAGES, """
             SELECT r.id, r.reminder_text, r.reminder_time, r.is_sent, r.sent_at,
-                   r.reminder_method, r.created_at,
+                   r.reminder_method, r.created_at, r.delivery_status,
                    dt.scheduled_time, dt.status AS dose_status,
                    pr.medicine_name, pr.dosage, pr.dosage_unit
             FROM reminders r
             JOIN dose_tracking dt ON r.dose_tracking_id = dt.id
             JOIN prescriptions pr ON dt.prescription_id = pr.id
-            WHERE r.user_id = %s
-            ORDER BY r.reminder_time DESC
-            LIMIT 100
-        """, (user_id,))
-        results = cursor.fetchall()
+            WHERE r.user_id = %s AND {keyset}
+        """, (user_id,), key=lambda row: (row[2], row[0]), after=after, limit=limit)
         cursor.close()
         close_db_connection(conn)
         
@@ -1509,22 +1643,58 @@ def get_all_reminders(user_id):
                 "sent_at": row[4].isoformat() if row[4] else None,
                 "reminder_method": row[5],
                 "created_at": row[6].isoformat() if row[6] else None,
-                "scheduled_time": row[7].isoformat() if row[7] else None,
-                "dose_status": row[8],
-                "medicine_name": row[9],
-                "dosage": f"{row[10]} {row[11]}"
+                "delivery_status": row[7],
+                "scheduled_time": row[8].isoformat() if row[8] else None,
+                "dose_status": row[9],
+                "medicine_name": row[10],
+                "dosage": f"{row[11]} {row[12]}"
             })
         
         return success_response({
             "user_id": user_id,
             "reminders": reminder_list,
-            "count": len(reminder_list)
+            "count": len(reminder_list),
+            **page_info(next_cursor, limit)
         })
     
+    except InvalidPageRequest as e:
+        return error_response(str(e), "Validation Error", 400)
     except Exception as e:
         return error_response(str(e), "Error retrieving all reminders")
 
 
+@app.route('/api/reminders/dispatch', methods=['POST'])
+def dispatch_due_reminders():
+    """Send every due reminder now (admin / cron trigger; the background dispatcher does this too)"""
+    try:
+        conn = get_db_connection()
+        if not conn:
+            return error_response("Database connection failed")
+
+        totals = dispatch_due(conn)
+        close_db_connection(conn)
+
+        return success_response({
+            "dispatched": totals,
+            "message": f"Dispatched {sum(totals.values())} reminders"
+        })
+
+    except Exception as e:
+        print(f"Error dispatching reminders: {str(e)}")
+        return error_response(str(e), "Error")
+
+
+@app.route('/api/stream/<int:user_id>', methods=['GET'])
+def stream_user_changes(user_id):
+    """Server-sent events with the user's dose, reminder and adherence-summary changes"""
+    hub = get_change_hub()
+    subscription = hub.subscribe(user_id)
+    if subscription is None:
+        return error_response("Too many open streams", "Stream Unavailable", 503)
+    return Response(stream_with_context(stream_events(hub, subscription)), mimetype='text/event-stream',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+
+
 @app.route('/api/reminders/<int:reminder_id>/mark-sent', methods=['POST'])
 def mark_reminder_sent(reminder_id):
     """Mark a reminder as sent"""
@@ -1536,9 +1706,9 @@ def mark_reminder_sent(reminder_id):
         cursor = conn.cursor()
         cursor.execute("""
             UPDATE reminders 
-            SET is_sent = TRUE, sent_at = CURRENT_TIMESTAMP
+            SET is_sent = TRUE, sent_at = CURRENT_TIMESTAMP, delivery_status = 'sent'
             WHERE id = %s
-            RETURNING id, is_sent, sent_at
+            RETURNING id, is_sent, sent_at, delivery_status
         """, (reminder_id,))
         result = cursor.fetchone()
         conn.commit()
@@ -1551,7 +1721,8 @@ def mark_reminder_sent(reminder_id):
         return success_response({
             "reminder_id": result[0],
             "is_sent": result[1],
-            "sent_at": result[2].isoformat()
+            "sent_at": result[2].isoformat(),
+            "delivery_status": result[3]
         }, "Reminder marked as sent")
     
     except Exception as e:
@@ -1630,6 +1801,53 @@ def populate_reminders_for_existing(user_id):
     except Exception as e:
         return error_response(str(e), "Error populating reminders")
 
+@app.route('/api/doses/history/<int:user_id>', methods=['GET'])
+def get_dose_history(user_id):
+    """Get the user's past doses, newest first (?status=, ?limit=, ?cursor= from next_cursor)"""
+    try:
+        after, limit = page_params(request.args)
+        status = request.args.get('status')
+        conn = get_db_connection()
+        if not conn:
+            return error_response("Database connection failed")
+
+        cursor = conn.cursor()
+        results, next_cursor = fetch_page(cursor, DOSE_PAGES, f"""
+            SELECT dt.id, dt.scheduled_time, dt.actual_time, dt.status, dt.notes,
+                   pr.id, pr.medicine_name, pr.dosage, pr.dosage_unit
+            FROM dose_tracking dt
+            JOIN prescriptions pr ON dt.prescription_id = pr.id
+            WHERE dt.user_id = %s AND dt.scheduled_time <= LOCALTIMESTAMP
+              {"AND dt.status = %s" if status else ""} AND {{keyset}}
+        """, (user_id, status) if status else (user_id,), key=lambda row: (row[1], row[0]),
+            after=after, limit=limit)
+        cursor.close()
+        close_db_connection(conn)
+
+        doses = [{
+            "dose_id": row[0],
+            "scheduled_time": row[1].isoformat(),
+            "actual_time": row[2].isoformat() if row[2] else None,
+            "status": row[3],
+            "notes": row[4],
+            "prescription_id": row[5],
+            "medicine_name": row[6],
+            "dosage": f"{row[7]} {row[8]}"
+        } for row in results]
+
+        return success_response({
+            "user_id": user_id,
+            "doses": doses,
+            "count": len(doses),
+            **page_info(next_cursor, limit)
+        })
+
+    except InvalidPageRequest as e:
+        return error_response(str(e), "Validation Error", 400)
+    except Exception as e:
+        return error_response(str(e), "Error retrieving dose history")
+
+
 @app.route('/api/doses/<int:dose_id>/mark-taken', methods=['POST'])
 def mark_dose_taken(dose_id):
     """Mark dose as taken"""
@@ -1742,18 +1960,16 @@ def get_adherence_summary(user_id):
         if not conn:
             return error_response("Database connection failed")
         
-        # Get today's summary
+        # Get today's summary (adherence_summary is kept current by dose_tracking triggers)
         query = """
-        SELECT SUM(CASE WHEN status = 'taken' THEN 1 ELSE 0 END) as doses_taken,
-               SUM(CASE WHEN status = 'missed' THEN 1 ELSE 0 END) as doses_missed,
-               COUNT(*) as total_doses
-        FROM dose_tracking 
-        WHERE user_id = %s AND DATE(scheduled_time) = CURRENT_DATE
+        SELECT doses_taken, doses_missed, total_doses
+        FROM adherence_summary
+        WHERE user_id = %s AND date = CURRENT_DATE
         """
         
         cursor = conn.cursor()
         cursor.execute(query, (user_id,))
-        result = cursor.fetchone()
+        result = cursor.fetchone() or (0, 0, 0)
         
         doses_taken = result[0] or 0
         doses_missed = result[1] or 0
@@ -1763,14 +1979,10 @@ def get_adherence_summary(user_id):
         
         # Get weekly summary
         week_query = """
-        SELECT DATE(scheduled_time),
-               SUM(CASE WHEN status = 'taken' THEN 1 ELSE 0 END) as taken,
-               SUM(CASE WHEN status = 'missed' THEN 1 ELSE 0 END) as missed,
-               COUNT(*) as total
-        FROM dose_tracking
-        WHERE user_id = %s AND scheduled_time >= NOW() - INTERVAL '7 days'
-        GROUP BY DATE(scheduled_time)
-        ORDER BY DATE(scheduled_time)
+        SELECT date, doses_taken, doses_missed, total_doses
+        FROM adherence_summary
+        WHERE user_id = %s AND date >= (NOW() - INTERVAL '7 days')::date AND total_doses > 0
+        ORDER BY date
         """
         
         cursor.execute(week_query, (user_id,))
@@ -1848,8 +2060,9 @@ By using this system, you acknowledge that you understand this disclaimer.
 
 @app.route('/api/reports/adherence/<int:user_id>', methods=['GET'])
 def export_adherence_report(user_id):
-    """Export adherence report for healthcare provider"""
+    """Export adherence report for healthcare provider (prescriptions paged by ?limit= / ?cursor=)"""
     try:
+        after, limit = page_params(request.args)
         conn = get_db_connection()
         if not conn:
             return error_response("Database connection failed")
@@ -1864,23 +2077,18 @@ def export_adherence_report(user_id):
             close_db_connection(conn)
             return error_response("User not found", "Not Found", 404)
         
-        # Get all prescriptions
-        cursor.execute(
-            "SELECT id, medicine_name, dosage, dosage_unit, frequency, is_confirmed FROM prescriptions WHERE user_id = %s ORDER BY created_at DESC",
-            (user_id,)
-        )
-        prescriptions = cursor.fetchall()
+        # First page of prescriptions; the rest via /api/prescriptions/user/<id>?cursor=
+        prescriptions, prescriptions_cursor = fetch_page(
+            cursor, PRESCRIPTION_PAGES,
+            "SELECT id, medicine_name, dosage, dosage_unit, frequency, is_confirmed FROM prescriptions WHERE user_id = %s AND {keyset}",
+            (user_id,), key=lambda p: (p[0],), after=after, limit=limit)
         
         # Get adherence summary for past 30 days
         cursor.execute("""
-            SELECT DATE(scheduled_time), 
-                   SUM(CASE WHEN status = 'taken' THEN 1 ELSE 0 END),
-                   SUM(CASE WHEN status = 'missed' THEN 1 ELSE 0 END),
-                   COUNT(*)
-            FROM dose_tracking
-            WHERE user_id = %s AND scheduled_time >= NOW() - INTERVAL '30 days'
-            GROUP BY DATE(scheduled_time)
-            ORDER BY DATE(scheduled_time)
+            SELECT date, doses_taken, doses_missed, total_doses
+            FROM adherence_summary
+            WHERE user_id = %s AND date >= (NOW() - INTERVAL '30 days')::date AND total_doses > 0
+            ORDER BY date
         """, (user_id,))
         daily_reports = cursor.fetchall()
         cursor.close()
@@ -1903,6 +2111,7 @@ def export_adherence_report(user_id):
                     "confirmed": p[5]
                 } for p in prescriptions
             ],
+            "prescriptions_next_cursor": prescriptions_cursor,
             "adherence_data_30_days": [
                 {
                     "date": str(d[0]),
@@ -1917,6 +2126,8 @@ def export_adherence_report(user_id):
         
         return success_response(report, "Adherence report generated")
     
+    except InvalidPageRequest as e:
+        return error_response(str(e), "Validation Error", 400)
     except Exception as e:
         return error_response(str(e), "Error generating report")
 
@@ -1943,13 +2154,11 @@ def export_report():
         
         # Get today's summary
         cursor.execute("""
-            SELECT SUM(CASE WHEN status = 'taken' THEN 1 ELSE 0 END) as taken,
-                   SUM(CASE WHEN status = 'missed' THEN 1 ELSE 0 END) as missed,
-                   COUNT(*) as total
-            FROM dose_tracking 
-            WHERE user_id = %s AND DATE(scheduled_time) = CURRENT_DATE
+            SELECT doses_taken, doses_missed, total_doses
+            FROM adherence_summary
+            WHERE user_id = %s AND date = CURRENT_DATE
         """, (user_id,))
-        today_result = cursor.fetchone()
+        today_result = cursor.fetchone() or (0, 0, 0)
         
         today_taken = today_result[0] or 0
         today_missed = today_result[1] or 0
@@ -1967,20 +2176,13 @@ def export_report():
         
         # Get weekly summary
         cursor.execute("""
-            SELECT DATE(scheduled_time),
-                   SUM(CASE WHEN status = 'taken' THEN 1 ELSE 0 END) as taken,
-                   SUM(CASE WHEN status = 'missed' THEN 1 ELSE 0 END) as missed,
-                   COUNT(*) as total
-            FROM dose_tracking
-            WHERE user_id = %s AND scheduled_time >= NOW() - INTERVAL '7 days'
-            GROUP BY DATE(scheduled_time)
-            ORDER BY DATE(scheduled_time)
+            SELECT date, doses_taken, doses_missed, total_doses
+            FROM adherence_summary
+            WHERE user_id = %s AND date >= (NOW() - INTERVAL '7 days')::date AND total_doses > 0
+            ORDER BY date
         """, (user_id,))
         weekly_results = cursor.fetchall()
         
-        cursor.close()
-        close_db_connection(conn)
-        
         # Build email content
         email_subject = f"Your Medication Adherence Report - {datetime.now().strftime('%B %d, %Y')}"
         
@@ -2061,27 +2263,36 @@ http://localhost:5000
 ─────────────────────────────────────────────────────────────
 """
         
-        # Send email
-        email_sent = send_email(email, email_subject, email_body)
-        
-        if email_sent:
-            print(f"✓ Report emailed to {email} for user {username} ({user_id})")
-            return success_response({
-                "message": f"Report successfully sent to {email}",
-                "user_id": user_id,
-                "email": email,
-                "generated_at": datetime.now().isoformat(),
-                "email_sent": True
-            }, "Report emailed successfully")
-        else:
-            print(f"⚠ Report generated but email could not be sent to {email}")
+        if not email_configured():
+            cursor.close()
+            close_db_connection(conn)
+            print("⚠ Email not configured. Set SMTP_EMAIL (and SMTP_PASSWORD if the server needs a login) in .env")
             return success_response({
                 "message": f"Report generated but could not be emailed to {email}. Check .env SMTP settings.",
                 "user_id": user_id,
                 "email": email,
                 "generated_at": datetime.now().isoformat(),
-                "email_sent": False
+                "email_sent": False,
+                "email_queued": False
             }, "Report generated (email not sent - check configuration)")
+        
+        # Queue the email; the background sender delivers it
+        email_id = enqueue_email(cursor, email, email_subject, email_body, user_id)
+        conn.commit()
+        cursor.close()
+        close_db_connection(conn)
+        wake_sender()
+        
+        print(f"✓ Report queued for {email} for user {username} ({user_id})")
+        return success_response({
+            "message": f"Report is being sent to {email}",
+            "user_id": user_id,
+            "email": email,
+            "generated_at": datetime.now().isoformat(),
+            "email_sent": False,
+            "email_queued": True,
+            "email_id": email_id
+        }, "Report queued for email")
     
     except Exception as e:
         print(f"✗ Error exporting report: {str(e)}")
@@ -2123,7 +2334,9 @@ def health_check():
                 "status": "healthy",
                 "database": "connected",
                 "has_database_url": has_url,
-                "tables_found": table_count
+                "tables_found": table_count,
+                "connection_pool": get_pool_stats(),
+                "change_stream": get_change_hub().stats()
             })
         else:
             return jsonify({
@@ -2143,21 +2356,20 @@ def health_check():
 
 # Auto-create database tables on startup (non-fatal — app starts even if DB isn't ready)
 def init_database():
-    """Create tables from schema.sql if they don't exist"""
+    """Bring the schema up to date (a single version check when it already is)"""
     try:
         conn = get_db_connection(retry=False)
         if conn:
-            schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql')
-            if os.path.exists(schema_path):
-                with open(schema_path, 'r') as f:
-                    cursor = conn.cursor()
-                    cursor.execute(f.read())
-                    conn.commit()
-                    cursor.close()
-                    print("✓ Database tables initialized")
-            close_db_connection(conn)
+            try:
+                state = ensure_schema(conn, auto_migrate=AUTO_MIGRATE)
+                if state["applied"]:
+                    print(f"✓ Database migrated to version {state['version']}")
+                else:
+                    print(f"✓ Database schema at version {state['version']}")
+            finally:
+                close_db_connection(conn)
         else:
-            print("⚠ Database not available at startup — tables will be created on first successful connection")
+            print("⚠ Database not available at startup — run python db_migrations.py once it is reachable")
     except Exception as e:
         print(f"⚠ Database init skipped (non-fatal): {e}")
 
@@ -2166,6 +2378,13 @@ try:
 except Exception as e:
     print(f"⚠ init_database error caught (non-fatal): {e}")
 
+# Keep each plan's rolling window of doses topped up in the background
+start_horizon_extender()
+# Deliver queued emails (report exports, email reminders) in the background
+start_email_sender()
+# Send due reminders through their app / email / SMS channel
+start_reminder_dispatcher()
+
 # Start the app
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Measure peak memory of getting an uploaded photo ready for OCR.
+"old" = read the whole upload into bytes, decode at full size, then resize.
+"new" = claim_upload() + open_for_ocr() (JPEG draft decode / reduce()), then resize.
+Each run is a fresh subprocess; peak RSS is reported above an import-only baseline.
+Run: python bench_ocr_memory.py
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from io import BytesIO
+
+from PIL import Image
+
+
+def _peak_mb():
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _prepare(mode, path):
+    from image_ingest import claim_upload, open_for_ocr
+    with open(path, 'rb') as upload:
+        if mode == 'old':
+            data = upload.read()
+            image = Image.open(BytesIO(data))
+            image.load()
+        elif mode == 'new':
+            # The open file stands in for the one Werkzeug spooled the upload into
+            stream, _ = claim_upload(upload)
+            image = open_for_ocr(stream)
+        else:
+            return
+    w, h = image.size
+    ratio = 1600 / max(w, h)
+    image.resize((int(w * ratio), int(h * ratio)), Image.LANCZOS).convert('RGB')
+
+
+def _make_samples(directory):
+    # A noisy photo (compresses like a real 12 MP phone JPEG) and a blocky
+    # screenshot-style PNG, both 4000x3000
+    photo = Image.effect_noise((1000, 750), 60).convert('RGB').resize((4000, 3000))
+    photo.save(os.path.join(directory, 'sample.jpg'), 'JPEG', quality=90)
+    screenshot = Image.effect_noise((400, 300), 60).convert('RGB').resize((4000, 3000), Image.NEAREST)
+    screenshot.save(os.path.join(directory, 'sample.png'), 'PNG')
+
+
+def _run(*args):
+    return subprocess.run([sys.executable, __file__, *args],
+                          capture_output=True, text=True, check=True).stdout
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        # Generated in a child process: ru_maxrss carries over from the parent on fork
+        _run('make', directory)
+        print(f"{'image':<20}{'size':>9}{'old MB':>9}{'new MB':>9}")
+        for label, name in (("4000x3000 JPEG", 'sample.jpg'), ("4000x3000 PNG", 'sample.png')):
+            path = os.path.join(directory, name)
+            peaks = {mode: float(_run(mode, path)) for mode in ('baseline', 'old', 'new')}
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            print(f"{label:<20}{size_mb:>7.1f}MB{peaks['old'] - peaks['baseline']:>9.1f}"
+                  f"{peaks['new'] - peaks['baseline']:>9.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == 'make':
+        _make_samples(sys.argv[2])
+    elif len(sys.argv) == 3:
+        _prepare(sys.argv[1], sys.argv[2])
+        print(_peak_mb())
+    else:
+        main()
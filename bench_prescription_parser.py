@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the OCR-text prescription parser.
+Times the details parse (dosage / frequency / duration / route for every
+medicine) and the whole text-to-medicines step over a corpus of sample OCR
+transcripts. Run: python bench_prescription_parser.py [rounds]
+"""
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+
+from ocr_processor import PrescriptionOCR
+from prescription_parser import parse_medicine_details
+
+SAMPLE_TRANSCRIPTS = [
+    """Dr. A. Sharma MBBS MD
+City Clinic, Pune
+Rx
+1. Tab Metformin 500mg BD after food x 30 days
+2. Tab Atorvastatin 20 mg at bedtime for 3 months
+3. Tab Amlodipine 5mg OD morning""",
+    """Patient: R Kumar Age 54
+Rx  Amoxicillin 500 mg capsule three times a day for 7 days
+    Paracetamol 650mg tab every 6 hours if fever (prn)
+    Pantoprazole 40 mg od before breakfast x 2 weeks""",
+    """PRESCRIPTION
+Lisinopril 10mg once daily
+Metoprolol 25 mg twice a day
+Aspirin 75 mg daily after lunch
+Review after 1 month""",
+    """Rx: Cap. Omeprazole 20mg 1x daily 14 days
+Syrup Cetirizine 5 ml at night for 5 days
+Salbutamol inhaler 2 puffs q.i.d. prn""",
+    """| Tab Levothyroxine 50 mcg | empty stomach | 1 time a day | 90 days |
+| Tab Glimepiride 2mg | morning and evening | 30 days |""",
+    """Azithromycin 500 mg oral once a day x 3 days
+Ibuprofen 400mg t.d.s. after food 5 days
+Ranitidine 150 mg b.d. for 10 days""",
+    """Dr Mehta Clinic  Date 12/03
+Tab Losartan 50mg OD
+Tab Hydrochlorothiazide 12.5 mg OD
+Tab Rosuvastatin 10 mg HS
+Continue for 6 months""",
+    """Rx
+Insulin glargine 10 unit injection at bedtime
+Metformin 1000mg twice daily with meals
+Vitamin D3 60000 IU weekly x 8 weeks""",
+    """Clopidogrel 75 mg 1 time daily
+Atorvastatin 40mg at bedtime
+Ramipril 2.5 mg two times a day
+Sorbitrate 5mg sublingual prn chest pain""",
+    """Tab Dolo 650 mg 3 times a day for 3 days
+Cap Doxycycline 100mg every 12 hours 7 days
+Betadine gargle 4 times daily""",
+    """Montelukast 10mg at bedtime 30 days
+Levocetirizine 5 mg once daily 10 days
+Fluticasone nasal spray 2 sprays od""",
+    """Prednisolone 20 mg od x 5 days then 10mg od x 5 days
+Calcium carbonate 500mg bid
+Warfarin 5 mg daily — INR after 1 week""",
+]
+
+
+def _timed(label, rounds, fn):
+    fn()  # warm-up
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    elapsed = time.perf_counter() - started
+    per_transcript = elapsed / (rounds * len(SAMPLE_TRANSCRIPTS)) * 1e6
+    print(f"{label:<34}{elapsed:>8.3f}s  {per_transcript:>8.1f} µs/transcript")
+
+
+def main(rounds=200):
+    ocr = PrescriptionOCR.__new__(PrescriptionOCR)
+    hits = [[name for name, _pos in ocr._find_all_medicine_names(text)] for text in SAMPLE_TRANSCRIPTS]
+    print(f"{len(SAMPLE_TRANSCRIPTS)} transcripts, {sum(map(len, hits))} medicines, {rounds} rounds")
+
+    def parse_details():
+        for text, names in zip(SAMPLE_TRANSCRIPTS, hits):
+            parse_medicine_details(text, names)
+
+    def text_to_medicines():
+        with redirect_stdout(io.StringIO()):  # skip the per-call [OCR] log lines
+            for text in SAMPLE_TRANSCRIPTS:
+                ocr._extract_all_medicines_from_text(text)
+
+    _timed("dosage/frequency/duration/route", rounds, parse_details)
+    _timed("text -> medicines (incl. names)", max(1, rounds // 20), text_to_medicines)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,349 @@
+"""
+Bulk Prescription Import
+OCRs a batch of prescription images (multipart files and/or a zip archive)
+through the shared OCR job queue (ocr_jobs) and saves what it finds in batched transactions: one
+multi-row INSERT for prescriptions, one for adherence plans and one
+materialize_doses() statement per batch, instead of several commits per
+medicine.
+
+run_bulk_import() is a generator of progress events (dicts) so the API can
+stream one JSON line per image while the import is still running.
+"""
+
+import os
+import queue
+import threading
+import time
+import zipfile
+from io import BytesIO
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+from werkzeug.datastructures import FileStorage
+
+from db_connection import pooled_connection
+from dose_scheduler import plan_schedule, materialize_doses
+from medication_kb import get_medication_info, get_adherence_nudge, format_daily_schedule
+from medical_info import load_medical_info, check_prescriptions
+from image_ingest import claim_upload, spool_upload, UploadTooLarge, MAX_IMAGE_BYTES
+from ocr_jobs import get_job_queue, QueueFull
+
+# Images one bulk import keeps in the shared OCR job queue at a time; the
+# queue's OCR_JOB_WORKERS bound how many are OCR'd at once across the process
+OCR_BULK_WORKERS = max(1, int(os.getenv('OCR_BULK_WORKERS', 2)))
+OCR_BULK_MAX_IMAGES = int(os.getenv('OCR_BULK_MAX_IMAGES', 500))
+# Medicines written per transaction
+OCR_BULK_SAVE_BATCH = max(1, int(os.getenv('OCR_BULK_SAVE_BATCH', 50)))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tif', '.tiff', '.heic')
+
+
+def _is_image_name(name):
+    base = os.path.basename(name)
+    return not base.startswith('.') and base.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def detach_uploads(file_storages):
+    """Take ownership of uploaded files' streams. Flask closes request.files when
+    the view returns, but a streamed response keeps reading them afterwards;
+    the originals are left holding empty buffers. Close the returned uploads
+    (close_uploads) when done."""
+    detached = []
+    for upload in file_storages:
+        detached.append(FileStorage(stream=upload.stream, filename=upload.filename,
+                                    name=upload.name, content_type=upload.content_type))
+        upload.stream = BytesIO()
+    return detached
+
+
+def close_uploads(file_storages):
+    for upload in file_storages:
+        try:
+            upload.close()
+        except Exception:
+            pass
+
+
+def iter_upload_images(files, archives):
+    """Yield (filename, image_file, error) for every uploaded image and every
+    image inside uploaded zip archives, one at a time. Each image_file is a
+    spooled temp file the consumer must close: an uploaded file's own stream,
+    or a zip member inflated into a new one."""
+    for upload in files:
+        try:
+            spool, size = claim_upload(upload.stream, MAX_IMAGE_BYTES)
+        except UploadTooLarge as e:
+            upload.close()
+            yield upload.filename, None, str(e)
+            continue
+        upload.stream = BytesIO()
+        if not size:
+            spool.close()
+            yield upload.filename, None, "Empty image file"
+        else:
+            yield upload.filename, spool, None
+
+    for archive in archives:
+        try:
+            with zipfile.ZipFile(archive.stream) as zf:
+                for info in zf.infolist():
+                    if info.is_dir() or '__MACOSX' in info.filename or not _is_image_name(info.filename):
+                        continue
+                    if info.file_size > MAX_IMAGE_BYTES:
+                        yield info.filename, None, "Image too large (max 10 MB)"
+                        continue
+                    # Don't trust the header size: the limit applies to what we actually inflate
+                    try:
+                        with zf.open(info) as member:
+                            spool, _ = spool_upload(member, MAX_IMAGE_BYTES)
+                    except UploadTooLarge as e:
+                        yield info.filename, None, str(e)
+                        continue
+                    yield info.filename, spool, None
+        except zipfile.BadZipFile:
+            yield archive.filename, None, "Not a valid zip archive"
+
+
+def _kb_instructions(med_info):
+    if not med_info:
+        return None, None
+    instructions = f"{med_info.get('how_to_take', '')}. {med_info.get('with_food', '')}. {med_info.get('duration_instruction', '')}".strip('. ')
+    special_instructions = f"Contraindications: {', '.join(med_info.get('contraindications', []))}. {med_info.get('risks_of_skipping', '')}".strip('. ')
+    return instructions, special_instructions
+
+
+def ensure_user(conn, user_id, username):
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO users (id, username, email, password_hash)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT DO NOTHING
+    """, (user_id, username, f"{username}@demo.local", "demo"))
+    conn.commit()
+    cursor.close()
+
+
+def save_prescription_batch(conn, user_id, medicines, profile=None):
+    """Insert prescriptions, adherence plans, their doses/reminders and any
+    contraindication warnings for a batch of OCR'd medicines in ONE transaction.
+    profile: the user's medical info (medical_info.load_medical_info), read if None.
+    Sets prescription_id / saved / warnings on each dict. Returns the number of doses created."""
+    medicines = [rx for rx in medicines if rx.get("medicine_name")]
+    if not medicines:
+        return 0
+
+    start_date = datetime.now().date()
+    stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    rows = []
+    details = []
+    for rx in medicines:
+        duration_val = int(rx.get("duration") or 30)
+        med_info = get_medication_info(rx.get("medicine_name", ""))
+        instructions, special_instructions = _kb_instructions(med_info)
+        rx["instructions"] = instructions or rx.get("instructions")
+        rx["special_instructions"] = special_instructions or rx.get("special_instructions")
+        frequency = rx.get("frequency") or "Once daily"
+        details.append((duration_val, med_info, frequency))
+        rows.append((
+            user_id, None, rx.get("medicine_name"), rx.get("dosage") or "", rx.get("dosage_unit", "mg"),
+            frequency, duration_val, start_date, start_date + timedelta(days=duration_val),
+            rx.get("route", "oral"), rx["instructions"], rx["special_instructions"],
+            f"ocr_bulk_{user_id}_{stamp}_{rx.get('source_file', '')}"[:500],
+            rx.get("ocr_confidence", 0.5), False
+        ))
+
+    cursor = conn.cursor()
+    try:
+        prescription_ids = [row[0] for row in execute_values(cursor, """
+            INSERT INTO prescriptions
+            (user_id, medication_id, medicine_name, dosage, dosage_unit, frequency, duration,
+             start_date, end_date, route, instructions, special_instructions,
+             prescription_image_url, ocr_confidence, is_confirmed)
+            VALUES %s
+            RETURNING id
+        """, rows, page_size=len(rows), fetch=True)]
+
+        plan_rows = []
+        schedules_in = []
+        for rx, prescription_id, (duration_val, med_info, frequency) in zip(medicines, prescription_ids, details):
+            daily_schedule = format_daily_schedule("1", frequency)
+            nudges = get_adherence_nudge(rx.get("medicine_name", ""), frequency)
+            why_important = med_info.get("why_important") if med_info else "Follow your medication schedule."
+            nudge_reason = nudges[0].get("message") if nudges else "Taking medication as prescribed is important."
+            plan_rows.append((prescription_id, user_id, daily_schedule, why_important, nudge_reason))
+            schedules_in.append((prescription_id, duration_val, daily_schedule,
+                                 rx.get("medicine_name"), f"{rx.get('dosage') or ''} {rx.get('dosage_unit', 'mg')}".strip()))
+
+        plan_ids = [row[0] for row in execute_values(cursor, """
+            INSERT INTO adherence_plans (prescription_id, user_id, daily_schedule, why_important, nudge_reason)
+            VALUES %s
+            RETURNING id
+        """, plan_rows, template="(%s, %s, %s::text[], %s, %s)", page_size=len(plan_rows), fetch=True)]
+
+        dose_ids = materialize_doses(cursor, [
+            plan_schedule(plan_id, prescription_id, user_id, start_date, duration_val,
+                          daily_schedule, medicine_name, dosage)
+            for plan_id, (prescription_id, duration_val, daily_schedule, medicine_name, dosage)
+            in zip(plan_ids, schedules_in)
+        ])
+        found = check_prescriptions(cursor, user_id,
+                                    [(prescription_id, rx.get("medicine_name"))
+                                     for rx, prescription_id in zip(medicines, prescription_ids)], profile)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    for rx, prescription_id in zip(medicines, prescription_ids):
+        rx["prescription_id"] = prescription_id
+        rx["saved"] = True
+        rx["warnings"] = found.get(prescription_id, [])
+    return len(dose_ids)
+
+
+def _ocr_and_close(ocr, image_file, key, completed, cancelled):
+    """OCR job body: hands (key, medicines, error) to the import via completed"""
+    try:
+        if cancelled.is_set():
+            return None
+        completed.put((key, ocr.extract_from_image(image_file), None))
+    except Exception as e:
+        completed.put((key, None, str(e)))
+    finally:
+        image_file.close()
+    return None
+
+
+def run_bulk_import(ocr, images, user_id, username, save_to_db=True, jobs=None):
+    """OCR every (filename, image_file, error) from images and optionally save
+    the medicines. Yields progress events; the last one has event == "done".
+    Images go through jobs (the process's OCRJobQueue by default); when it is
+    full the import waits for room instead of failing."""
+    jobs = jobs or get_job_queue()
+    totals = {"images": 0, "images_failed": 0, "medicines": 0, "saved": 0, "doses": 0, "warnings": 0}
+    pending_save = []
+    profile = None
+
+    def flush():
+        if not pending_save:
+            return None
+        batch = list(pending_save)
+        pending_save.clear()
+        try:
+            # A connection only for the write: none is held while images are OCR'd
+            with pooled_connection() as conn:
+                doses = save_prescription_batch(conn, user_id, batch, profile)
+        except Exception as e:
+            print(f"[BULK] Batch save failed: {e}")
+            for rx in batch:
+                rx["saved"] = False
+            return {"event": "save_error", "error": str(e),
+                    "files": sorted({rx.get("source_file") for rx in batch})}
+        saved = sum(1 for rx in batch if rx.get("saved"))
+        warnings = [dict(warning, prescription_id=rx["prescription_id"], medicine_name=rx.get("medicine_name"))
+                    for rx in batch if rx.get("saved") for warning in rx.get("warnings", [])]
+        totals["saved"] += saved
+        totals["doses"] += doses
+        totals["warnings"] += len(warnings)
+        return {"event": "saved", "prescriptions": saved, "doses": doses,
+                "prescription_ids": [rx["prescription_id"] for rx in batch if rx.get("saved")],
+                "warnings": warnings}
+
+    def image_event(index, filename, medicines=None, error=None):
+        totals["images"] += 1
+        if error:
+            totals["images_failed"] += 1
+            return {"event": "image", "index": index, "filename": filename, "status": "error", "error": error}
+        return {"event": "image", "index": index, "filename": filename, "status": "ok",
+                "count": len(medicines), "medicines": medicines}
+
+    if save_to_db:
+        try:
+            with pooled_connection() as conn:
+                ensure_user(conn, user_id, username)
+                # Medical info is read once; every batch is checked against it
+                cursor = conn.cursor()
+                profile = load_medical_info(cursor, user_id)
+                cursor.close()
+        except Exception as e:
+            yield {"event": "error", "error": str(e)}
+            return
+
+    completed = queue.Queue()
+    cancelled = threading.Event()
+    in_flight = set()
+    waiting = None    # an image the job queue had no room for yet
+    source = enumerate(images)
+    exhausted = False
+    try:
+        while True:
+            # Read more images only as our jobs finish, so at most a few are in memory
+            while len(in_flight) < OCR_BULK_WORKERS:
+                if waiting is None:
+                    if exhausted:
+                        break
+                    item = next(source, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    index, (filename, data, error) = item
+                    if index >= OCR_BULK_MAX_IMAGES:
+                        if data is not None:
+                            data.close()
+                        exhausted = True
+                        yield {"event": "limit", "error": f"Only the first {OCR_BULK_MAX_IMAGES} images are imported"}
+                        break
+                    if error:
+                        yield image_event(index, filename, error=error)
+                        continue
+                    waiting = (index, filename, data)
+                index, filename, data = waiting
+                try:
+                    jobs.submit(_ocr_and_close, ocr, data, (index, filename), completed, cancelled)
+                except QueueFull as full:
+                    if not in_flight:
+                        # Nothing of ours to wait on: back off as a client would
+                        time.sleep(min(full.retry_after, 5))
+                        continue
+                    break
+                in_flight.add((index, filename))
+                waiting = None
+            if not in_flight:
+                break
+
+            key, medicines, error = completed.get()
+            in_flight.discard(key)
+            index, filename = key
+            if error:
+                yield image_event(index, filename, error=error)
+                continue
+            if isinstance(medicines, dict):
+                medicines = [medicines]
+            if not medicines or medicines[0].get("error"):
+                error = (medicines[0].get("error") if medicines else None) or "No medicines found"
+                yield image_event(index, filename, error=error)
+                continue
+            for rx in medicines:
+                rx["user_id"] = int(user_id)
+                rx["username"] = username
+                rx["source_file"] = filename
+            totals["medicines"] += len(medicines)
+            yield image_event(index, filename, medicines)
+            if save_to_db:
+                pending_save.extend(medicines)
+                if len(pending_save) >= OCR_BULK_SAVE_BATCH:
+                    event = flush()
+                    if event:
+                        yield event
+        if save_to_db:
+            event = flush()
+            if event:
+                yield event
+        yield dict(event="done", **totals)
+    finally:
+        # Jobs still queued for an abandoned import skip the OCR
+        cancelled.set()
+        if waiting is not None:
+            waiting[2].close()
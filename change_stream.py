@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Change Stream
+Pushes dose, reminder and adherence-summary changes to open dashboards as
+server-sent events, so they no longer re-fetch /reminders/upcoming and
+/adherence-summary to stay current.
+
+Triggers (migrations/0007_change_notifications.sql) NOTIFY the
+'medication_changes' channel with the changed rows when a transaction commits.
+Each app process keeps one LISTEN connection, opened with the first
+subscriber, and fans the notifications out to that user's streams:
+
+    event: dose     / reminder / summary   -> the notification payload
+    event: resync   -> changes may have been missed; reload everything
+
+Streams send a comment every STREAM_HEARTBEAT_SECONDS (which is also how a
+closed client is noticed) and end after STREAM_MAX_SECONDS; EventSource
+reconnects on its own. Each open stream holds a server thread, so at most
+STREAM_MAX_CLIENTS run per process — beyond that subscribe() returns None and
+the client keeps loading on demand.
+
+Watch the raw events with: python change_stream.py <user_id>
+"""
+
+import json
+import os
+import queue
+import select
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from db_connection import open_dedicated_connection
+
+load_dotenv()
+
+CHANGE_CHANNEL = "medication_changes"
+
+STREAM_HEARTBEAT_SECONDS = float(os.getenv('STREAM_HEARTBEAT_SECONDS', 15))
+STREAM_MAX_SECONDS = float(os.getenv('STREAM_MAX_SECONDS', 1800))
+STREAM_MAX_CLIENTS = int(os.getenv('STREAM_MAX_CLIENTS', 4))
+# Events buffered per stream; a stream that falls further behind gets a resync
+STREAM_QUEUE_SIZE = max(1, int(os.getenv('STREAM_QUEUE_SIZE', 100)))
+# Client reconnect delay sent in the stream's retry: field
+STREAM_RETRY_MS = int(os.getenv('STREAM_RETRY_MS', 5000))
+
+RESYNC = {"type": "resync"}
+
+
+class Subscription:
+    """One open stream's event queue"""
+
+    def __init__(self, user_id, maxsize=STREAM_QUEUE_SIZE):
+        self.user_id = user_id
+        self._events = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+
+    def put(self, event):
+        with self._lock:
+            try:
+                self._events.put_nowait(event)
+            except queue.Full:
+                # Too far behind for deltas: replace the backlog with one resync
+                while not self._events.empty():
+                    self._events.get_nowait()
+                self._events.put_nowait(RESYNC)
+
+    def get(self, timeout):
+        """Next event, or None after timeout seconds"""
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ChangeHub:
+    """Routes NOTIFY payloads from one LISTEN connection to per-user subscriptions"""
+
+    def __init__(self, max_clients=STREAM_MAX_CLIENTS, channel=CHANGE_CHANNEL):
+        self.max_clients = max_clients
+        self.channel = channel
+        self._subscribers = {}    # user_id -> set of Subscription
+        self._count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ready = threading.Event()
+
+    def subscribe(self, user_id):
+        """A Subscription for the user's changes, or None when at max_clients"""
+        with self._lock:
+            if self._count >= self.max_clients:
+                return None
+            subscription = Subscription(user_id)
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            self._count += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen_loop, name="change-listener", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def wait_ready(self, timeout=None):
+        """Block until the listener is connected; False on timeout"""
+        return self._ready.wait(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {"streams": self._count, "users": len(self._subscribers),
+                    "max_clients": self.max_clients, "listening": self._ready.is_set()}
+
+    def publish(self, payload):
+        """Deliver one notification payload (JSON text) to its user's streams"""
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            print(f"⚠ Ignoring malformed change notification: {payload[:200]}")
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.get(event.get("user_id"), ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def _broadcast(self, event):
+        with self._lock:
+            subscribers = [s for group in self._subscribers.values() for s in group]
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def _listen_loop(self):
+        delay = 1
+        reconnecting = False
+        while True:
+            conn = None
+            try:
+                conn = open_dedicated_connection(retry=False)
+                if conn is None:
+                    raise ConnectionError("database unavailable")
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {self.channel}")
+                cursor.close()
+                self._ready.set()
+                delay = 1
+                if reconnecting:
+                    # Notifications sent while we were disconnected are lost
+                    self._broadcast(RESYNC)
+                    print("✓ Change stream listener reconnected")
+                while True:
+                    if select.select([conn], [], [], STREAM_HEARTBEAT_SECONDS) != ([], [], []):
+                        conn.poll()
+                        while conn.notifies:
+                            self.publish(conn.notifies.pop(0).payload)
+                    else:
+                        # Idle: make sure the session is still there
+                        cursor = conn.cursor()
+                        cursor.execute("SELECT 1")
+                        cursor.close()
+            except Exception as e:
+                print(f"⚠ Change stream listener error: {e}")
+            finally:
+                self._ready.clear()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            reconnecting = True
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+
+def format_event(event):
+    """One server-sent event for a change (or resync) dict"""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def stream_events(hub, subscription, heartbeat=None, max_seconds=None):
+    """Generator of server-sent event text for an open subscription.
+    Unsubscribes when the client goes away or max_seconds have passed."""
+    heartbeat = STREAM_HEARTBEAT_SECONDS if heartbeat is None else heartbeat
+    max_seconds = STREAM_MAX_SECONDS if max_seconds is None else max_seconds
+    deadline = time.monotonic() + max_seconds
+    try:
+        # Changes committed before LISTEN took effect are not streamed; clients
+        # reload on every ready after the first
+        listening = hub.wait_ready(min(heartbeat, 5))
+        ready = {"user_id": subscription.user_id, "listening": listening}
+        yield f"retry: {STREAM_RETRY_MS}\nevent: ready\ndata: {json.dumps(ready)}\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            event = subscription.get(min(heartbeat, remaining))
+            yield ": keepalive\n\n" if event is None else format_event(event)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_change_hub():
+    """This process's ChangeHub"""
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = ChangeHub()
+        return _hub
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python change_stream.py <user_id>")
+        sys.exit(1)
+    hub = get_change_hub()
+    subscription = hub.subscribe(int(sys.argv[1]))
+    try:
+        for chunk in stream_events(hub, subscription, max_seconds=float('inf')):
+            print(chunk, end="", flush=True)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Batch Contraindication Scanner
+Checks every active prescription against its patient's medical info with
+check_contraindications() and keeps contraindication_checks in step:
+
+- (prescription, medical info) rows stream from a server-side cursor, so the
+  scan never holds the whole population in memory;
+- chunks are evaluated on a process pool (the KB is loaded once per worker);
+- each chunk is written in one transaction: warnings are upserted on
+  (prescription_id, rule_key) and rules that no longer apply are deleted.
+  Rows without a rule_key (interaction_engine.py's, older or sample rows) are
+  left alone.
+- after the chunks, unacknowledged keyed warnings of prescriptions that have
+  ended (and so are no longer scanned) are deleted.
+
+Runs are incremental: scan_state keeps a watermark, and only prescriptions or
+medical info updated since the last run are re-checked. Use --full after the
+KB changes.
+
+    python contraindication_scanner.py          # incremental
+    python contraindication_scanner.py --full   # every active prescription
+"""
+
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from medication_kb import medical_profile, check_contraindications
+from medical_info import warning_rows, store_warning_rows
+
+# Prescriptions per evaluation chunk (and per write transaction)
+CONTRAINDICATION_SCAN_CHUNK = max(1, int(os.getenv('CONTRAINDICATION_SCAN_CHUNK', 1000)))
+# Worker processes; 0 or 1 evaluates in the calling process
+CONTRAINDICATION_SCAN_WORKERS = int(os.getenv('CONTRAINDICATION_SCAN_WORKERS', min(4, os.cpu_count() or 1)))
+# The next run re-checks rows updated this long before the watermark, to cover
+# transactions that were still open when the previous scan took its snapshot
+CONTRAINDICATION_SCAN_OVERLAP_SECONDS = int(os.getenv('CONTRAINDICATION_SCAN_OVERLAP_SECONDS', 300))
+
+SCANNER_NAME = "contraindications"
+
+SCAN_COLUMNS = """
+    p.id, p.user_id, p.medicine_name,
+    m.drug_allergies, m.existing_conditions, m.is_pregnant, m.is_breastfeeding,
+    m.drug_allergy_terms, m.condition_terms
+"""
+ACTIVE_PRESCRIPTION = "(p.end_date IS NULL OR p.end_date >= CURRENT_DATE)"
+
+
+def evaluate_chunk(rows):
+    """Run check_contraindications over scanned rows (worker-side).
+    Returns (prescription_ids, contraindication_checks rows)."""
+    profiles = {}
+    prescription_ids = []
+    results = []
+    for (prescription_id, user_id, medicine_name, drug_allergies, existing_conditions,
+         is_pregnant, is_breastfeeding, allergy_terms, condition_terms) in rows:
+        prescription_ids.append(prescription_id)
+        profile = profiles.get(user_id)
+        if profile is None:
+            profile = profiles[user_id] = medical_profile({
+                "drug_allergies": drug_allergies, "existing_conditions": existing_conditions,
+                "is_pregnant": is_pregnant, "is_breastfeeding": is_breastfeeding,
+                "drug_allergy_terms": allergy_terms, "condition_terms": condition_terms,
+            })
+        warnings = check_contraindications(medicine_name or "", profile)
+        results += warning_rows(prescription_id, user_id, medicine_name, warnings)
+    return prescription_ids, results
+
+
+def _write_chunk(conn, prescription_ids, results):
+    """Upsert a chunk's warnings and drop the keyed rules that no longer fire"""
+    cursor = conn.cursor()
+    try:
+        store_warning_rows(cursor, results)
+        cursor.execute("""
+            DELETE FROM contraindication_checks c
+            WHERE c.prescription_id = ANY(%s) AND c.rule_key IS NOT NULL
+              AND (c.prescription_id, c.rule_key) NOT IN (
+                  SELECT * FROM unnest(%s::int[], %s::text[]))
+        """, (prescription_ids, [row[0] for row in results], [row[7] for row in results]))
+        deleted = cursor.rowcount
+        conn.commit()
+        return deleted
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def _scan_query(since):
+    if since is None:
+        return f"""
+            SELECT {SCAN_COLUMNS}
+            FROM prescriptions p LEFT JOIN user_medical_info m ON m.user_id = p.user_id
+            WHERE {ACTIVE_PRESCRIPTION}
+            ORDER BY p.user_id, p.id
+        """, ()
+    return f"""
+        SELECT {SCAN_COLUMNS}
+        FROM prescriptions p LEFT JOIN user_medical_info m ON m.user_id = p.user_id
+        WHERE {ACTIVE_PRESCRIPTION} AND p.id IN (
+            SELECT id FROM prescriptions WHERE updated_at > %s
+            UNION
+            SELECT p2.id FROM user_medical_info m2 JOIN prescriptions p2 ON p2.user_id = m2.user_id
+            WHERE m2.updated_at > %s)
+        ORDER BY p.user_id, p.id
+    """, (since, since)
+
+
+def get_watermark(cursor):
+    cursor.execute("SELECT watermark FROM scan_state WHERE scanner = %s", (SCANNER_NAME,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _chunks(cursor, size):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def scan_contraindications(read_conn, write_conn, full=False, chunk_size=CONTRAINDICATION_SCAN_CHUNK,
+                           workers=CONTRAINDICATION_SCAN_WORKERS):
+    """Scan prescriptions changed since the last run (all active ones if full)
+    and update contraindication_checks. read_conn streams the rows; write_conn
+    commits one transaction per chunk. Returns totals."""
+    totals = {"full": full, "prescriptions": 0, "warnings": 0, "rows_deleted": 0, "ended_rows_deleted": 0}
+    setup = read_conn.cursor()
+    since = None if full else get_watermark(setup)
+    totals["full"] = since is None
+    # The snapshot time becomes the next watermark (minus the overlap)
+    setup.execute("SELECT LOCALTIMESTAMP - make_interval(secs => %s)", (CONTRAINDICATION_SCAN_OVERLAP_SECONDS,))
+    next_watermark = setup.fetchone()[0]
+    setup.close()
+
+    def record(prescription_ids, results):
+        totals["rows_deleted"] += _write_chunk(write_conn, prescription_ids, results)
+        totals["prescriptions"] += len(prescription_ids)
+        totals["warnings"] += len(results)
+
+    query, params = _scan_query(since)
+    cursor = read_conn.cursor(name="contraindication_scan")
+    cursor.itersize = chunk_size
+    executor = None
+    try:
+        cursor.execute(query, params)
+        if workers <= 1:
+            for rows in _chunks(cursor, chunk_size):
+                record(*evaluate_chunk(rows))
+        else:
+            # spawn: workers must not inherit the pool's sockets or the KB file handle
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            in_flight = set()
+            for rows in _chunks(cursor, chunk_size):
+                in_flight.add(executor.submit(evaluate_chunk, rows))
+                if len(in_flight) >= workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record(*future.result())
+            for future in in_flight:
+                record(*future.result())
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        cursor.close()
+        read_conn.rollback()
+
+    cursor = write_conn.cursor()
+    cursor.execute(f"""
+        DELETE FROM contraindication_checks c
+        WHERE c.rule_key IS NOT NULL AND NOT c.is_acknowledged
+          AND NOT EXISTS (SELECT 1 FROM prescriptions p WHERE p.id = c.prescription_id AND {ACTIVE_PRESCRIPTION})
+    """)
+    totals["ended_rows_deleted"] = cursor.rowcount
+    cursor.execute("""
+        INSERT INTO scan_state (scanner, watermark, last_run_at, rows_scanned)
+        VALUES (%s, %s, CURRENT_TIMESTAMP, %s)
+        ON CONFLICT (scanner) DO UPDATE
+        SET watermark = EXCLUDED.watermark, last_run_at = EXCLUDED.last_run_at,
+            rows_scanned = EXCLUDED.rows_scanned
+    """, (SCANNER_NAME, next_watermark, totals["prescriptions"]))
+    write_conn.commit()
+    cursor.close()
+    return totals
+
+
+def run_scan(full=False, workers=CONTRAINDICATION_SCAN_WORKERS):
+    """scan_contraindications() on two pooled connections. Returns totals or None.
+    Inside the web app pass workers=1: spawned pool workers re-import the
+    __main__ module, which there is app.py with its startup work."""
+    from db_connection import get_db_connection, close_db_connection
+    read_conn = get_db_connection()
+    write_conn = get_db_connection() if read_conn else None
+    if not write_conn:
+        close_db_connection(read_conn)
+        return None
+    try:
+        return scan_contraindications(read_conn, write_conn, full=full, workers=workers)
+    finally:
+        close_db_connection(read_conn)
+        close_db_connection(write_conn)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    totals = run_scan(full="--full" in argv)
+    if totals is None:
+        print("✗ Database connection failed")
+        return 1
+    print(f"✓ {'Full' if totals['full'] else 'Incremental'} scan: {totals['prescriptions']} prescriptions, "
+          f"{totals['warnings']} warnings, {totals['rows_deleted']} resolved rows removed, "
+          f"{totals['ended_rows_deleted']} rows of ended prescriptions removed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
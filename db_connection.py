@@ -3,6 +3,10 @@ from psycopg2 import sql, OperationalError
 import os
 from dotenv import load_dotenv
 import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+import psycopg2.extensions
 
 # Load environment variables from .env file
 load_dotenv()
@@ -34,9 +38,17 @@ CONNECTION_TIMEOUT = 10
 RETRY_ATTEMPTS = 3
 RETRY_DELAY = 2
 
-def get_db_connection(retry=True):
+# Connection pool settings (per process — each gunicorn worker has its own pool)
+DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'true').lower() == 'true'
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 5))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))                       # max seconds to wait for a free connection
+DB_POOL_HEALTHCHECK_SECONDS = float(os.getenv('DB_POOL_HEALTHCHECK_SECONDS', 30))  # ping connections idle longer than this
+DB_POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300))            # close idle connections above DB_POOL_MIN
+
+def _open_connection(retry=True):
     """
-    Create and return a PostgreSQL database connection with retry logic.
+    Open a brand-new PostgreSQL connection with retry logic.
     Supports DATABASE_URL (cloud deploy) or individual DB_HOST/DB_PORT/etc (local).
     """
     attempt = 0
@@ -84,17 +96,309 @@ def get_db_connection(retry=True):
     print(error_msg)
     return None
 
+
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections for one process.
+
+    Connections are handed out LIFO so the warmest socket is reused, checked
+    for liveness when they have been idle for a while, and rolled back before
+    they go back into the pool. Callers block (up to `timeout` seconds) when
+    all `maxconn` connections are in use.
+    """
+
+    def __init__(self, minconn=1, maxconn=5, timeout=10, healthcheck_after=30, idle_timeout=300):
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.timeout = timeout
+        self.healthcheck_after = healthcheck_after
+        self.idle_timeout = idle_timeout
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = deque()      # (connection, returned_at) — right end is most recent
+        self._in_use = {}         # id(connection) -> connection
+        self._live = 0            # idle + in use + connections being opened
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._healthcheck_failures = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def getconn(self, retry=True):
+        """Check out a healthy connection, or None if none could be obtained in time"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        while True:
+            conn = None
+            open_new = False
+            with self._cond:
+                self._trim_idle()
+                while not self._idle and self._live >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        print(f"✗ Connection pool exhausted ({self.maxconn} in use) after waiting {self.timeout}s")
+                        return None
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    # Reserve the slot now, connect outside the lock
+                    self._live += 1
+                    open_new = True
+
+            if open_new:
+                conn = _open_connection(retry=retry)
+                if conn is None:
+                    with self._cond:
+                        self._live -= 1
+                        self._cond.notify()
+                    return None
+            elif not self._is_healthy(conn, returned_at):
+                self._discard(conn)
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._in_use[id(conn)] = conn
+                self._checkouts += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            _track_checkout(conn)
+            return conn
+
+    def putconn(self, conn):
+        """Return a connection to the pool; broken or foreign connections are dropped"""
+        with self._cond:
+            if self._in_use.pop(id(conn), None) is None:
+                return False
+        _track_return(conn)
+
+        if conn.closed:
+            self._discard(conn)
+            return True
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return True
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        return True
+
+    def owns(self, conn):
+        with self._cond:
+            return id(conn) in self._in_use
+
+    def closeall(self):
+        """Close every idle connection (checked-out ones are closed on return)"""
+        with self._cond:
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+            self._live -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            _quiet_close(conn)
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            in_use = len(self._in_use)
+            return {
+                "pid": self.pid,
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "live": self._live,
+                "idle": idle,
+                "in_use": in_use,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "healthcheck_failures": self._healthcheck_failures,
+                "wait_total_ms": round(self._wait_total * 1000, 2),
+                "wait_avg_ms": round(self._wait_total * 1000 / self._checkouts, 2) if self._checkouts else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 2),
+            }
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.healthcheck_after:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error as error:
+            print(f"⚠ Pooled connection failed health check, replacing it: {error}")
+            with self._cond:
+                self._healthcheck_failures += 1
+            return False
+
+    def _discard(self, conn):
+        _quiet_close(conn)
+        with self._cond:
+            self._live -= 1
+            self._cond.notify()
+
+    def _trim_idle(self):
+        """Close connections idle longer than idle_timeout, keeping at least minconn alive (lock held)"""
+        now = time.monotonic()
+        while self._idle and self._live > self.minconn and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._live -= 1
+            _quiet_close(conn)
+
+
+def _quiet_close(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+# Per-thread record of connections handed out, so a request that forgets to
+# call close_db_connection (e.g. on an exception path) can be cleaned up.
+_thread_state = threading.local()
+
+
+def _track_checkout(conn):
+    checked_out = getattr(_thread_state, 'checked_out', None)
+    if checked_out is None:
+        checked_out = _thread_state.checked_out = []
+    checked_out.append(conn)
+
+
+def _track_return(conn):
+    checked_out = getattr(_thread_state, 'checked_out', None)
+    if checked_out:
+        try:
+            checked_out.remove(conn)
+        except ValueError:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Connections inherited from a parent process (gunicorn forks workers). They
+# must not be closed or garbage-collected in the child, or the parent's
+# session would be torn down underneath it.
+_abandoned_connections = []
+
+
+def get_pool():
+    """Return this process's connection pool, creating it on first use (and after fork)"""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid != os.getpid():
+            _abandoned_connections.extend(c for c, _ in _pool._idle)
+            _abandoned_connections.extend(_pool._in_use.values())
+            _pool = None
+        if _pool is None:
+            _pool = ConnectionPool(
+                minconn=DB_POOL_MIN,
+                maxconn=DB_POOL_MAX,
+                timeout=DB_POOL_TIMEOUT,
+                healthcheck_after=DB_POOL_HEALTHCHECK_SECONDS,
+                idle_timeout=DB_POOL_IDLE_TIMEOUT,
+            )
+        return _pool
+
+
+def get_db_connection(retry=True):
+    """
+    Return a PostgreSQL database connection.
+    Connections come from the per-process pool (see DB_POOL_* settings) and must
+    be handed back with close_db_connection(). Set DB_POOL_ENABLED=false to open
+    a dedicated connection per call instead.
+    """
+    if not DB_POOL_ENABLED:
+        return _open_connection(retry=retry)
+    return get_pool().getconn(retry=retry)
+
+def open_dedicated_connection(retry=True):
+    """
+    Open an autocommit connection outside the pool, for sessions that hold a
+    connection for the life of the process (e.g. LISTEN). Close it yourself.
+    """
+    connection = _open_connection(retry=retry)
+    if connection is not None:
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    return connection
+
 def close_db_connection(connection):
     """
-    Safely close the database connection
+    Return a pooled connection to the pool, or close an unpooled one
     """
     if connection:
         try:
+            if DB_POOL_ENABLED and _pool is not None and _pool.pid == os.getpid() and _pool.putconn(connection):
+                return
             connection.close()
             print("✓ Database connection closed")
         except Exception as e:
             print(f"Warning: Error closing database connection: {e}")
 
+def release_thread_connections():
+    """
+    Return any connections this thread still holds to the pool.
+    Registered as a Flask teardown hook so leaked connections are recovered
+    at the end of every request.
+    """
+    checked_out = getattr(_thread_state, 'checked_out', None)
+    if not checked_out:
+        return 0
+    leaked = list(checked_out)
+    for conn in leaked:
+        close_db_connection(conn)
+    if leaked:
+        print(f"⚠ Returned {len(leaked)} leaked database connection(s) to the pool")
+    return len(leaked)
+
+@contextmanager
+def pooled_connection(retry=True):
+    """
+    Context manager that checks out a connection and always returns it.
+    Commits when the block succeeds and rolls back when it raises:
+
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            ...
+    """
+    conn = get_db_connection(retry=retry)
+    if conn is None:
+        raise OperationalError("Database connection failed")
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        close_db_connection(conn)
+
+def get_pool_stats():
+    """Pool metrics for this process: checkouts, wait time, live/idle/in-use counts"""
+    if not DB_POOL_ENABLED:
+        return {"enabled": False}
+    stats = get_pool().stats()
+    stats["enabled"] = True
+    return stats
+
 def execute_query(connection, query, params=None):
     """
     Execute a SELECT query and return results
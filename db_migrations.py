@@ -0,0 +1,161 @@
+"""
+Versioned Schema Migrations
+Applies schema.sql (version 1) and the numbered files in migrations/ in order,
+recording each in the schema_migrations table. Only one process migrates at a
+time (pg_advisory_lock); everyone else waits and then sees the new version.
+
+App startup calls ensure_schema(), which is a single SELECT when the database
+is already current.
+
+Usage:
+    python db_migrations.py            # apply pending migrations
+    python db_migrations.py status     # show applied / pending versions
+"""
+
+import hashlib
+import os
+import re
+import sys
+
+import psycopg2
+
+from db_connection import get_db_connection, close_db_connection
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_PATH = os.path.join(BASE_DIR, 'schema.sql')
+MIGRATIONS_DIR = os.path.join(BASE_DIR, 'migrations')
+
+# Arbitrary app-wide key for pg_advisory_lock ("MEDADHR" in ASCII)
+MIGRATION_LOCK_KEY = 0x4D4544414448
+
+MIGRATION_FILE_RE = re.compile(r'^(\d+)_([\w-]+)\.sql$')
+
+
+def discover_migrations():
+    """Return [(version, name, path)] sorted by version.
+    Version 1 is the baseline schema.sql; later changes live in migrations/NNNN_name.sql."""
+    migrations = [(1, 'baseline', SCHEMA_PATH)]
+    if os.path.isdir(MIGRATIONS_DIR):
+        for filename in os.listdir(MIGRATIONS_DIR):
+            match = MIGRATION_FILE_RE.match(filename)
+            if match:
+                migrations.append((int(match.group(1)), match.group(2),
+                                   os.path.join(MIGRATIONS_DIR, filename)))
+    migrations.sort()
+    versions = [m[0] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {MIGRATIONS_DIR}")
+    return migrations
+
+
+def latest_version():
+    return discover_migrations()[-1][0]
+
+
+def current_version(conn):
+    """Highest applied version, or 0 if the database has never been migrated"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        version = cursor.fetchone()[0]
+        conn.rollback()
+        return version
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        return 0
+    finally:
+        cursor.close()
+
+
+def _read_sql(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def migrate(conn, target=None):
+    """Apply every pending migration up to target (default: latest).
+    Each migration runs in its own transaction. Returns the versions applied."""
+    migrations = discover_migrations()
+    target = target or migrations[-1][0]
+    applied = []
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    conn.commit()
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                checksum VARCHAR(64),
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+
+        # Re-read under the lock: another process may have migrated while we waited
+        version = current_version(conn)
+        for mig_version, name, path in migrations:
+            if mig_version <= version or mig_version > target:
+                continue
+            sql_text = _read_sql(path)
+            checksum = hashlib.sha256(sql_text.encode('utf-8')).hexdigest()
+            print(f"→ Applying migration {mig_version:04d} {name}...")
+            try:
+                cursor.execute(sql_text)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                    (mig_version, name, checksum)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"✗ Migration {mig_version:04d} {name} failed; database left at version {version}")
+                raise
+            version = mig_version
+            applied.append(mig_version)
+            print(f"✓ Migration {mig_version:04d} {name} applied")
+    finally:
+        try:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+            conn.commit()
+        except psycopg2.Error:
+            conn.rollback()
+        cursor.close()
+    return applied
+
+
+def ensure_schema(conn, auto_migrate=True):
+    """Cheap startup check: one SELECT when up to date, otherwise migrate
+    (or just report, when auto_migrate is False)."""
+    latest = latest_version()
+    version = current_version(conn)
+    if version >= latest:
+        return {"version": version, "latest": latest, "applied": []}
+    if not auto_migrate:
+        print(f"⚠ Database schema is at version {version}, latest is {latest}. Run: python db_migrations.py")
+        return {"version": version, "latest": latest, "applied": []}
+    applied = migrate(conn)
+    return {"version": current_version(conn), "latest": latest, "applied": applied}
+
+
+def print_status(conn):
+    version = current_version(conn)
+    print(f"Database schema version: {version}")
+    for mig_version, name, _ in discover_migrations():
+        state = "applied" if mig_version <= version else "pending"
+        print(f"  {mig_version:04d} {name:40} {state}")
+
+
+if __name__ == "__main__":
+    conn = get_db_connection()
+    if not conn:
+        sys.exit(1)
+    try:
+        if len(sys.argv) > 1 and sys.argv[1] == 'status':
+            print_status(conn)
+        else:
+            applied = migrate(conn)
+            print(f"✓ Database at version {current_version(conn)} ({len(applied)} migration(s) applied)")
+    finally:
+        close_db_connection(conn)
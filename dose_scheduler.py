@@ -0,0 +1,241 @@
+"""
+Dose Schedule Materialization
+Generates dose_tracking rows (and their reminders) for adherence plans in a
+single set-based statement, so creating a prescription costs the same number
+of database round trips whatever its duration or frequency.
+
+Doses are written for a rolling window: only the next DOSE_HORIZON_DAYS days
+of a course are materialized up front, and extend_dose_horizon() tops each
+plan up as the window moves forward (adherence_plans.doses_generated_through
+records how far a plan has been written; schedule_end_date is the last day of
+the course). Set DOSE_HORIZON_DAYS=0 to write the whole course at once.
+"""
+
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from db_connection import get_db_connection, close_db_connection
+
+# Reminders fire this long before the scheduled dose (matches _create_reminder_for_dose)
+REMINDER_LEAD_MINUTES = 15
+
+# Days of doses kept materialized ahead of today (0 = whole course up front)
+DOSE_HORIZON_DAYS = int(os.getenv('DOSE_HORIZON_DAYS', 7))
+# How often the background extender tops plans up, in seconds (0 = disabled)
+DOSE_EXTENDER_INTERVAL = int(os.getenv('DOSE_EXTENDER_INTERVAL', 3600))
+# Plans extended per transaction by the extender
+DOSE_EXTENDER_BATCH = int(os.getenv('DOSE_EXTENDER_BATCH', 500))
+
+MATERIALIZE_SQL = """
+WITH plan AS (
+    SELECT *
+    FROM unnest(%s::int[], %s::int[], %s::int[], %s::date[], %s::date[], %s::date[], %s::text[], %s::text[], %s::text[])
+         AS p(plan_id, prescription_id, user_id, first_day, last_day, course_end, times, medicine_name, dosage)
+),
+window_marks AS (
+    UPDATE adherence_plans ap
+    SET doses_generated_through = p.last_day,
+        schedule_end_date = p.course_end
+    FROM plan p
+    WHERE ap.id = p.plan_id
+),
+slots AS (
+    SELECT p.plan_id, p.prescription_id, p.user_id, d::date + t::time AS scheduled_time
+    FROM plan p
+    CROSS JOIN LATERAL generate_series(p.first_day, p.last_day, INTERVAL '1 day') AS d
+    CROSS JOIN LATERAL unnest(string_to_array(p.times, ',')) AS t
+),
+doses AS (
+    INSERT INTO dose_tracking (adherence_plan_id, prescription_id, user_id, scheduled_time)
+    SELECT plan_id, prescription_id, user_id, scheduled_time
+    FROM slots
+    ORDER BY plan_id, scheduled_time
+    RETURNING id, adherence_plan_id, user_id, scheduled_time
+),
+new_reminders AS (
+    INSERT INTO reminders (dose_tracking_id, user_id, reminder_text, reminder_time, is_sent, reminder_method)
+    SELECT d.id, d.user_id,
+           'Time to take ' || p.medicine_name
+               || CASE WHEN p.dosage <> '' THEN ' (' || p.dosage || ')' ELSE '' END,
+           d.scheduled_time - make_interval(mins => %s), FALSE, 'app'
+    FROM doses d
+    JOIN plan p ON p.plan_id = d.adherence_plan_id
+)
+SELECT id FROM doses ORDER BY adherence_plan_id, scheduled_time
+"""
+
+
+def _as_date(value):
+    """Accept a date, datetime or 'YYYY-MM-DD' string (as sent by the frontend)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str) and value:
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+    return datetime.now().date()
+
+
+def plan_schedule(plan_id, prescription_id, user_id, start_date, duration_days, daily_schedule,
+                  medicine_name, dosage=""):
+    """Describe the doses to create for a new adherence plan: every time in
+    daily_schedule on each day of the course, clipped to the rolling horizon."""
+    first_day = _as_date(start_date)
+    course_end = first_day + timedelta(days=int(duration_days or 0) - 1)
+    last_day = course_end
+    if DOSE_HORIZON_DAYS > 0:
+        last_day = min(course_end, datetime.now().date() + timedelta(days=DOSE_HORIZON_DAYS))
+    # Never let the mark fall before the course starts, or the extender would backfill it
+    last_day = max(last_day, first_day - timedelta(days=1))
+    return {
+        "plan_id": plan_id,
+        "prescription_id": prescription_id,
+        "user_id": user_id,
+        "first_day": first_day,
+        "last_day": last_day,
+        "course_end": course_end,
+        "daily_schedule": list(daily_schedule or []),
+        "medicine_name": medicine_name or "Medication",
+        "dosage": dosage or "",
+    }
+
+
+def materialize_doses(cursor, schedules):
+    """Insert dose_tracking + reminder rows for every schedule in one statement.
+    Also records each plan's window (doses_generated_through / schedule_end_date).
+    Returns the new dose_tracking ids (grouped by plan, in time order).
+    The caller owns the transaction."""
+    schedules = list(schedules)
+    if not schedules:
+        return []
+
+    cursor.execute(MATERIALIZE_SQL, (
+        [s["plan_id"] for s in schedules],
+        [s["prescription_id"] for s in schedules],
+        [s["user_id"] for s in schedules],
+        [s["first_day"] for s in schedules],
+        [s["last_day"] for s in schedules],
+        [s["course_end"] for s in schedules],
+        [",".join(s["daily_schedule"]) for s in schedules],
+        [s["medicine_name"] for s in schedules],
+        [s["dosage"] for s in schedules],
+        REMINDER_LEAD_MINUTES,
+    ))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def materialize_plan_doses(cursor, plan_id, prescription_id, user_id, start_date, duration_days,
+                           daily_schedule, medicine_name, dosage=""):
+    """Convenience wrapper for a single adherence plan. Returns the new dose ids."""
+    return materialize_doses(cursor, [plan_schedule(
+        plan_id, prescription_id, user_id, start_date, duration_days,
+        daily_schedule, medicine_name, dosage
+    )])
+
+
+EXTEND_CANDIDATES_SQL = """
+SELECT ap.id, ap.prescription_id, ap.user_id,
+       ap.doses_generated_through + 1,
+       LEAST(ap.schedule_end_date, CURRENT_DATE + %s),
+       ap.schedule_end_date, ap.daily_schedule,
+       p.medicine_name, p.dosage, p.dosage_unit
+FROM adherence_plans ap
+JOIN prescriptions p ON p.id = ap.prescription_id
+WHERE ap.doses_generated_through IS NOT NULL
+  AND ap.doses_generated_through < LEAST(ap.schedule_end_date, CURRENT_DATE + %s)
+  AND (%s::int IS NULL OR ap.user_id = %s::int)
+ORDER BY ap.id
+LIMIT %s
+FOR UPDATE OF ap SKIP LOCKED
+"""
+
+
+def extend_dose_horizon(conn, user_id=None, horizon_days=None, batch_size=None):
+    """Top up every plan (or one user's plans) whose materialized window ends
+    before today + horizon. Plans are claimed with SKIP LOCKED, so several
+    workers can run this at once without writing the same doses twice.
+    Returns (plans_extended, doses_created)."""
+    horizon_days = DOSE_HORIZON_DAYS if horizon_days is None else horizon_days
+    batch_size = batch_size or DOSE_EXTENDER_BATCH
+    if horizon_days <= 0:
+        return 0, 0
+
+    plans_extended = 0
+    doses_created = 0
+    cursor = conn.cursor()
+    try:
+        while True:
+            cursor.execute(EXTEND_CANDIDATES_SQL, (horizon_days, horizon_days, user_id, user_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                conn.commit()
+                break
+            schedules = []
+            for (plan_id, presc_id, plan_user_id, first_day, last_day, course_end, daily_schedule,
+                 medicine_name, dosage, dosage_unit) in rows:
+                schedules.append({
+                    "plan_id": plan_id,
+                    "prescription_id": presc_id,
+                    "user_id": plan_user_id,
+                    "first_day": first_day,
+                    "last_day": last_day,
+                    "course_end": course_end,
+                    "daily_schedule": list(daily_schedule or []),
+                    "medicine_name": medicine_name or "Medication",
+                    "dosage": f"{dosage or ''} {dosage_unit or ''}".strip(),
+                })
+            doses_created += len(materialize_doses(cursor, schedules))
+            plans_extended += len(schedules)
+            conn.commit()
+            if len(rows) < batch_size:
+                break
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return plans_extended, doses_created
+
+
+_extender_thread = None
+
+
+def _extender_loop(interval):
+    while True:
+        conn = None
+        try:
+            conn = get_db_connection(retry=False)
+            if conn:
+                plans, doses = extend_dose_horizon(conn)
+                if plans:
+                    print(f"✓ Dose horizon extended for {plans} plan(s), {doses} new dose(s)")
+        except Exception as e:
+            print(f"⚠ Dose horizon extender error: {e}")
+        finally:
+            close_db_connection(conn)
+        time.sleep(interval)
+
+
+def start_horizon_extender(interval=None):
+    """Start the background thread that keeps every plan's window topped up"""
+    global _extender_thread
+    interval = DOSE_EXTENDER_INTERVAL if interval is None else interval
+    if interval <= 0 or DOSE_HORIZON_DAYS <= 0:
+        return None
+    if _extender_thread is not None and _extender_thread.is_alive():
+        return _extender_thread
+    _extender_thread = threading.Thread(target=_extender_loop, args=(interval,),
+                                        name="dose-horizon-extender", daemon=True)
+    _extender_thread.start()
+    return _extender_thread
+
+
+if __name__ == "__main__":
+    # Run one extension pass (e.g. from cron)
+    conn = get_db_connection()
+    if conn:
+        plans, doses = extend_dose_horizon(conn)
+        print(f"Extended {plans} plan(s), created {doses} dose(s)")
+        close_db_connection(conn)
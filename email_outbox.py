@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Email Outbox
+Emails are written to the email_outbox table (enqueue_email) in the caller's
+transaction and delivered by a background sender, so API requests never wait
+on the mail server.
+
+The sender claims due messages in batches with FOR UPDATE SKIP LOCKED (safe
+with several app processes), delivers them over one SMTP session that is kept
+open between batches, and reschedules failures with exponential backoff.
+Permanent rejections (5xx) and messages past EMAIL_MAX_ATTEMPTS are marked
+'failed'.
+
+For local testing point SMTP_SERVER/SMTP_PORT at a debugging server, e.g.
+    python -m aiosmtpd -n -l localhost:1025      # SMTP_USE_TLS=false
+and run one delivery pass with: python email_outbox.py
+"""
+
+import os
+import smtplib
+import sys
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+from db_connection import get_db_connection, close_db_connection
+
+load_dotenv()
+
+SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
+SMTP_EMAIL = os.getenv('SMTP_EMAIL', None)
+SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', None)
+SMTP_USE_TLS = os.getenv('SMTP_USE_TLS', 'true').lower() == 'true'
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', 30))
+# Close the reused SMTP session after this long without sending
+SMTP_IDLE_SECONDS = float(os.getenv('SMTP_IDLE_SECONDS', 60))
+
+# Background sender: poll interval (0 disables it), messages per claimed batch
+EMAIL_OUTBOX_INTERVAL = float(os.getenv('EMAIL_OUTBOX_INTERVAL', 5))
+EMAIL_OUTBOX_BATCH = max(1, int(os.getenv('EMAIL_OUTBOX_BATCH', 20)))
+# Retries: delay doubles from EMAIL_RETRY_BASE_SECONDS up to EMAIL_RETRY_MAX_SECONDS
+EMAIL_MAX_ATTEMPTS = max(1, int(os.getenv('EMAIL_MAX_ATTEMPTS', 6)))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv('EMAIL_RETRY_BASE_SECONDS', 30))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv('EMAIL_RETRY_MAX_SECONDS', 3600))
+
+
+def email_configured():
+    """A sender address is required; SMTP_PASSWORD only when the server wants a login"""
+    return bool(SMTP_EMAIL)
+
+
+def enqueue_email(cursor, recipient_email, subject, body, user_id=None):
+    """Queue an email for the background sender. Returns the outbox id.
+    The caller commits, then calls wake_sender() to skip the poll wait."""
+    cursor.execute("""
+        INSERT INTO email_outbox (user_id, recipient, subject, body)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+    """, (user_id, recipient_email, subject, body))
+    return cursor.fetchone()[0]
+
+
+def build_message(recipient_email, subject, body):
+    msg = MIMEMultipart()
+    msg['From'] = SMTP_EMAIL
+    msg['To'] = recipient_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+class SMTPSession:
+    """One SMTP connection reused across messages and batches; reconnects
+    (once per message) when the server has dropped it"""
+
+    def __init__(self, server=None, port=None, use_tls=None):
+        self.server = server or SMTP_SERVER
+        self.port = port or SMTP_PORT
+        self.use_tls = SMTP_USE_TLS if use_tls is None else use_tls
+        self._smtp = None
+        self.last_used = 0.0
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.server, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if SMTP_EMAIL and SMTP_PASSWORD:
+                smtp.login(SMTP_EMAIL, SMTP_PASSWORD)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+
+    def send(self, msg):
+        for attempt in (1, 2):
+            if self._smtp is None:
+                self._connect()
+            try:
+                self._smtp.send_message(msg)
+                self.last_used = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def close_if_idle(self, idle_seconds=SMTP_IDLE_SECONDS):
+        if self._smtp is not None and time.monotonic() - self.last_used >= idle_seconds:
+            self.close()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+            self._smtp = None
+
+
+# Errors about one message; anything else (connect, login, dropped session) is the server's
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def _retry_row(outbox_id, attempts, error, permanent=False):
+    """(id, attempts, status, delay seconds, error) for the outcome UPDATE"""
+    give_up = permanent or attempts >= EMAIL_MAX_ATTEMPTS
+    delay = min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return (outbox_id, attempts, 'failed' if give_up else 'pending', delay, str(error)[:1000])
+
+
+def deliver_batch(conn, session, batch_size=EMAIL_OUTBOX_BATCH):
+    """Claim up to batch_size due messages, send them and record the outcome.
+    Returns (sent, failed) counts; (0, 0) when nothing was due."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT id, recipient, subject, body, attempts
+            FROM email_outbox
+            WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY next_attempt_at, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (batch_size,))
+        messages = cursor.fetchall()
+
+        sent, retries = [], []
+        for index, (outbox_id, recipient, subject, body, attempts) in enumerate(messages):
+            try:
+                session.send(build_message(recipient, subject, body))
+                sent.append(outbox_id)
+            except MESSAGE_ERRORS as e:
+                permanent = isinstance(e, smtplib.SMTPRecipientsRefused) or e.smtp_code >= 500
+                retries.append(_retry_row(outbox_id, attempts + 1, e, permanent))
+            except (smtplib.SMTPException, OSError) as e:
+                # Server unreachable or refusing us: back off the rest of the batch too
+                session.close()
+                retries += [_retry_row(row[0], row[4] + 1, e) for row in messages[index:]]
+                break
+
+        if sent:
+            cursor.execute("""
+                UPDATE email_outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP,
+                       attempts = attempts + 1, last_error = NULL
+                WHERE id = ANY(%s)
+            """, (sent,))
+        if retries:
+            execute_values(cursor, """
+                UPDATE email_outbox AS o
+                SET attempts = v.attempts, status = v.status, last_error = v.error,
+                    next_attempt_at = CURRENT_TIMESTAMP + make_interval(secs => v.delay)
+                FROM (VALUES %s) AS v(id, attempts, status, delay, error)
+                WHERE o.id = v.id
+            """, retries, template="(%s::bigint, %s::int, %s, %s::float8, %s)")
+        conn.commit()
+        failed = sum(1 for row in retries if row[2] == 'failed')
+        return len(sent), failed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def drain_outbox(conn, session, batch_size=EMAIL_OUTBOX_BATCH):
+    """Deliver batches until nothing is due or delivery stops making progress.
+    Returns total (sent, failed)."""
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = deliver_batch(conn, session, batch_size)
+        total_sent += sent
+        total_failed += failed
+        if not sent:
+            return total_sent, total_failed
+
+
+_sender_thread = None
+_wake = threading.Event()
+
+
+def wake_sender():
+    _wake.set()
+
+
+def _sender_loop(interval):
+    session = SMTPSession()
+    while True:
+        _wake.wait(interval)
+        _wake.clear()
+        conn = None
+        try:
+            conn = get_db_connection(retry=False)
+            if conn:
+                sent, failed = drain_outbox(conn, session)
+                if sent or failed:
+                    print(f"✓ Email outbox: {sent} sent, {failed} failed")
+        except Exception as e:
+            print(f"⚠ Email outbox sender error: {e}")
+        finally:
+            close_db_connection(conn)
+        session.close_if_idle()
+
+
+def start_email_sender(interval=None):
+    """Start the background thread that delivers queued emails"""
+    global _sender_thread
+    interval = EMAIL_OUTBOX_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    if _sender_thread is not None and _sender_thread.is_alive():
+        return _sender_thread
+    _sender_thread = threading.Thread(target=_sender_loop, args=(interval,),
+                                      name="email-outbox-sender", daemon=True)
+    _sender_thread.start()
+    return _sender_thread
+
+
+if __name__ == "__main__":
+    # Deliver everything that is due once (e.g. from cron, or with EMAIL_OUTBOX_INTERVAL=0)
+    conn = get_db_connection()
+    if not conn:
+        print("✗ Database connection failed")
+        sys.exit(1)
+    session = SMTPSession()
+    try:
+        sent, failed = drain_outbox(conn, session)
+        print(f"Sent {sent} email(s), {failed} failed")
+    finally:
+        session.close()
+        close_db_connection(conn)
@@ -0,0 +1,195 @@
+"""
+Rate-Limit-Aware Gemini Client
+Wraps a google-genai client (or anything with .models.generate_content) so
+every request in the process shares one view of each model's capacity:
+
+- a token bucket per model, refilled at that model's requests-per-minute limit
+- a cooldown per model after a 429 / RESOURCE_EXHAUSTED (the server's
+  retryDelay when it sends one, otherwise GEMINI_COOLDOWN_SECONDS)
+
+generate_content() goes straight to the first model in preference order that
+has capacity instead of trying exhausted models one by one. If none do, it waits
+up to GEMINI_MAX_WAIT_SECONDS for one to free up, then raises GeminiRateLimited.
+
+Set GEMINI_BASE_URL to point the SDK at another endpoint (e.g. a local stub).
+"""
+
+import os
+import re
+import threading
+import time
+
+GEMINI_MODELS = [m.strip() for m in os.getenv(
+    'GEMINI_MODELS', 'gemini-2.5-flash,gemini-2.0-flash,gemini-2.0-flash-lite').split(',') if m.strip()]
+# Requests per minute per model: "model:rpm,model:rpm"; models not listed use GEMINI_DEFAULT_RPM
+GEMINI_DEFAULT_RPM = float(os.getenv('GEMINI_DEFAULT_RPM', 10))
+GEMINI_MODEL_RPM = os.getenv('GEMINI_MODEL_RPM', 'gemini-2.5-flash:10,gemini-2.0-flash:15,gemini-2.0-flash-lite:30')
+GEMINI_COOLDOWN_SECONDS = float(os.getenv('GEMINI_COOLDOWN_SECONDS', 60))
+GEMINI_MAX_WAIT_SECONDS = float(os.getenv('GEMINI_MAX_WAIT_SECONDS', 10))
+GEMINI_BASE_URL = os.getenv('GEMINI_BASE_URL', '')
+
+RETRY_DELAY_RE = re.compile(r"retry(?:Delay['\"]?\s*[:=]\s*['\"]?| in )(\d+(?:\.\d+)?)s", re.IGNORECASE)
+
+
+class GeminiRateLimited(Exception):
+    """Every model is out of capacity for longer than the caller is willing to wait"""
+
+    def __init__(self, retry_after, last_error=None):
+        super().__init__(
+            f"All Gemini models are rate-limited. Please wait about {int(retry_after) + 1}s and try again."
+        )
+        self.retry_after = retry_after
+        self.last_error = last_error
+
+
+def _parse_model_rpm(spec):
+    limits = {}
+    for item in spec.split(','):
+        if ':' in item:
+            name, rpm = item.rsplit(':', 1)
+            try:
+                limits[name.strip()] = float(rpm)
+            except ValueError:
+                continue
+    return limits
+
+
+def is_rate_limit_error(error):
+    text = str(error)
+    return '429' in text or 'RESOURCE_EXHAUSTED' in text
+
+
+def retry_delay_seconds(error, default=GEMINI_COOLDOWN_SECONDS):
+    """The server's suggested retry delay from a 429 error, else default"""
+    match = RETRY_DELAY_RE.search(str(error))
+    return float(match.group(1)) if match else default
+
+
+class TokenBucket:
+    """Classic token bucket: capacity tokens, refilled continuously at rate_per_minute"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 6)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, now):
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now):
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def drain(self):
+        self.tokens = 0
+
+
+class ModelScheduler:
+    """Capacity bookkeeping for a set of models; thread-safe"""
+
+    def __init__(self, models=None, model_rpm=None, default_rpm=GEMINI_DEFAULT_RPM):
+        self.models = list(models or GEMINI_MODELS)
+        limits = _parse_model_rpm(GEMINI_MODEL_RPM) if model_rpm is None else model_rpm
+        self._lock = threading.Lock()
+        self._buckets = {m: TokenBucket(limits.get(m, default_rpm)) for m in self.models}
+        self._cooldown_until = {m: 0.0 for m in self.models}
+
+    def acquire(self):
+        """Reserve a request on the first model with capacity.
+        Returns (model, 0) or (None, seconds until the soonest model frees up)."""
+        with self._lock:
+            now = time.monotonic()
+            soonest = float('inf')
+            for model in self.models:
+                cooldown = self._cooldown_until[model] - now
+                if cooldown > 0:
+                    soonest = min(soonest, cooldown)
+                    continue
+                if self._buckets[model].try_acquire(now):
+                    return model, 0.0
+                soonest = min(soonest, self._buckets[model].wait_time(now))
+            return None, soonest
+
+    def cool_down(self, model, seconds):
+        with self._lock:
+            self._cooldown_until[model] = max(self._cooldown_until[model], time.monotonic() + seconds)
+            self._buckets[model].drain()
+
+    def status(self):
+        with self._lock:
+            now = time.monotonic()
+            status = {}
+            for m in self.models:
+                self._buckets[m]._refill(now)
+                status[m] = {"cooldown_seconds": round(max(0.0, self._cooldown_until[m] - now), 1),
+                             "tokens": round(self._buckets[m].tokens, 2)}
+            return status
+
+
+_shared_scheduler = None
+_shared_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide scheduler shared by every PrescriptionOCR instance and thread"""
+    global _shared_scheduler
+    with _shared_scheduler_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = ModelScheduler()
+        return _shared_scheduler
+
+
+class RateLimitedGemini:
+    """generate_content() with model failover driven by the shared scheduler"""
+
+    def __init__(self, client, scheduler=None, max_wait=GEMINI_MAX_WAIT_SECONDS):
+        self.client = client
+        self.scheduler = scheduler or get_scheduler()
+        self.max_wait = max_wait
+
+    def generate_content(self, contents, max_wait=None):
+        """Returns (response, model_name). Raises GeminiRateLimited when no
+        model has capacity within max_wait; other API errors propagate."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        last_error = None
+        while True:
+            model, wait = self.scheduler.acquire()
+            if model is None:
+                if wait > deadline - time.monotonic():
+                    raise GeminiRateLimited(wait, last_error)
+                time.sleep(wait)
+                continue
+            try:
+                print(f"[OCR] Trying model: {model}")
+                response = self.client.models.generate_content(model=model, contents=contents)
+                print(f"[OCR] ✓ Success with model: {model}")
+                return response, model
+            except Exception as model_err:
+                if not is_rate_limit_error(model_err):
+                    raise
+                # The cooldown takes this model out of rotation; the next
+                # acquire() picks another one without any fixed sleep
+                last_error = str(model_err)
+                delay = max(1.0, retry_delay_seconds(model_err))
+                print(f"[OCR] {model} rate-limited, cooling down {delay:.0f}s")
+                self.scheduler.cool_down(model, delay)
+
+
+def make_client(api_key):
+    """google-genai client, honouring GEMINI_BASE_URL for stub/proxy endpoints"""
+    from google import genai
+    if GEMINI_BASE_URL:
+        return genai.Client(api_key=api_key, http_options={'base_url': GEMINI_BASE_URL})
+    return genai.Client(api_key=api_key)
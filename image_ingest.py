@@ -0,0 +1,94 @@
+"""
+Image Ingest
+Bounded-memory handling of uploaded prescription images:
+
+- claim_upload() takes over the file Werkzeug already spooled a multipart
+  upload into (in memory when small, otherwise a temp file), checking its size
+  without reading or copying it.
+- spool_upload() copies a stream that is not a file yet (a zip member) in
+  fixed-size chunks into a SpooledTemporaryFile, enforcing the size limit as
+  it reads instead of buffering the whole thing.
+- open_for_ocr() decodes straight to (roughly) the size OCR needs: JPEGs use
+  Pillow's draft mode so libjpeg scales by 1/2, 1/4 or 1/8 while decoding, and
+  other formats are shrunk with reduce() before the final LANCZOS resize.
+"""
+
+import tempfile
+from io import BytesIO
+
+from PIL import Image
+
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Uploads up to this size are spooled in memory, larger ones to a temp file
+SPOOL_MEMORY_BYTES = 1024 * 1024
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+# Modes Image.reduce() supports directly
+_REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'RGBa', 'La', 'I', 'F', 'CMYK')
+
+
+class UploadTooLarge(ValueError):
+    """The upload exceeded the size limit while being read"""
+
+
+def claim_upload(stream, max_bytes=MAX_IMAGE_BYTES):
+    """Use an already-spooled upload stream as is: (stream positioned at 0, size).
+    Streams that can't seek are copied with spool_upload. Raises UploadTooLarge."""
+    try:
+        stream.seek(0, 2)
+        size = stream.tell()
+        stream.seek(0)
+    except (AttributeError, OSError, ValueError):
+        return spool_upload(stream, max_bytes)
+    if size > max_bytes:
+        raise UploadTooLarge(f"Image too large (max {max_bytes // (1024 * 1024)} MB)")
+    return stream, size
+
+
+def spool_upload(stream, max_bytes=MAX_IMAGE_BYTES, chunk_size=UPLOAD_CHUNK_BYTES):
+    """Copy stream into a spooled temp file, at most max_bytes.
+    Returns (file positioned at 0, size). Raises UploadTooLarge."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    size = 0
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"Image too large (max {max_bytes // (1024 * 1024)} MB)")
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, size
+
+
+def open_for_ocr(source, max_dimension=1600):
+    """Open a path, bytes or file object and decode it at no more than about
+    max_dimension on its longest side (the caller still does the exact resize)"""
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    image = Image.open(source)
+    width, height = image.size
+    longest = max(width, height)
+    if longest <= max_dimension:
+        image.load()
+        return image
+
+    scale = max_dimension / longest
+    if image.format == 'JPEG':
+        # libjpeg picks the largest 1/2, 1/4 or 1/8 reduction that stays >= the requested size
+        image.draft('RGB', (max(1, int(width * scale)), max(1, int(height * scale))))
+        image.load()
+        return image
+
+    image.load()
+    factor = longest // max_dimension
+    if factor >= 2:
+        if image.mode not in _REDUCIBLE_MODES:
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        image = image.reduce(factor)
+    return image
@@ -1,29 +1,20 @@
 #!/usr/bin/env python3
-"""Create database schema directly from SQL file"""
+"""Create or upgrade the database schema via the migration runner"""
 
 from db_connection import get_db_connection
-import psycopg2.extensions
-
-# Read schema file
-with open('schema.sql', 'r') as f:
-    schema_content = f.read()
+from db_migrations import migrate, current_version
 
 try:
     conn = get_db_connection()
-    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-    
-    cursor = conn.cursor()
-    
-    # Replace ``` markers if present
-    schema_content = schema_content.replace('```oraclesql\n', '').replace('```\n', '').replace('```', '')
     
     print("✅ Connected to database")
-    print("📝 Executing schema.sql...")
+    print("📝 Applying schema migrations...")
+    
+    applied = migrate(conn)
     
-    # Execute entire schema
-    cursor.execute(schema_content)
+    print(f"✅ Schema at version {current_version(conn)} ({len(applied)} migration(s) applied)")
     
-    print("✅ Schema executed successfully!")
+    cursor = conn.cursor()
     
     # Check what tables exist now
     cursor.execute("""
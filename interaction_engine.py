@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Drug Interaction Engine
+Checks a patient's whole active medication list — current prescriptions plus
+the free-text current_medications in user_medical_info — against the KB's
+interaction pairs.
+
+Pairs are loaded once into a symmetric adjacency index keyed by canonical KB
+name (or the normalized substance name for partners outside the KB, such as
+"alcohol"), so checking N medicines costs N name lookups plus one probe per
+candidate partner instead of comparing every pair of strings.
+
+scan_all_patients() re-runs the check for every patient and stores the
+results as contraindication_checks rows with check_type 'interaction'. Run it
+after the KB changes: python interaction_engine.py rescan
+(or python kb_store.py build ... --rescan).
+"""
+
+import os
+import re
+import sys
+import threading
+
+from psycopg2.extras import execute_values
+
+import medication_kb
+from medication_kb import normalize_drug_name
+
+# Patients per transaction in scan_all_patients()
+INTERACTION_SCAN_BATCH = max(1, int(os.getenv('INTERACTION_SCAN_BATCH', 200)))
+
+RISK_ORDER = {"HIGH": 0, "MEDIUM": 1, "LOW": 2}
+_LIST_SPLIT_RE = re.compile(r'[,;/\n+]+|\band\b|\bwith\b', re.IGNORECASE)
+
+
+def split_medication_list(text):
+    """'Metformin 500mg, aspirin and potassium' -> ['Metformin 500mg', 'aspirin', 'potassium']"""
+    return [part.strip() for part in _LIST_SPLIT_RE.split(text or '') if part and part.strip()]
+
+
+class InteractionIndex:
+    """Symmetric adjacency index over interaction pairs"""
+
+    def __init__(self, interactions, kb=None):
+        """interactions: {(drug_a, drug_b): {"risk", "message"}}; kb resolves names
+        (medication_kb.MedicationIndex or kb_store.MedicationStore)"""
+        self.kb = kb or medication_kb.MEDICATION_INDEX
+        self._adjacency = {}   # key -> {partner key: info}
+        self._substances = {}  # token tuple -> key, for partners not in the KB
+        self._max_tokens = 1
+        for (drug_a, drug_b), info in interactions.items():
+            key_a, key_b = self._partner_key(drug_a), self._partner_key(drug_b)
+            if not key_a or not key_b or key_a == key_b:
+                continue
+            self._adjacency.setdefault(key_a, {})[key_b] = info
+            self._adjacency.setdefault(key_b, {})[key_a] = info
+
+    def _partner_key(self, name):
+        canonical = self.kb.resolve(name)
+        if canonical:
+            return canonical
+        tokens = normalize_drug_name(name)
+        if not tokens:
+            return None
+        self._substances[tokens] = ' '.join(tokens)
+        self._max_tokens = max(self._max_tokens, len(tokens))
+        return self._substances[tokens]
+
+    def key(self, medicine_name):
+        """Index key for a medicine as written: its canonical KB name, else a
+        non-KB interaction partner it mentions ("potassium supplements")"""
+        canonical = self.kb.resolve(medicine_name)
+        if canonical:
+            return canonical
+        tokens = normalize_drug_name(medicine_name)
+        for size in range(min(self._max_tokens, len(tokens)), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                key = self._substances.get(tokens[start:start + size])
+                if key:
+                    return key
+        return None
+
+    def check(self, medicines):
+        """Interactions among medicines (dicts with medicine_name and optionally
+        prescription_id / source). Returns warning dicts, most severe first."""
+        by_key = {}
+        for med in medicines:
+            key = self.key(med.get("medicine_name") or "")
+            if key:
+                by_key.setdefault(key, []).append(med)
+
+        warnings = []
+        for key, meds in by_key.items():
+            partners = self._adjacency.get(key)
+            if not partners:
+                continue
+            # Probe whichever side is smaller: this drug's partners or the patient's list
+            if len(partners) <= len(by_key):
+                present = [(other, partners[other]) for other in partners if other in by_key]
+            else:
+                present = [(other, partners[other]) for other in by_key if other in partners]
+            for other, info in present:
+                if key < other:
+                    warnings.append(_warning(key, meds, other, by_key[other], info))
+        warnings.sort(key=lambda w: (RISK_ORDER.get(w["risk"], 3), w["pair"]))
+        return warnings
+
+
+def _warning(key_a, meds_a, key_b, meds_b, info):
+    name_a, name_b = meds_a[0]["medicine_name"], meds_b[0]["medicine_name"]
+    return {
+        "type": "INTERACTION",
+        "risk": (info.get("risk") or "medium").upper(),
+        "pair": [key_a, key_b],
+        "medicines": [name_a, name_b],
+        "message": f"⚠️ {name_a} + {name_b}: {info.get('message') or 'These can interact.'}",
+        "action": "ASK YOUR DOCTOR OR PHARMACIST",
+        "prescription_ids": sorted({m["prescription_id"] for m in meds_a + meds_b if m.get("prescription_id")}),
+    }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_interaction_index():
+    """InteractionIndex over the active KB, built on first use"""
+    global _index
+    with _index_lock:
+        if _index is None or _index.kb is not medication_kb.MEDICATION_INDEX:
+            kb = medication_kb.MEDICATION_INDEX
+            _index = InteractionIndex(kb.interactions, kb)
+        return _index
+
+
+def check_drug_interactions(medicine_names):
+    """Interactions among a plain list of medicine names"""
+    return get_interaction_index().check([{"medicine_name": name} for name in medicine_names])
+
+
+# ===== DATABASE =====
+
+def load_active_medications(cursor, user_ids):
+    """{user_id: [medicine dicts]} — prescriptions that haven't ended, plus each
+    entry of user_medical_info.current_medications"""
+    user_ids = [int(user_id) for user_id in user_ids]
+    medications = {user_id: [] for user_id in user_ids}
+    cursor.execute("""
+        SELECT user_id, id, medicine_name
+        FROM prescriptions
+        WHERE user_id = ANY(%s) AND (end_date IS NULL OR end_date >= CURRENT_DATE)
+        ORDER BY user_id, id
+    """, (user_ids,))
+    for user_id, prescription_id, medicine_name in cursor.fetchall():
+        medications[user_id].append({"medicine_name": medicine_name, "prescription_id": prescription_id,
+                                     "source": "prescription"})
+    cursor.execute("""
+        SELECT user_id, current_medications FROM user_medical_info
+        WHERE user_id = ANY(%s) AND current_medications IS NOT NULL
+    """, (user_ids,))
+    for user_id, current in cursor.fetchall():
+        for name in split_medication_list(current):
+            medications[user_id].append({"medicine_name": name, "prescription_id": None,
+                                         "source": "current_medications"})
+    return medications
+
+
+def check_user_interactions(cursor, user_id):
+    """(medications, warnings) for one user's active medication list"""
+    medications = load_active_medications(cursor, [user_id])[int(user_id)]
+    return medications, get_interaction_index().check(medications)
+
+
+def check_new_medicine_interactions(cursor, user_id, medicine_name):
+    """Warnings for medicine_name against everything the user already takes"""
+    index = get_interaction_index()
+    key = index.key(medicine_name)
+    if not key:
+        return []
+    medications = load_active_medications(cursor, [user_id])[int(user_id)]
+    medications.append({"medicine_name": medicine_name, "prescription_id": None, "source": "new"})
+    return [w for w in index.check(medications) if key in w["pair"]]
+
+
+def _store_user_batch(cursor, user_ids, warnings_by_user):
+    """Replace the batch's unacknowledged interaction rows; acknowledged ones are kept
+    (and not re-added). Rows need a prescription, so list-only pairs aren't stored."""
+    cursor.execute("""
+        DELETE FROM contraindication_checks
+        WHERE check_type = 'interaction' AND user_id = ANY(%s) AND NOT is_acknowledged
+    """, (list(user_ids),))
+    cursor.execute("""
+        SELECT prescription_id, medication_name FROM contraindication_checks
+        WHERE check_type = 'interaction' AND user_id = ANY(%s)
+    """, (list(user_ids),))
+    acknowledged = set(cursor.fetchall())
+
+    rows = []
+    for user_id, warnings in warnings_by_user.items():
+        for warning in warnings:
+            if not warning["prescription_ids"]:
+                continue
+            label = " + ".join(warning["medicines"])[:255]
+            prescription_id = warning["prescription_ids"][0]
+            if (prescription_id, label) in acknowledged:
+                continue
+            rows.append((prescription_id, user_id, label, 'interaction', warning["risk"].lower(),
+                         warning["message"], warning["action"]))
+    if rows:
+        execute_values(cursor, """
+            INSERT INTO contraindication_checks
+            (prescription_id, user_id, medication_name, check_type, risk_level, warning_message, recommendation)
+            VALUES %s
+        """, rows, page_size=500)
+    return len(rows)
+
+
+def scan_all_patients(conn, index=None, batch_size=INTERACTION_SCAN_BATCH):
+    """Re-check every patient with an active prescription and store the results,
+    then drop the unacknowledged interaction rows of everyone else (their
+    prescriptions have ended, so the warnings no longer apply).
+    index: InteractionIndex to use (default: the running KB). Returns totals."""
+    index = index or get_interaction_index()
+    totals = {"patients": 0, "interactions": 0, "rows_written": 0, "stale_rows_removed": 0}
+    cursor = conn.cursor()
+    last_user_id = 0
+    try:
+        while True:
+            cursor.execute("""
+                SELECT DISTINCT user_id FROM prescriptions
+                WHERE user_id > %s AND (end_date IS NULL OR end_date >= CURRENT_DATE)
+                ORDER BY user_id
+                LIMIT %s
+            """, (last_user_id, batch_size))
+            user_ids = [row[0] for row in cursor.fetchall()]
+            if not user_ids:
+                break
+            last_user_id = user_ids[-1]
+
+            medications = load_active_medications(cursor, user_ids)
+            warnings_by_user = {user_id: index.check(meds) for user_id, meds in medications.items()}
+            totals["rows_written"] += _store_user_batch(cursor, user_ids, warnings_by_user)
+            conn.commit()
+            totals["patients"] += len(user_ids)
+            totals["interactions"] += sum(len(w) for w in warnings_by_user.values())
+
+        # Rows need a prescription, so users with none active can't have a current warning
+        cursor.execute("""
+            DELETE FROM contraindication_checks c
+            WHERE c.check_type = 'interaction' AND NOT c.is_acknowledged
+              AND NOT EXISTS (
+                  SELECT 1 FROM prescriptions p
+                  WHERE p.user_id = c.user_id AND (p.end_date IS NULL OR p.end_date >= CURRENT_DATE)
+              )
+        """)
+        totals["stale_rows_removed"] = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return totals
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] != ["rescan"]:
+        print("Usage: python interaction_engine.py rescan")
+        return 1
+    from db_connection import get_db_connection, close_db_connection
+    conn = get_db_connection()
+    if not conn:
+        print("✗ Database connection failed")
+        return 1
+    try:
+        totals = scan_all_patients(conn)
+    finally:
+        close_db_connection(conn)
+    print(f"✓ Checked {totals['patients']} patients: {totals['interactions']} interactions, "
+          f"{totals['rows_written']} rows written, {totals['stale_rows_removed']} stale rows removed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Compiled Medication Knowledge Base
+A read-only SQLite file holding the medication KB (entries, name aliases,
+interactions and pregnancy/breastfeeding flags), for formularies too large to
+keep as Python literals in every worker.
+
+The file is opened immutable and memory-mapped, so gunicorn workers share the
+OS page cache instead of each building its own copy on the heap; only the rows
+a lookup touches are ever read. MedicationStore has the same interface as
+medication_kb.MedicationIndex, and medication_kb uses it when
+MEDICATION_KB_PATH points at a compiled file.
+
+Build:
+  python kb_store.py build [--out medication_kb.sqlite] [--from-db] [--csv formulary.csv]
+                           [--interactions-csv interactions.csv] [--no-builtin] [--rescan]
+Later sources override earlier ones: built-in entries, then the medications
+table, then the CSV. The file is written next to the target and swapped in
+atomically, so running workers keep reading the old one until they restart.
+--rescan re-runs the interaction check for every patient against the new file.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+from functools import lru_cache
+
+DEFAULT_KB_FILE = 'medication_kb.sqlite'
+# Bytes of the file each connection may memory-map
+KB_MMAP_BYTES = int(os.getenv('MEDICATION_KB_MMAP_MB', 256)) * 1024 * 1024
+KB_FORMAT_VERSION = 1
+
+# Fields every entry carries (create_plain_language_explanation reads them all)
+ENTRY_DEFAULTS = {
+    "generic_name": "",
+    "brand_names": [],
+    "plain_name": "",
+    "what_for": "",
+    "how_works": "",
+    "how_to_take": "Take as directed by your doctor",
+    "with_food": "Follow your doctor's or pharmacist's advice",
+    "duration_instruction": "Take for as long as your doctor prescribed",
+    "why_important": "Follow your medication schedule.",
+    "risks_of_skipping": "Skipping doses reduces the effectiveness of your treatment.",
+    "side_effects": "",
+    "contraindications": [],
+}
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE entries (canonical TEXT PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE aliases (alias TEXT PRIMARY KEY, canonical TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE flags (flag TEXT NOT NULL, canonical TEXT NOT NULL, PRIMARY KEY (flag, canonical)) WITHOUT ROWID;
+CREATE TABLE interactions (drug_a TEXT NOT NULL, drug_b TEXT NOT NULL, risk TEXT, message TEXT,
+                           PRIMARY KEY (drug_a, drug_b)) WITHOUT ROWID;
+"""
+
+
+class MedicationStore:
+    """Read-only lookups against a compiled KB file (see medication_kb.MedicationIndex)"""
+
+    def __init__(self, path):
+        from medication_kb import normalize_drug_name, KB_PREFIX_MIN
+        self.path = os.path.abspath(path)
+        if not os.path.isfile(self.path):
+            raise FileNotFoundError(self.path)
+        self._normalize = normalize_drug_name
+        self._prefix_min = KB_PREFIX_MIN
+        self._local = threading.local()
+        meta = dict(self._conn().execute("SELECT key, value FROM meta"))
+        if int(meta.get("format_version", 0)) != KB_FORMAT_VERSION:
+            raise ValueError(f"unsupported KB format {meta.get('format_version')}; rebuild with kb_store.py")
+        self.max_tokens = int(meta["max_tokens"])
+        self.size = int(meta["entries"])
+        self._interactions = None
+        # Hot names (the same few drugs per prescription) skip SQLite and JSON decoding
+        self.resolve = lru_cache(maxsize=4096)(self._resolve)
+        self.entry = lru_cache(maxsize=1024)(self._entry)
+
+    def _conn(self):
+        # sqlite3 connections are per thread; immutable=1 skips file locking entirely
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True)
+            conn.execute(f"PRAGMA mmap_size={KB_MMAP_BYTES}")
+            self._local.conn = conn
+        return conn
+
+    def _resolve(self, medicine_name):
+        tokens = self._normalize(medicine_name)
+        if not tokens:
+            return None
+        # Every n-gram of the name in one query; longest (then earliest) wins as in MedicationIndex
+        ngrams = [' '.join(tokens[start:start + size])
+                  for size in range(min(self.max_tokens, len(tokens)), 0, -1)
+                  for start in range(len(tokens) - size + 1)]
+        placeholders = ','.join('?' * len(ngrams))
+        found = dict(self._conn().execute(
+            f"SELECT alias, canonical FROM aliases WHERE alias IN ({placeholders})", ngrams))
+        for ngram in ngrams:
+            if ngram in found:
+                return found[ngram]
+
+        key = ' '.join(tokens)
+        if len(key) < self._prefix_min:
+            return None
+        row = self._conn().execute(
+            "SELECT canonical FROM aliases WHERE alias > ? AND alias < ? "
+            "ORDER BY length(alias), alias LIMIT 1", (key, key + '\U0010ffff')).fetchone()
+        return row[0] if row else None
+
+    def _entry(self, canonical):
+        row = self._conn().execute("SELECT data FROM entries WHERE canonical = ?", (canonical,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def lookup(self, medicine_name):
+        canonical = self.resolve(medicine_name)
+        return self.entry(canonical) if canonical else None
+
+    def flagged(self, flag, canonical):
+        return self._conn().execute("SELECT 1 FROM flags WHERE flag = ? AND canonical = ?",
+                                    (flag, canonical)).fetchone() is not None
+
+    @property
+    def interactions(self):
+        """{(drug_a, drug_b): {"risk", "message"}} like medication_kb.DRUG_INTERACTIONS"""
+        if self._interactions is None:
+            self._interactions = {(a, b): {"risk": risk, "message": message} for a, b, risk, message
+                                  in self._conn().execute("SELECT drug_a, drug_b, risk, message FROM interactions")}
+        return self._interactions
+
+
+# ===== BUILDER =====
+
+def _split_list(value):
+    if isinstance(value, list):
+        return [v.strip() for v in value if v and v.strip()]
+    return [v.strip() for v in (value or "").replace('|', ';').replace(',', ';').split(';') if v.strip()]
+
+
+def _complete_entry(name, fields):
+    entry = dict(ENTRY_DEFAULTS)
+    entry.update({k: v for k, v in fields.items() if k in ENTRY_DEFAULTS and v not in (None, "")})
+    entry["brand_names"] = _split_list(entry["brand_names"])
+    entry["contraindications"] = _split_list(entry["contraindications"])
+    entry["generic_name"] = entry["generic_name"] or name.title()
+    entry["plain_name"] = entry["plain_name"] or name.title()
+    return entry
+
+
+def _truthy(value):
+    return str(value or "").strip().lower() in ("1", "true", "yes", "y")
+
+
+def builtin_source():
+    """(entries, flags, interactions) from the literals in medication_kb.py"""
+    from medication_kb import (MEDICATION_DATABASE, DRUG_INTERACTIONS,
+                               PREGNANCY_CONTRAINDICATIONS, BREASTFEEDING_CONTRAINDICATIONS)
+    entries = {name: _complete_entry(name, info) for name, info in MEDICATION_DATABASE.items()}
+    flags = {("pregnancy", name) for name in PREGNANCY_CONTRAINDICATIONS}
+    flags |= {("breastfeeding", name) for name in BREASTFEEDING_CONTRAINDICATIONS}
+    return entries, flags, dict(DRUG_INTERACTIONS)
+
+
+def db_source():
+    """Entries from the medications table"""
+    from db_connection import get_db_connection, close_db_connection
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT name, generic_name, description, how_it_works, common_side_effects, contraindications
+            FROM medications ORDER BY id
+        """)
+        entries = {}
+        for name, generic_name, description, how_it_works, side_effects, contraindications in cursor.fetchall():
+            key = name.lower().strip()
+            entries[key] = _complete_entry(key, {
+                "generic_name": generic_name, "what_for": description, "how_works": how_it_works,
+                "side_effects": side_effects, "contraindications": contraindications,
+            })
+        cursor.close()
+        return entries
+    finally:
+        close_db_connection(conn)
+
+
+def csv_source(path):
+    """Entries and flags from a CSV with a `name` column plus any ENTRY_DEFAULTS
+    columns (lists separated by ';') and optional pregnancy / breastfeeding columns"""
+    entries, flags = {}, set()
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            key = (row.get("name") or "").lower().strip()
+            if not key:
+                continue
+            entries[key] = _complete_entry(key, row)
+            for flag in ("pregnancy", "breastfeeding"):
+                if _truthy(row.get(flag)):
+                    flags.add((flag, key))
+    return entries, flags
+
+
+def interactions_csv_source(path):
+    """{(drug_a, drug_b): {"risk", "message"}} from a drug_a,drug_b,risk,message CSV"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return {(row["drug_a"].lower().strip(), row["drug_b"].lower().strip()):
+                {"risk": row.get("risk") or "medium", "message": row.get("message") or ""}
+                for row in csv.DictReader(f)}
+
+
+def build_kb(out_path, entries, flags=(), interactions=None):
+    """Compile entries into a KB file at out_path (atomic replace). Returns the entry count."""
+    from medication_kb import MedicationIndex
+    index = MedicationIndex(entries)  # same alias rules as the in-memory KB
+    tmp_path = f"{out_path}.tmp{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        conn.executemany("INSERT INTO entries VALUES (?, ?)",
+                         ((name, json.dumps(info, ensure_ascii=False)) for name, info in sorted(entries.items())))
+        conn.executemany("INSERT INTO aliases VALUES (?, ?)",
+                         sorted((' '.join(tokens), canonical) for tokens, canonical in index.aliases.items()))
+        conn.executemany("INSERT INTO flags VALUES (?, ?)", sorted(f for f in flags if f[1] in entries))
+        conn.executemany("INSERT INTO interactions VALUES (?, ?, ?, ?)",
+                         sorted((a, b, v.get("risk"), v.get("message")) for (a, b), v in (interactions or {}).items()))
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("format_version", str(KB_FORMAT_VERSION)), ("max_tokens", str(index.max_tokens)),
+            ("entries", str(len(entries))),
+        ])
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, out_path)
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the medication knowledge base")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="compile a KB file")
+    build.add_argument("--out", default=os.getenv('MEDICATION_KB_PATH') or DEFAULT_KB_FILE)
+    build.add_argument("--from-db", action="store_true", help="include the medications table")
+    build.add_argument("--csv", help="formulary CSV (name, generic_name, brand_names, ...)")
+    build.add_argument("--interactions-csv", help="CSV with drug_a, drug_b, risk, message")
+    build.add_argument("--no-builtin", action="store_true", help="leave out the entries in medication_kb.py")
+    build.add_argument("--rescan", action="store_true", help="re-check every patient's interactions afterwards")
+    args = parser.parse_args(argv)
+
+    entries, flags, interactions = {}, set(), {}
+    if not args.no_builtin:
+        entries, flags, interactions = builtin_source()
+        print(f"✓ Built-in KB: {len(entries)} drugs")
+    if args.from_db:
+        db_entries = db_source()
+        entries.update(db_entries)
+        print(f"✓ medications table: {len(db_entries)} drugs")
+    if args.csv:
+        csv_entries, csv_flags = csv_source(args.csv)
+        entries.update(csv_entries)
+        flags |= csv_flags
+        print(f"✓ {args.csv}: {len(csv_entries)} drugs")
+    if args.interactions_csv:
+        interactions.update(interactions_csv_source(args.interactions_csv))
+    if not entries:
+        print("✗ No entries to compile")
+        return 1
+
+    count = build_kb(args.out, entries, flags, interactions)
+    size_kb = os.path.getsize(args.out) / 1024
+    print(f"✓ Wrote {args.out}: {count} drugs, {len(interactions)} interactions, {size_kb:.0f} KB")
+    print(f"  Use it with MEDICATION_KB_PATH={os.path.abspath(args.out)}")
+    if args.rescan:
+        return rescan_interactions(args.out)
+    return 0
+
+
+def rescan_interactions(path):
+    """Store every patient's interactions as computed from the KB file at path"""
+    from db_connection import get_db_connection, close_db_connection
+    from interaction_engine import InteractionIndex, scan_all_patients
+    store = MedicationStore(path)
+    conn = get_db_connection()
+    if not conn:
+        print("✗ Database connection failed")
+        return 1
+    try:
+        totals = scan_all_patients(conn, InteractionIndex(store.interactions, store))
+    finally:
+        close_db_connection(conn)
+    print(f"✓ Rescanned {totals['patients']} patients: {totals['interactions']} interactions, "
+          f"{totals['stale_rows_removed']} stale rows removed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Patient Medical Info
+Reads and writes user_medical_info together with its normalized term arrays
+(drug_allergy_terms / condition_terms, see medication_kb.medical_terms), and
+runs the contraindication checks for prescriptions as they are imported.
+"""
+
+from psycopg2.extras import execute_values
+
+from medication_kb import medical_terms, medical_profile, check_contraindications
+
+MEDICAL_INFO_COLUMNS = ("drug_allergies", "food_allergies", "existing_conditions", "current_medications",
+                        "is_pregnant", "is_breastfeeding", "drug_allergy_terms", "condition_terms")
+
+
+def save_medical_info_row(cursor, user_id, data):
+    """Insert or update the user's medical info, storing the term arrays
+    computed from the allergy / condition text"""
+    values = {
+        "drug_allergies": data.get("drug_allergies", ""),
+        "food_allergies": data.get("food_allergies", ""),
+        "existing_conditions": data.get("existing_conditions", ""),
+        "current_medications": data.get("current_medications", ""),
+        "is_pregnant": data.get("is_pregnant", False),
+        "is_breastfeeding": data.get("is_breastfeeding", False),
+    }
+    values["drug_allergy_terms"] = medical_terms(values["drug_allergies"])
+    values["condition_terms"] = medical_terms(values["existing_conditions"])
+    params = [values[column] for column in MEDICAL_INFO_COLUMNS]
+
+    cursor.execute("""
+        UPDATE user_medical_info
+        SET drug_allergies = %s, food_allergies = %s, existing_conditions = %s,
+            current_medications = %s, is_pregnant = %s, is_breastfeeding = %s,
+            drug_allergy_terms = %s, condition_terms = %s,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = %s
+    """, params + [user_id])
+    if cursor.rowcount == 0:
+        cursor.execute("""
+            INSERT INTO user_medical_info
+            (user_id, drug_allergies, food_allergies, existing_conditions, current_medications,
+             is_pregnant, is_breastfeeding, drug_allergy_terms, condition_terms)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, [user_id] + params)
+
+
+def load_medical_info(cursor, user_id):
+    """The user's medical info as a profile dict (term sets included), or {}.
+    Rows saved before the term columns existed get their terms computed here."""
+    cursor.execute(f"SELECT {', '.join(MEDICAL_INFO_COLUMNS)} FROM user_medical_info WHERE user_id = %s",
+                   (user_id,))
+    row = cursor.fetchone()
+    if not row:
+        return {}
+    return medical_profile(dict(zip(MEDICAL_INFO_COLUMNS, row)))
+
+
+def warning_rows(prescription_id, user_id, medicine_name, warnings):
+    """contraindication_checks rows (see store_warning_rows) for one prescription's warnings"""
+    return [(prescription_id, user_id, (medicine_name or "")[:255], warning["type"].lower(),
+             warning["risk"].lower(), warning["message"], warning["action"], warning["rule_key"])
+            for warning in warnings]
+
+
+def store_warning_rows(cursor, rows):
+    """Upsert contraindication_checks rows, one per (prescription_id, rule_key).
+    A warning that is already stored keeps its is_acknowledged flag."""
+    if rows:
+        execute_values(cursor, """
+            INSERT INTO contraindication_checks
+            (prescription_id, user_id, medication_name, check_type, risk_level,
+             warning_message, recommendation, rule_key)
+            VALUES %s
+            ON CONFLICT (prescription_id, rule_key) WHERE rule_key IS NOT NULL DO UPDATE
+            SET medication_name = EXCLUDED.medication_name, check_type = EXCLUDED.check_type,
+                risk_level = EXCLUDED.risk_level, warning_message = EXCLUDED.warning_message,
+                recommendation = EXCLUDED.recommendation
+        """, rows, page_size=500)
+
+
+def check_prescriptions(cursor, user_id, prescriptions, profile=None):
+    """Check (prescription_id, medicine_name) pairs against the user's medical
+    info and record the warnings in contraindication_checks.
+    Returns {prescription_id: [warnings]} for the prescriptions that have any."""
+    if profile is None:
+        profile = load_medical_info(cursor, user_id)
+    if not profile:
+        return {}
+
+    found = {}
+    rows = []
+    for prescription_id, medicine_name in prescriptions:
+        warnings = check_contraindications(medicine_name or "", profile)
+        if not warnings:
+            continue
+        found[prescription_id] = warnings
+        rows += warning_rows(prescription_id, user_id, medicine_name, warnings)
+    store_warning_rows(cursor, rows)
+    return found
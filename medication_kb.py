@@ -2,10 +2,23 @@
 Medication Knowledge Base and Plain Language Translator
 """
 
+import os
+import re
+from dotenv import load_dotenv
+load_dotenv()
+
+# Shortest truncated name ("atorva") resolved by prefix
+KB_PREFIX_MIN = 4
+# Longest allergy / condition phrase matched, in words ("severe liver disease")
+MEDICAL_TERM_MAX_TOKENS = 6
+# Compiled KB file (python kb_store.py build); unset = the built-in entries below
+MEDICATION_KB_PATH = os.getenv('MEDICATION_KB_PATH')
+
 # Comprehensive medication database with plain language explanations
 MEDICATION_DATABASE = {
     "aspirin": {
         "generic_name": "Acetylsalicylic Acid",
+        "brand_names": ["Ecotrin", "Bayer Aspirin", "Disprin", "Ecosprin"],
         "plain_name": "Aspirin",
         "what_for": "Pain relief, fever reduction, and blood clot prevention",
         "how_works": "Reduces pain signals in the nervous system and prevents blood clotting",
@@ -19,6 +32,7 @@ MEDICATION_DATABASE = {
     },
     "metformin": {
         "generic_name": "Metformin",
+        "brand_names": ["Glucophage", "Glycomet", "Fortamet", "Riomet"],
         "plain_name": "Metformin (Diabetes Medication)",
         "what_for": "Controlling blood sugar levels in Type 2 diabetes",
         "how_works": "Reduces sugar production in the liver and helps your body use insulin better",
@@ -32,6 +46,7 @@ MEDICATION_DATABASE = {
     },
     "amoxicillin": {
         "generic_name": "Amoxicillin",
+        "brand_names": ["Amoxil", "Mox", "Novamox", "Trimox"],
         "plain_name": "Amoxicillin (Antibiotic)",
         "what_for": "Fighting bacterial infections like ear infections, strep throat, pneumonia",
         "how_works": "Kills bacteria by breaking down their cell walls",
@@ -45,6 +60,7 @@ MEDICATION_DATABASE = {
     },
     "lisinopril": {
         "generic_name": "Lisinopril",
+        "brand_names": ["Zestril", "Prinivil", "Qbrelis", "Listril"],
         "plain_name": "Lisinopril (Blood Pressure Medication)",
         "what_for": "Lowering high blood pressure and protecting the heart",
         "how_works": "Relaxes blood vessels so blood flows more easily",
@@ -58,6 +74,7 @@ MEDICATION_DATABASE = {
     },
     "ibuprofen": {
         "generic_name": "Ibuprofen",
+        "brand_names": ["Advil", "Motrin", "Brufen", "Nurofen"],
         "plain_name": "Ibuprofen (Pain/Fever Reliever)",
         "what_for": "Pain relief, fever reduction, and reducing inflammation",
         "how_works": "Reduces prostaglandins that cause pain, fever, and swelling",
@@ -71,6 +88,7 @@ MEDICATION_DATABASE = {
     },
     "atorvastatin": {
         "generic_name": "Atorvastatin",
+        "brand_names": ["Lipitor", "Atorva", "Storvas", "Atorlip"],
         "plain_name": "Atorvastatin (Cholesterol Medication)",
         "what_for": "Lowering cholesterol and reducing heart attack/stroke risk",
         "how_works": "Reduces cholesterol production in the liver",
@@ -114,20 +132,116 @@ BREASTFEEDING_CONTRAINDICATIONS = [
     "aspirin",  # High doses
 ]
 
+_NAME_TOKEN_RE = re.compile(r'[a-z]+')
+
+
+def normalize_drug_name(name):
+    """'Tab. GLUCOPHAGE-500 mg' -> ('tab', 'glucophage', 'mg'): lowercase letter runs"""
+    return tuple(_NAME_TOKEN_RE.findall((name or "").lower()))
+
+
+_MEDICAL_LIST_SPLIT_RE = re.compile(r'[,;/\n]+')
+
+
+def medical_terms(text):
+    """'Chronic kidney disease, Penicillin' -> ['chronic', 'chronic kidney',
+    'chronic kidney disease', 'disease', 'kidney', 'kidney disease', 'penicillin']:
+    every run of up to MEDICAL_TERM_MAX_TOKENS words within each listed item.
+    Stored with user_medical_info so checks are set lookups, not substring scans."""
+    terms = set()
+    for item in _MEDICAL_LIST_SPLIT_RE.split(text or ""):
+        tokens = normalize_drug_name(item)
+        for size in range(1, min(MEDICAL_TERM_MAX_TOKENS, len(tokens)) + 1):
+            for start in range(len(tokens) - size + 1):
+                terms.add(' '.join(tokens[start:start + size]))
+    return sorted(terms)
+
+
+class MedicationIndex:
+    """Maps canonical names, generic names and brand names to KB entries.
+    Built once; lookups cost the same however many drugs the KB holds.
+    kb_store.MedicationStore offers the same interface over a compiled KB file."""
+
+    def __init__(self, database, interactions=None, pregnancy=(), breastfeeding=()):
+        self.database = database
+        self.interactions = interactions or {}
+        self._flags = {"pregnancy": set(pregnancy), "breastfeeding": set(breastfeeding)}
+        self.aliases = {}  # normalized token tuple -> canonical name
+        self.max_tokens = 1
+        # Canonical names win over generic names, which win over brands
+        for canonical in database:
+            self._add(canonical, canonical)
+        for canonical, info in database.items():
+            self._add(info.get("generic_name"), canonical)
+        for canonical, info in database.items():
+            for brand in info.get("brand_names", []):
+                self._add(brand, canonical)
+
+        candidates = {}
+        for tokens, canonical in self.aliases.items():
+            key = ' '.join(tokens)
+            for end in range(KB_PREFIX_MIN, len(key)):
+                candidates.setdefault(key[:end], []).append((len(key), key, canonical))
+        # Ambiguous prefixes go to the shortest (then alphabetically first) name
+        self._prefixes = {prefix: min(names)[2] for prefix, names in candidates.items()}
+
+    def _add(self, alias, canonical):
+        tokens = normalize_drug_name(alias)
+        if tokens and tokens not in self.aliases:
+            self.aliases[tokens] = canonical
+            self.max_tokens = max(self.max_tokens, len(tokens))
+
+    def resolve(self, medicine_name):
+        """Canonical KB name for a medicine name as written, or None.
+        Longest alias found in the name wins (earliest on ties); failing that,
+        the name may be the start of one ("atorva")."""
+        tokens = normalize_drug_name(medicine_name)
+        if not tokens:
+            return None
+        for size in range(min(self.max_tokens, len(tokens)), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                canonical = self.aliases.get(tokens[start:start + size])
+                if canonical:
+                    return canonical
+        return self._prefixes.get(' '.join(tokens))
+
+    def entry(self, canonical):
+        return self.database.get(canonical)
+
+    def lookup(self, medicine_name):
+        canonical = self.resolve(medicine_name)
+        return self.entry(canonical) if canonical else None
+
+    def flagged(self, flag, canonical):
+        """Whether canonical is on the 'pregnancy' / 'breastfeeding' contraindication list"""
+        return canonical in self._flags[flag]
+
+
+def _load_index():
+    """The compiled KB at MEDICATION_KB_PATH if set, else the built-in literals"""
+    if MEDICATION_KB_PATH:
+        from kb_store import MedicationStore
+        try:
+            store = MedicationStore(MEDICATION_KB_PATH)
+            print(f"✓ Medication KB loaded from {MEDICATION_KB_PATH} ({store.size} drugs)")
+            return store
+        except Exception as e:
+            print(f"⚠ Could not open medication KB {MEDICATION_KB_PATH} ({e}); using built-in KB")
+    return MedicationIndex(MEDICATION_DATABASE, DRUG_INTERACTIONS,
+                           PREGNANCY_CONTRAINDICATIONS, BREASTFEEDING_CONTRAINDICATIONS)
+
+
+MEDICATION_INDEX = _load_index()
+
+
+def resolve_medication_name(medicine_name):
+    """Canonical KB name (e.g. 'metformin' for 'Glucophage 500mg'), or None"""
+    return MEDICATION_INDEX.resolve(medicine_name)
+
+
 def get_medication_info(medicine_name):
-    """Get plain language medication information"""
-    medicine_name = medicine_name.lower().strip()
-    
-    # Try exact match
-    if medicine_name in MEDICATION_DATABASE:
-        return MEDICATION_DATABASE[medicine_name]
-    
-    # Try partial match
-    for med_name, med_info in MEDICATION_DATABASE.items():
-        if medicine_name in med_name or med_name in medicine_name:
-            return med_info
-    
-    return None
+    """Get plain language medication information (by name, generic name or brand)"""
+    return MEDICATION_INDEX.lookup(medicine_name)
 
 def create_plain_language_explanation(medication_info):
     """Create a comprehensive plain language explanation of medication"""
@@ -163,51 +277,110 @@ def create_plain_language_explanation(medication_info):
 """
     return explanation.strip()
 
+class ContraindicationRules:
+    """Per-drug contraindication rules, compiled from the KB on first use:
+    the phrases that name the drug (for allergies), the condition phrases it
+    conflicts with, and its pregnancy / breastfeeding flags."""
+
+    def __init__(self, kb):
+        self.kb = kb
+        self._rules = {}
+
+    def rules(self, canonical):
+        rule = self._rules.get(canonical)
+        if rule is None:
+            info = self.kb.entry(canonical)
+            names = [canonical, info.get("generic_name")] + list(info.get("brand_names", []))
+            allergy = frozenset(' '.join(tokens) for tokens in map(normalize_drug_name, names) if tokens)
+            conditions = tuple((' '.join(normalize_drug_name(label)), label)
+                               for label in info.get("contraindications", []) if normalize_drug_name(label))
+            rule = self._rules[canonical] = (info, allergy, conditions,
+                                             self.kb.flagged("pregnancy", canonical),
+                                             self.kb.flagged("breastfeeding", canonical))
+        return rule
+
+
+_contraindication_rules = None
+
+
+def get_contraindication_rules():
+    """ContraindicationRules over the active KB"""
+    global _contraindication_rules
+    if _contraindication_rules is None or _contraindication_rules.kb is not MEDICATION_INDEX:
+        _contraindication_rules = ContraindicationRules(MEDICATION_INDEX)
+    return _contraindication_rules
+
+
+def _term_set(user_medical_info, field, terms_field):
+    """Stored terms for a medical info field, else computed from its text"""
+    terms = user_medical_info.get(terms_field)
+    if terms is None:
+        terms = medical_terms(user_medical_info.get(field))
+    return terms if isinstance(terms, (set, frozenset)) else frozenset(terms)
+
+
+def medical_profile(user_medical_info):
+    """user_medical_info with drug_allergy_terms / condition_terms as sets, for
+    checking many medicines against the same patient"""
+    profile = dict(user_medical_info or {})
+    profile["drug_allergy_terms"] = _term_set(profile, "drug_allergies", "drug_allergy_terms")
+    profile["condition_terms"] = _term_set(profile, "existing_conditions", "condition_terms")
+    return profile
+
+
 def check_contraindications(medicine_name, user_medical_info):
-    """Check for contraindications based on patient medical history"""
-    medicine_name = medicine_name.lower().strip()
+    """Check for contraindications based on patient medical history.
+    user_medical_info may carry precomputed drug_allergy_terms / condition_terms
+    (see medical_profile()); otherwise they are derived from the text fields.
+    Each warning's rule_key identifies the rule that fired ("condition:kidney disease")."""
     warnings = []
     
-    med_info = get_medication_info(medicine_name)
-    if not med_info:
+    canonical = resolve_medication_name(medicine_name)
+    if not canonical:
         return warnings
+    med_info, allergy_names, conditions, pregnancy, breastfeeding = get_contraindication_rules().rules(canonical)
     
     # Check allergies
-    if user_medical_info.get("drug_allergies"):
-        allergies = user_medical_info["drug_allergies"].lower()
-        if medicine_name in allergies or med_info["generic_name"].lower() in allergies:
+    if user_medical_info.get("drug_allergies") or user_medical_info.get("drug_allergy_terms"):
+        allergies = _term_set(user_medical_info, "drug_allergies", "drug_allergy_terms")
+        written = ' '.join(normalize_drug_name(medicine_name))
+        if written in allergies or not allergies.isdisjoint(allergy_names):
             warnings.append({
                 "type": "ALLERGY",
+                "rule_key": "allergy",
                 "risk": "HIGH",
                 "message": f"⚠️ SEVERE: You have a documented allergy to {med_info['plain_name']}. DO NOT take this medicine.",
                 "action": "CONTACT YOUR DOCTOR IMMEDIATELY"
             })
     
     # Check pregnancy
-    if user_medical_info.get("is_pregnant") and medicine_name in [m.lower() for m in PREGNANCY_CONTRAINDICATIONS]:
+    if user_medical_info.get("is_pregnant") and pregnancy:
         warnings.append({
             "type": "PREGNANCY",
+            "rule_key": "pregnancy",
             "risk": "HIGH",
             "message": f"⚠️ WARNING: {med_info['plain_name']} may harm your baby. Consult your doctor.",
             "action": "CONFIRM WITH DOCTOR"
         })
     
     # Check breastfeeding
-    if user_medical_info.get("is_breastfeeding") and medicine_name in [m.lower() for m in BREASTFEEDING_CONTRAINDICATIONS]:
+    if user_medical_info.get("is_breastfeeding") and breastfeeding:
         warnings.append({
             "type": "BREASTFEEDING",
+            "rule_key": "breastfeeding",
             "risk": "MEDIUM",
             "message": f"⚠️ WARNING: {med_info['plain_name']} may pass to baby through breast milk. Consult your doctor.",
             "action": "CONFIRM WITH DOCTOR"
         })
     
     # Check documented contraindications
-    if user_medical_info.get("existing_conditions"):
-        conditions = user_medical_info["existing_conditions"].lower()
-        for contraindication in med_info.get("contraindications", []):
-            if contraindication.lower() in conditions:
+    if conditions and (user_medical_info.get("existing_conditions") or user_medical_info.get("condition_terms")):
+        condition_terms = _term_set(user_medical_info, "existing_conditions", "condition_terms")
+        for phrase, contraindication in conditions:
+            if phrase in condition_terms:
                 warnings.append({
                     "type": "CONDITION",
+                    "rule_key": f"condition:{phrase}",
                     "risk": "HIGH",
                     "message": f"⚠️ WARNING: You have {contraindication}, which conflicts with {med_info['plain_name']}.",
                     "action": "DISCUSS WITH YOUR DOCTOR"
@@ -0,0 +1,145 @@
+"""
+Medicine Name Matcher
+Precompiled lookups for finding known medicine names in OCR text:
+- Aho-Corasick automaton: every exact (substring) hit in one pass over the text
+- Bigram index: fuzzy candidates for a word without comparing it to every name
+
+Fuzzy results are verified with difflib.SequenceMatcher, so they are exactly
+what the old all-pairs scan returned; the index only skips names that cannot
+reach the cutoff.
+"""
+
+import difflib
+from collections import Counter, defaultdict, deque
+
+
+def _bigrams(word):
+    return Counter(word[i:i + 2] for i in range(len(word) - 1))
+
+
+def _max_indels(len_a, len_b, cutoff):
+    """Most insert/delete edits two strings can differ by and still reach the
+    SequenceMatcher cutoff: ratio = 2M/(la+lb) >= cutoff means at most
+    la+lb-2M <= (1-cutoff)(la+lb) unmatched characters"""
+    return int((1 - cutoff) * (len_a + len_b) + 1e-9)
+
+
+class MedicineMatcher:
+    """Index over a fixed list of lowercase medicine names"""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self._order = {name: i for i, name in enumerate(self.names)}
+        self._build_automaton()
+        self._build_bigram_index()
+
+    # ------------------------------------------------------------------
+    # Exact matching (Aho-Corasick)
+    # ------------------------------------------------------------------
+    def _build_automaton(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for idx, name in enumerate(self.names):
+            state = 0
+            for ch in name:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = nxt
+            self._output[state].append(idx)
+
+        # Breadth-first failure links; each state also inherits the outputs of
+        # its failure state so a single lookup reports every name ending here
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def find_exact(self, text):
+        """Return {name: first position} for every known name occurring in text"""
+        found = {}
+        goto, fail, output, names = self._goto, self._fail, self._output, self.names
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for idx in output[state]:
+                name = names[idx]
+                if name not in found:
+                    found[name] = pos - len(name) + 1
+        return found
+
+    # ------------------------------------------------------------------
+    # Fuzzy matching (bigram count filter + SequenceMatcher verification)
+    # ------------------------------------------------------------------
+    def _build_bigram_index(self):
+        self._postings = defaultdict(list)   # bigram -> [(name index, count)]
+        self._by_length = defaultdict(list)  # length -> [name index]
+        for idx, name in enumerate(self.names):
+            self._by_length[len(name)].append(idx)
+            for gram, count in _bigrams(name).items():
+                self._postings[gram].append((idx, count))
+
+    def _candidates(self, word, cutoff):
+        """Indexes of names that could reach cutoff against word.
+        A string within D insert/delete edits of another shares at least
+        max(la, lb) - 1 - 2D bigrams, so anything sharing fewer is skipped."""
+        la = len(word)
+        shared = Counter()
+        for gram, count in _bigrams(word).items():
+            for idx, name_count in self._postings.get(gram, ()):
+                shared[idx] += min(count, name_count)
+
+        candidates = []
+        for lb, indexes in self._by_length.items():
+            # 2*min(la, lb) / (la + lb) bounds the ratio from above
+            if 2 * min(la, lb) < cutoff * (la + lb):
+                continue
+            required = max(la, lb) - 1 - 2 * _max_indels(la, lb, cutoff)
+            if required <= 0:
+                candidates.extend(indexes)
+            else:
+                candidates.extend(idx for idx in indexes if shared[idx] >= required)
+        return candidates
+
+    def fuzzy_matches(self, word, cutoff=0.80, exclude=()):
+        """Names whose SequenceMatcher(None, word, name).ratio() >= cutoff,
+        in list order"""
+        matcher = difflib.SequenceMatcher(None, word)
+        matches = []
+        for idx in sorted(self._candidates(word, cutoff)):
+            name = self.names[idx]
+            if name in exclude:
+                continue
+            matcher.set_seq2(name)
+            if matcher.ratio() >= cutoff:
+                matches.append(name)
+        return matches
+
+    def best_match(self, word, cutoff=0.6):
+        """Same result as difflib.get_close_matches(word, names, n=1, cutoff)[0],
+        or None"""
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(word)
+        best = None
+        for idx in self._candidates(word, cutoff):
+            name = self.names[idx]
+            matcher.set_seq1(name)
+            if matcher.real_quick_ratio() < cutoff or matcher.quick_ratio() < cutoff:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= cutoff and (best is None or (ratio, name) > best):
+                best = (ratio, name)
+        return best[1] if best else None
@@ -0,0 +1,3 @@
+-- Backfill adherence_summary for databases that had dose history before the
+-- summary triggers existed. From here on the triggers keep it current.
+SELECT rebuild_adherence_summary();
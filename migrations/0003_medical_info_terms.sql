@@ -0,0 +1,6 @@
+-- Normalized allergy / condition phrases (medication_kb.medical_terms), written
+-- by save_medical_info so contraindication checks are set lookups instead of
+-- substring scans over the free text. NULL = not computed yet; readers fall
+-- back to the text columns until the row is next saved.
+ALTER TABLE user_medical_info ADD COLUMN IF NOT EXISTS drug_allergy_terms TEXT[];
+ALTER TABLE user_medical_info ADD COLUMN IF NOT EXISTS condition_terms TEXT[];
@@ -0,0 +1,37 @@
+-- Batch contraindication scanner (contraindication_scanner.py).
+-- rule_key names the rule behind a warning ("allergy", "condition:kidney disease"),
+-- so a re-scan upserts one row per (prescription, rule) and removes rules that
+-- no longer apply. Rows without a key (interaction checks, sample data) are untouched.
+ALTER TABLE contraindication_checks ADD COLUMN IF NOT EXISTS rule_key VARCHAR(255);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_contraindication_rule
+    ON contraindication_checks(prescription_id, rule_key) WHERE rule_key IS NOT NULL;
+
+-- Watermarks for incremental scans: only rows changed since the last run are re-checked
+CREATE TABLE IF NOT EXISTS scan_state (
+    scanner VARCHAR(100) PRIMARY KEY,
+    watermark TIMESTAMP NOT NULL,
+    last_run_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    rows_scanned INTEGER DEFAULT 0
+);
+
+-- Keep updated_at honest for edits made outside the app, so the watermark sees them
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_prescriptions_touch ON prescriptions;
+CREATE TRIGGER trg_prescriptions_touch
+    BEFORE UPDATE ON prescriptions
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_user_medical_info_touch ON user_medical_info;
+CREATE TRIGGER trg_user_medical_info_touch
+    BEFORE UPDATE ON user_medical_info
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_prescriptions_updated_at ON prescriptions(updated_at);
+CREATE INDEX IF NOT EXISTS idx_user_medical_info_updated_at ON user_medical_info(updated_at);
@@ -0,0 +1,15 @@
+-- Reminder due-queue for reminder_dispatcher.py.
+-- The dispatcher only ever reads unsent reminders by time, so a partial index
+-- on reminder_time stays small (sent rows drop out of it) and replaces the
+-- low-selectivity boolean index.
+CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(reminder_time) WHERE NOT is_sent;
+DROP INDEX IF EXISTS idx_reminders_sent;
+
+-- How a reminder left the queue: sent (via its channel), fallback (delivered
+-- in-app because its channel was unavailable or failed), expired (too late to
+-- be useful), cancelled (dose already taken / missed)
+ALTER TABLE reminders ADD COLUMN IF NOT EXISTS delivery_status VARCHAR(20);
+ALTER TABLE reminders ADD COLUMN IF NOT EXISTS last_error TEXT;
+
+-- Destination for the SMS channel
+ALTER TABLE users ADD COLUMN IF NOT EXISTS phone VARCHAR(20);
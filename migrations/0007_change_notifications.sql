@@ -0,0 +1,95 @@
+-- Change notifications for the dashboard stream (change_stream.py).
+-- Statement-level triggers publish one NOTIFY per user per statement on the
+-- 'medication_changes' channel, carrying the changed rows so clients can
+-- apply them without re-querying. NOTIFY is delivered on commit (and dropped
+-- on rollback). Payloads must stay under 8000 bytes, so a statement touching
+-- more than 40 of a user's rows (e.g. dose materialization) sends the count
+-- only and clients reload.
+
+CREATE OR REPLACE FUNCTION notify_dose_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('medication_changes', json_build_object(
+            'type', 'dose', 'user_id', user_id, 'changed', n)::text)
+        FROM (SELECT user_id, COUNT(*) AS n FROM old_doses GROUP BY user_id) d;
+    ELSE
+        PERFORM pg_notify('medication_changes', json_build_object(
+            'type', 'dose', 'user_id', user_id, 'changed', n,
+            'rows', CASE WHEN n <= 40 THEN rows END)::text)
+        FROM (SELECT user_id, COUNT(*) AS n,
+                     json_agg(json_build_object(
+                         'dose_id', id, 'status', status, 'scheduled_time', scheduled_time,
+                         'today', scheduled_time::date = CURRENT_DATE) ORDER BY scheduled_time) AS rows
+              FROM new_doses GROUP BY user_id) d;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_reminder_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('medication_changes', json_build_object(
+        'type', 'reminder', 'user_id', user_id, 'changed', n,
+        'rows', CASE WHEN n <= 40 THEN rows END)::text)
+    FROM (SELECT user_id, COUNT(*) AS n,
+                 json_agg(json_build_object(
+                     'reminder_id', id, 'dose_id', dose_tracking_id, 'is_sent', is_sent,
+                     'sent_at', sent_at, 'reminder_method', reminder_method,
+                     'delivery_status', delivery_status) ORDER BY reminder_time) AS rows
+          FROM new_reminders GROUP BY user_id) r;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_summary_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('medication_changes', json_build_object(
+        'type', 'summary', 'user_id', user_id, 'changed', n,
+        'rows', CASE WHEN n <= 40 THEN rows END)::text)
+    FROM (SELECT user_id, COUNT(*) AS n,
+                 json_agg(json_build_object(
+                     'date', date, 'total_doses', total_doses, 'doses_taken', doses_taken,
+                     'doses_missed', doses_missed, 'today', date = CURRENT_DATE) ORDER BY date) AS rows
+          FROM new_summary GROUP BY user_id) s;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables allow one event per trigger, hence the pairs
+DROP TRIGGER IF EXISTS trg_dose_tracking_notify_insert ON dose_tracking;
+CREATE TRIGGER trg_dose_tracking_notify_insert
+    AFTER INSERT ON dose_tracking REFERENCING NEW TABLE AS new_doses
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dose_changes();
+
+DROP TRIGGER IF EXISTS trg_dose_tracking_notify_update ON dose_tracking;
+CREATE TRIGGER trg_dose_tracking_notify_update
+    AFTER UPDATE ON dose_tracking REFERENCING NEW TABLE AS new_doses
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dose_changes();
+
+DROP TRIGGER IF EXISTS trg_dose_tracking_notify_delete ON dose_tracking;
+CREATE TRIGGER trg_dose_tracking_notify_delete
+    AFTER DELETE ON dose_tracking REFERENCING OLD TABLE AS old_doses
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dose_changes();
+
+DROP TRIGGER IF EXISTS trg_reminders_notify_insert ON reminders;
+CREATE TRIGGER trg_reminders_notify_insert
+    AFTER INSERT ON reminders REFERENCING NEW TABLE AS new_reminders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_reminder_changes();
+
+DROP TRIGGER IF EXISTS trg_reminders_notify_update ON reminders;
+CREATE TRIGGER trg_reminders_notify_update
+    AFTER UPDATE ON reminders REFERENCING NEW TABLE AS new_reminders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_reminder_changes();
+
+DROP TRIGGER IF EXISTS trg_adherence_summary_notify_insert ON adherence_summary;
+CREATE TRIGGER trg_adherence_summary_notify_insert
+    AFTER INSERT ON adherence_summary REFERENCING NEW TABLE AS new_summary
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_summary_changes();
+
+DROP TRIGGER IF EXISTS trg_adherence_summary_notify_update ON adherence_summary;
+CREATE TRIGGER trg_adherence_summary_notify_update
+    AFTER UPDATE ON adherence_summary REFERENCING NEW TABLE AS new_summary
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_summary_changes();
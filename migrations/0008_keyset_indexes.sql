@@ -0,0 +1,16 @@
+-- Indexes for the keyset-paginated listings (pagination.py). Each matches
+-- "WHERE user_id = ? AND (<key>) < (?) ORDER BY <key> DESC", so any page is
+-- a backward index scan that starts at the cursor and stops after one page.
+
+-- Reminder history: (reminder_time, id)
+CREATE INDEX IF NOT EXISTS idx_reminders_user_time ON reminders(user_id, reminder_time, id);
+
+-- Dose history: (scheduled_time, id). id joins the key of the existing
+-- per-user time index, which keeps serving the "today's doses" range scans.
+DROP INDEX IF EXISTS idx_dose_tracking_user_time;
+CREATE INDEX idx_dose_tracking_user_time ON dose_tracking(user_id, scheduled_time, id)
+    INCLUDE (status, prescription_id);
+
+-- Prescriptions: newest first by id; also serves plain user_id lookups
+CREATE INDEX IF NOT EXISTS idx_prescriptions_user_id ON prescriptions(user_id, id);
+DROP INDEX IF EXISTS idx_user_prescriptions;
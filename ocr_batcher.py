@@ -0,0 +1,169 @@
+"""
+Gemini Micro-Batching
+Collects prescription images that arrive within a short window (e.g. a clinic
+uploading a stack at once) and sends them to Gemini as ONE multi-image request,
+so a burst costs one prompt and one rate-limit unit instead of one per image.
+
+The reply is a JSON object keyed by image number; each image's medicine list is
+handed back to the request that submitted it. Images the reply doesn't cover
+(or a reply that isn't valid JSON) fall back to an ordinary single-image call.
+
+The model is reached through anything with generate_content(contents) ->
+(response, model_name) — RateLimitedGemini in production, a fake in tests.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+# Collect images for this long after the first one arrives (0 = batching off)
+OCR_BATCH_WINDOW_MS = int(os.getenv('OCR_BATCH_WINDOW_MS', 0))
+OCR_BATCH_MAX_IMAGES = max(1, int(os.getenv('OCR_BATCH_MAX_IMAGES', 4)))
+
+BATCH_PROMPT_HEADER = """You will receive {count} separate prescription/medicine images, each preceded by a label "IMAGE n".
+Analyze EACH image independently using the instructions below.
+
+Return ONLY a valid JSON object (no markdown, no extra text) whose keys are the image numbers as strings
+("1" to "{count}") and whose values are the JSON array described below for that image. Include every key,
+using [] for an image with no readable medicines.
+
+Instructions for each image:
+"""
+
+
+def build_batch_contents(prompt, images):
+    """[batch prompt, "IMAGE 1", image1, "IMAGE 2", image2, ...]"""
+    contents = [BATCH_PROMPT_HEADER.format(count=len(images)) + prompt]
+    for number, image in enumerate(images, start=1):
+        contents.append(f"IMAGE {number}")
+        contents.append(image)
+    return contents
+
+
+def demultiplex(data, count):
+    """Split a batch reply into per-image results: list of (medicines or None).
+    None means the reply has nothing usable for that image."""
+    results = [None] * count
+    if isinstance(data, list) and count == 1:
+        data = {"1": data}
+    if not isinstance(data, dict):
+        return results
+    for key, value in data.items():
+        try:
+            number = int(str(key).strip().lower().replace('image', '').strip())
+        except ValueError:
+            continue
+        if 1 <= number <= count and isinstance(value, (list, dict)):
+            results[number - 1] = value
+    return results
+
+
+class _Pending:
+    def __init__(self, image):
+        self.image = image
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GeminiBatcher:
+    """Groups concurrent extract() calls into multi-image model requests"""
+
+    def __init__(self, gemini, prompt, parse_json, to_prescriptions, single_extract,
+                 window_ms=OCR_BATCH_WINDOW_MS, max_images=OCR_BATCH_MAX_IMAGES):
+        """gemini: object with generate_content(contents) -> (response, model)
+        parse_json(text) -> data; to_prescriptions(data) -> list of dicts
+        single_extract(image) -> list of dicts (the unbatched path, used for fallback)"""
+        self.gemini = gemini
+        self.prompt = prompt
+        self.parse_json = parse_json
+        self.to_prescriptions = to_prescriptions
+        self.single_extract = single_extract
+        self.window = window_ms / 1000.0
+        self.max_images = max_images
+        self._queue = queue.Queue()
+        self._dispatcher = None
+        self._lock = threading.Lock()
+        self.stats = {"images": 0, "model_calls": 0, "fallbacks": 0}
+
+    def extract(self, image):
+        """Medicines for one image; blocks until its batch has been answered"""
+        self._ensure_dispatcher()
+        pending = _Pending(image)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _ensure_dispatcher(self):
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(target=self._dispatch, name="gemini-batcher", daemon=True)
+                self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_images:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Run the call on its own thread so the next window can fill meanwhile
+            threading.Thread(target=self._run_batch, args=(batch,), daemon=True).start()
+
+    def _run_batch(self, batch):
+        self._count(images=len(batch))
+        if len(batch) == 1:
+            self._run_single(batch[0])
+            return
+        try:
+            self._count(model_calls=1)
+            response, model = self.gemini.generate_content(
+                build_batch_contents(self.prompt, [p.image for p in batch]))
+            print(f"[OCR] Batched {len(batch)} images into one {model} call")
+            try:
+                per_image = demultiplex(self.parse_json(response.text), len(batch))
+            except (ValueError, json.JSONDecodeError) as parse_err:
+                print(f"[OCR] Batch reply not parseable ({parse_err}); falling back to per-image calls")
+                per_image = [None] * len(batch)
+        except Exception as e:
+            # Rate limits and API errors apply to every image in the batch
+            for pending in batch:
+                pending.error = e
+                pending.done.set()
+            return
+
+        for pending, data in zip(batch, per_image):
+            if data is None:
+                self._run_single(pending, fallback=True)
+                continue
+            try:
+                pending.result = self.to_prescriptions(data) if data else []
+            except Exception:
+                self._run_single(pending, fallback=True)
+                continue
+            pending.image = None
+            pending.done.set()
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, amount in increments.items():
+                self.stats[key] += amount
+
+    def _run_single(self, pending, fallback=False):
+        try:
+            self._count(model_calls=1, fallbacks=int(fallback))
+            pending.result = self.single_extract(pending.image)
+        except Exception as e:
+            pending.error = e
+        finally:
+            pending.image = None
+            pending.done.set()
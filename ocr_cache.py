@@ -0,0 +1,155 @@
+"""
+OCR Result Cache
+Remembers the medicines extracted from a prescription image so re-uploading the
+same photo skips the (rate-limited) Gemini call entirely.
+
+Entries live in a small SQLite file under OCR_CACHE_DIR, so they survive worker
+recycles and are shared by every worker on the machine. Keys are the SHA-256 of
+the normalized image (after _resize_image). A 64-bit difference hash (dHash)
+is stored alongside so near-duplicates (the same photo re-encoded or re-saved)
+can also hit; that is off by default because two prescriptions printed on the
+same template can look alike to a perceptual hash.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from PIL import Image
+
+OCR_CACHE_ENABLED = os.getenv('OCR_CACHE_ENABLED', 'true').lower() == 'true'
+OCR_CACHE_DIR = os.getenv('OCR_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.ocr_cache'))
+OCR_CACHE_TTL_SECONDS = int(os.getenv('OCR_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+OCR_CACHE_MAX_ENTRIES = int(os.getenv('OCR_CACHE_MAX_ENTRIES', 1000))
+# Max differing dHash bits for a near-duplicate hit (0 = exact image only)
+OCR_CACHE_NEAR_DUPLICATE_BITS = int(os.getenv('OCR_CACHE_NEAR_DUPLICATE_BITS', 0))
+
+
+def _to_signed64(value):
+    """SQLite INTEGER is signed 64-bit"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def difference_hash(image):
+    """64-bit dHash: compares neighbouring pixels of a 9x8 grayscale thumbnail"""
+    small = image.convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def fingerprint(image):
+    """(content key, dHash) for an already normalized image"""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest(), difference_hash(image)
+
+
+class OCRCache:
+    """TTL + size-bounded (least recently used) store of OCR results"""
+
+    def __init__(self, directory=OCR_CACHE_DIR, ttl_seconds=OCR_CACHE_TTL_SECONDS,
+                 max_entries=OCR_CACHE_MAX_ENTRIES, near_duplicate_bits=OCR_CACHE_NEAR_DUPLICATE_BITS):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.near_duplicate_bits = near_duplicate_bits
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'ocr_results.sqlite3')
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ocr_results (
+                    key TEXT PRIMARY KEY,
+                    dhash INTEGER NOT NULL,
+                    results TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_results_access ON ocr_results(last_access)")
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call: safe across threads and forked workers.
+        # Commits (or rolls back) like sqlite3's own context manager, then closes.
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key, dhash=None):
+        """Cached results for this image (or a near-duplicate), or None"""
+        now = time.time()
+        oldest = now - self.ttl_seconds
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT key, results FROM ocr_results WHERE key = ? AND created_at >= ?",
+                (key, oldest)
+            ).fetchone()
+            if row is None and dhash is not None and self.near_duplicate_bits > 0:
+                row = self._nearest(conn, dhash, oldest)
+            if row is None:
+                return None
+            conn.execute("UPDATE ocr_results SET last_access = ?, hits = hits + 1 WHERE key = ?",
+                         (now, row[0]))
+        return json.loads(row[1])
+
+    def _nearest(self, conn, dhash, oldest):
+        best = None
+        for key, stored, results in conn.execute(
+                "SELECT key, dhash, results FROM ocr_results WHERE created_at >= ?", (oldest,)):
+            distance = bin((stored ^ _to_signed64(dhash)) & ((1 << 64) - 1)).count('1')
+            if distance <= self.near_duplicate_bits and (best is None or distance < best[0]):
+                best = (distance, key, results)
+        return (best[1], best[2]) if best else None
+
+    def put(self, key, dhash, results):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_results (key, dhash, results, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, _to_signed64(dhash), json.dumps(results), now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM ocr_results WHERE created_at < ?", (now - self.ttl_seconds,))
+        conn.execute("""
+            DELETE FROM ocr_results WHERE key IN (
+                SELECT key FROM ocr_results ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def stats(self):
+        with self._connect() as conn:
+            entries, hits = conn.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM ocr_results").fetchone()
+        return {"entries": entries, "hits": hits, "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds}
+
+
+_cache = None
+
+
+def get_ocr_cache():
+    """Process-wide cache, or None when disabled or the directory is unusable"""
+    global _cache
+    if not OCR_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        try:
+            _cache = OCRCache()
+        except (OSError, sqlite3.Error) as e:
+            print(f"[OCR] ⚠ Result cache unavailable: {e}")
+            return None
+    return _cache
@@ -0,0 +1,287 @@
+"""
+OCR Job Queue
+Runs prescription OCR on a small pool of background threads so an upload
+request returns immediately with a job id instead of holding a gunicorn worker
+through Gemini retries or a Tesseract sweep. Clients poll (or long-poll) the
+job's status.
+
+The queue is bounded: when OCR_JOB_QUEUE_SIZE jobs are already waiting, submit()
+raises QueueFull and the API answers 429 with Retry-After, so a burst of uploads
+can't starve logins and dose marking.
+
+Jobs run in this process, but their state is also written to a small SQLite
+file next to the OCR cache, so a status poll still finds the result after
+gunicorn recycles the worker (--max-requests). A job whose process died
+before it finished is reported as 'lost': the client should resubmit the
+image (the OCR cache usually makes the second run cheap).
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from ocr_cache import OCR_CACHE_DIR
+
+OCR_JOB_WORKERS = max(1, int(os.getenv('OCR_JOB_WORKERS', 2)))
+OCR_JOB_QUEUE_SIZE = max(1, int(os.getenv('OCR_JOB_QUEUE_SIZE', 8)))
+# How long finished jobs stay readable, in seconds
+OCR_JOB_RESULT_TTL = int(os.getenv('OCR_JOB_RESULT_TTL', 600))
+# Keep job state on disk so it survives worker recycles
+OCR_JOB_STORE_ENABLED = os.getenv('OCR_JOB_STORE_ENABLED', 'true').lower() == 'true'
+
+JOB_FIELDS = ("id", "status", "created_at", "started_at", "finished_at", "result", "error")
+LOST_JOB_ERROR = "The server restarted before this prescription was analyzed. Please resubmit the image."
+
+
+class QueueFull(Exception):
+    """Raised by submit() when the queue is at capacity"""
+
+    def __init__(self, retry_after):
+        super().__init__("OCR queue is full")
+        self.retry_after = retry_after
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStore:
+    """On-disk copy of job state, shared by every worker on the machine"""
+
+    def __init__(self, directory=OCR_CACHE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'ocr_jobs.sqlite3')
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ocr_jobs (
+                    id TEXT PRIMARY KEY,
+                    pid INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    result TEXT,
+                    error TEXT
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save(self, job):
+        result = None if job["result"] is None else json.dumps(job["result"], default=str)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_jobs (id, pid, status, created_at, started_at, finished_at, result, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job["id"], os.getpid(), job["status"], job["created_at"], job["started_at"],
+                 job["finished_at"], result, job["error"])
+            )
+
+    def load(self, job_id):
+        """The stored job (as status() returns it), or None; unfinished jobs of a
+        process that no longer exists come back as 'lost'"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, status, created_at, started_at, finished_at, result, error, pid "
+                "FROM ocr_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        info = dict(zip(JOB_FIELDS, row[:7]))
+        if info["result"] is not None:
+            info["result"] = json.loads(info["result"])
+        if info["status"] in ("queued", "running") and (row[7] == os.getpid() or not _pid_alive(row[7])):
+            # Not in our memory and its process is gone: it will never finish
+            info["status"] = "lost"
+            info["error"] = LOST_JOB_ERROR
+        return info
+
+    def delete(self, job_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM ocr_jobs WHERE id = ?", (job_id,))
+
+    def purge(self, cutoff):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM ocr_jobs WHERE COALESCE(finished_at, created_at) < ?", (cutoff,))
+
+
+class OCRJobQueue:
+    """Bounded FIFO of OCR jobs processed by a fixed set of daemon threads"""
+
+    def __init__(self, workers=OCR_JOB_WORKERS, max_queued=OCR_JOB_QUEUE_SIZE, result_ttl=OCR_JOB_RESULT_TTL,
+                 store=None):
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.store = store
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._avg_seconds = 10.0  # running estimate of job duration, for Retry-After
+
+    def _ensure_workers(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"ocr-job-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs); returns the job id or raises QueueFull"""
+        self._ensure_workers()
+        self._purge_expired()
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "done": threading.Event(),
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        # Stored before a worker can pick it up, so 'queued' never overwrites its result
+        self._persist(job)
+        try:
+            self._queue.put_nowait((job, func, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            # Rejected: the client never gets this id, so it must not turn up as 'lost'
+            self._forget(job_id)
+            raise QueueFull(self.retry_after())
+        return job_id
+
+    def _persist(self, job):
+        if self.store is None:
+            return
+        try:
+            self.store.save(job)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"[OCR JOB] ⚠ Could not store job {job['id']}: {e}")
+
+    def _work(self):
+        while True:
+            job, func, args, kwargs = self._queue.get()
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            self._persist(job)
+            try:
+                job["result"] = func(*args, **kwargs)
+                job["status"] = "done"
+            except Exception as e:
+                print(f"[OCR JOB] {job['id']} failed: {e}")
+                job["error"] = str(e)
+                job["status"] = "failed"
+            finally:
+                job["finished_at"] = time.time()
+                elapsed = job["finished_at"] - job["started_at"]
+                self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+                self._persist(job)
+                job["done"].set()
+                self._queue.task_done()
+
+    def wait(self, job_id, timeout=0):
+        """Block up to timeout seconds for the job to finish; returns its status (or None)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return self._stored_status(job_id)
+        if timeout > 0:
+            job["done"].wait(timeout)
+        return self.status(job_id)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return self._stored_status(job_id)
+        info = {key: job[key] for key in JOB_FIELDS}
+        if job["status"] == "queued":
+            info["queue_depth"] = self._queue.qsize()
+        return info
+
+    def _forget(self, job_id):
+        if self.store is None:
+            return
+        try:
+            self.store.delete(job_id)
+        except sqlite3.Error as e:
+            print(f"[OCR JOB] ⚠ Could not remove job {job_id}: {e}")
+
+    def _stored_status(self, job_id):
+        """A job submitted to another (or a recycled) worker, from the store"""
+        if self.store is None:
+            return None
+        try:
+            return self.store.load(job_id)
+        except sqlite3.Error as e:
+            print(f"[OCR JOB] ⚠ Could not read job {job_id}: {e}")
+            return None
+
+    def retry_after(self):
+        """Seconds until a slot is likely to free up"""
+        backlog = self._queue.qsize() + self.workers
+        return max(1, int(self._avg_seconds * backlog / self.workers))
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job["status"] == "running")
+        return {"workers": self.workers, "queued": self._queue.qsize(),
+                "max_queued": self._queue.maxsize, "running": running,
+                "avg_job_seconds": round(self._avg_seconds, 1)}
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["finished_at"] and job["finished_at"] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if self.store is not None:
+            try:
+                self.store.purge(cutoff)
+            except sqlite3.Error:
+                pass
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Process-wide job queue (created on first use, so forked workers get their own)"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            store = None
+            if OCR_JOB_STORE_ENABLED:
+                try:
+                    store = JobStore()
+                except (OSError, sqlite3.Error) as e:
+                    print(f"[OCR JOB] ⚠ Job store unavailable, jobs are kept in memory only: {e}")
+            _job_queue = OCRJobQueue(store=store)
+        return _job_queue
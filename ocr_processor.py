@@ -6,10 +6,9 @@ Uses Google Gemini AI (primary) with Tesseract OCR (fallback)
 import os
 import re
 import json
-import time
 import base64
-import difflib
-from io import BytesIO
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 try:
     import pytesseract
@@ -41,6 +40,114 @@ from PIL import Image, ImageFilter
 from dotenv import load_dotenv
 load_dotenv()
 
+from medicine_matcher import MedicineMatcher
+from ocr_cache import get_ocr_cache, fingerprint
+from gemini_client import RateLimitedGemini, make_client as make_gemini_client
+from ocr_batcher import GeminiBatcher, OCR_BATCH_WINDOW_MS
+from image_ingest import open_for_ocr
+from prescription_parser import (
+    parse_medicine_details, MEDICINE_SUFFIX_RE, SUFFIX_SKIP_WORDS, OCR_NOISE_RE, WORD_RE
+)
+
+# Tesseract fallback search: parallel passes (each is a tesseract subprocess, so
+# threads are enough) and the quality score at which we stop trying variants
+OCR_TESSERACT_WORKERS = max(1, int(os.getenv('OCR_TESSERACT_WORKERS', 2)))
+OCR_EARLY_EXIT_SCORE = int(os.getenv('OCR_EARLY_EXIT_SCORE', 500))
+TESSERACT_CONFIGS = [
+    '--psm 6 --oem 3',
+    '--psm 4 --oem 3',
+    '--psm 3 --oem 3',
+]
+
+GEMINI_PRESCRIPTION_PROMPT = """Analyze this prescription/medicine image carefully. Extract ALL medicines/drugs found in the image.
+
+Return ONLY a valid JSON array (no markdown, no code blocks, no extra text). Each element is an object for one medicine:
+
+[
+  {
+    "medicine_name": "exact medicine/drug name",
+    "dosage": "numeric dosage value (e.g. 500)",
+    "dosage_unit": "unit like mg, ml, g, mcg",
+    "frequency": "how often to take (e.g. Once daily, Twice daily, Three times daily)",
+    "duration": "number of days as integer",
+    "route": "how to take it (e.g. oral, tablet, capsule, injection, syrup, cream)",
+    "instructions": "any special instructions for THIS medicine",
+    "raw_text": "all readable text from the image (include in first element only)"
+  }
+]
+
+Rules:
+- Extract EVERY medicine/drug listed in the prescription. Do NOT skip any.
+- medicine_name is the MOST IMPORTANT field for each entry.
+- If you see brand names, include them. If you see generic names, include those.
+- For dosage, only include the number (e.g. "500" not "500mg").
+- For duration, convert to days (e.g. "1 week" = 7, "1 month" = 30).
+- If you cannot determine a field, use null.
+- Even if there is only ONE medicine, return it as an array with one element.
+- Return ONLY the JSON array, nothing else."""
+
+
+def parse_gemini_json(response_text):
+    """json.loads a model reply, tolerating markdown code fences around it"""
+    response_text = re.sub(r'^```(?:json)?\s*', '', response_text.strip())
+    response_text = re.sub(r'\s*```$', '', response_text)
+    return json.loads(response_text.strip())
+
+
+_tesseract_executor = None
+_tesseract_executor_lock = threading.Lock()
+
+
+def _get_tesseract_executor():
+    """Shared, bounded pool so concurrent uploads can't fork unlimited tesseracts"""
+    global _tesseract_executor
+    with _tesseract_executor_lock:
+        if _tesseract_executor is None:
+            _tesseract_executor = ThreadPoolExecutor(max_workers=OCR_TESSERACT_WORKERS,
+                                                     thread_name_prefix="tesseract")
+        return _tesseract_executor
+
+
+def _memoize(builder):
+    """Wrap a zero-argument builder so it runs at most once, even across threads"""
+    lock = threading.Lock()
+    result = []
+
+    def build():
+        with lock:
+            if not result:
+                result.append(builder())
+            return result[0]
+    return build
+
+
+def _otsu_threshold(histogram):
+    """Otsu's threshold from a 256-bin grayscale histogram: the level that
+    maximizes between-class variance of dark (<= t) and light (> t) pixels"""
+    total = sum(histogram)
+    if not total:
+        return 127
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    weight_dark = 0
+    sum_dark = 0
+    best_threshold = 127
+    best_variance = -1.0
+    for t in range(256):
+        weight_dark += histogram[t]
+        if weight_dark == 0:
+            continue
+        weight_light = total - weight_dark
+        if weight_light == 0:
+            break
+        sum_dark += t * histogram[t]
+        mean_dark = sum_dark / weight_dark
+        mean_light = (sum_all - sum_dark) / weight_light
+        variance = weight_dark * weight_light * (mean_dark - mean_light) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = t
+    return best_threshold
+
 # Common medicine names for matching against OCR text (extensive list)
 KNOWN_MEDICINES = [
     # Analgesics / Anti-inflammatory
@@ -97,6 +204,9 @@ KNOWN_MEDICINES = [
     "melatonin", "biotin", "zinc", "magnesium",
 ]
 
+# Precompiled exact + fuzzy lookups over KNOWN_MEDICINES
+MEDICINE_MATCHER = MedicineMatcher(KNOWN_MEDICINES)
+
 class PrescriptionOCR:
     """Handle prescription image extraction using AI (Gemini) + Tesseract fallback"""
     
@@ -115,7 +225,7 @@ class PrescriptionOCR:
         api_key = os.environ.get('GEMINI_API_KEY', '')
         if GEMINI_AVAILABLE and api_key:
             try:
-                self.gemini_client = genai.Client(api_key=api_key)
+                self.gemini_client = make_gemini_client(api_key)
                 self.gemini_available = True
                 print("[OCR] ✓ Gemini AI initialized successfully")
             except Exception as e:
@@ -133,7 +243,7 @@ class PrescriptionOCR:
         api_key = os.environ.get('GEMINI_API_KEY', '')
         if GEMINI_AVAILABLE and api_key:
             try:
-                self.gemini_client = genai.Client(api_key=api_key)
+                self.gemini_client = make_gemini_client(api_key)
                 self.gemini_available = True
                 print("[OCR] ✓ Gemini AI (re)initialized successfully")
                 return True
@@ -141,6 +251,24 @@ class PrescriptionOCR:
                 print(f"[OCR] ⚠ Gemini lazy-init failed: {e}")
         return False
 
+    def _rate_limited_gemini(self):
+        """Rate-limit-aware wrapper around the current Gemini client"""
+        wrapper = getattr(self, '_gemini_wrapper', None)
+        if wrapper is None or wrapper.client is not self.gemini_client:
+            wrapper = RateLimitedGemini(self.gemini_client)
+            self._gemini_wrapper = wrapper
+        return wrapper
+
+    def _gemini_batcher(self):
+        """Micro-batcher that folds concurrent uploads into multi-image Gemini calls"""
+        batcher = getattr(self, '_batcher', None)
+        gemini = self._rate_limited_gemini()
+        if batcher is None or batcher.gemini is not gemini:
+            batcher = GeminiBatcher(gemini, GEMINI_PRESCRIPTION_PROMPT, parse_gemini_json,
+                                    self._prescriptions_from_gemini, self._extract_with_gemini)
+            self._batcher = batcher
+        return batcher
+
     def _resize_image(self, image, max_dimension=1600):
         """Resize image to prevent OOM on free-tier hosting (512MB RAM)."""
         w, h = image.size
@@ -160,15 +288,12 @@ class PrescriptionOCR:
 
     def extract_from_image(self, image_path_or_bytes):
         """Extract ALL prescription data from image using Gemini AI (primary) or Tesseract (fallback).
+        Accepts a file path, bytes or a binary file object.
         Returns a list of prescription dicts (one per medicine found)."""
         try:
-            # Load image
-            if isinstance(image_path_or_bytes, str):
-                image = Image.open(image_path_or_bytes)
-            elif isinstance(image_path_or_bytes, bytes):
-                image = Image.open(BytesIO(image_path_or_bytes))
-            else:
-                image = Image.open(BytesIO(image_path_or_bytes))
+            # Load image (path, bytes or file object), decoding large JPEGs at a
+            # reduced scale so the full-resolution bitmap never sits in memory
+            image = open_for_ocr(image_path_or_bytes, max_dimension=1600)
             
             # Free raw bytes immediately to save memory
             image_path_or_bytes = None
@@ -178,13 +303,30 @@ class PrescriptionOCR:
             
             print(f"[OCR] Input image: size={image.size}, mode={image.mode}")
             
+            # === Re-uploads of the same photo are answered from the result cache ===
+            cache = get_ocr_cache()
+            cache_key = None
+            if cache:
+                try:
+                    cache_key = fingerprint(image)
+                    cached = cache.get(*cache_key)
+                    if cached:
+                        print(f"[OCR] ✓ Cache hit: {len(cached)} medicine(s)")
+                        return cached
+                except Exception as cache_err:
+                    print(f"[OCR] ⚠ Result cache lookup failed: {cache_err}")
+                    cache_key = None
+            
             # === PRIMARY: Try Gemini AI ===
             self._ensure_gemini()  # Re-check in case key was set after startup
             gemini_error = None
             if self.gemini_available:
                 print("[OCR] Using Gemini AI for prescription analysis...")
                 try:
-                    results = self._extract_with_gemini(image)
+                    if OCR_BATCH_WINDOW_MS > 0:
+                        results = self._gemini_batcher().extract(image)
+                    else:
+                        results = self._extract_with_gemini(image)
                 except Exception as gemini_err:
                     print(f"[OCR] Gemini exception: {gemini_err}")
                     gemini_error = str(gemini_err)
@@ -195,11 +337,13 @@ class PrescriptionOCR:
                         r["ocr_engine"] = "gemini-ai"
                     names = [r.get('medicine_name', '?') for r in results]
                     print(f"[OCR] ✓ Gemini extracted {len(results)} medicine(s): {', '.join(names)}")
+                    self._cache_results(cache, cache_key, results)
                     return results
                 elif results and isinstance(results, dict) and results.get("medicine_name"):
                     # Legacy single-dict fallback
                     results["ocr_engine"] = "gemini-ai"
                     print(f"[OCR] ✓ Gemini extracted medicine: {results.get('medicine_name')}")
+                    self._cache_results(cache, cache_key, [results])
                     return [results]
                 else:
                     gemini_error = gemini_error or "Could not read medicines from this image"
@@ -239,124 +383,40 @@ class PrescriptionOCR:
                 "requires_manual_confirmation": True
             }]
     
+    def _cache_results(self, cache, cache_key, results):
+        """Store a successful Gemini extraction. Tesseract output is not cached:
+        it usually means Gemini was rate-limited, and a later upload should get
+        the better answer rather than a pinned fallback."""
+        if not cache or not cache_key:
+            return
+        if any(r.get("error") for r in results):
+            return
+        try:
+            cache.put(cache_key[0], cache_key[1], results)
+        except Exception as cache_err:
+            print(f"[OCR] ⚠ Result cache store failed: {cache_err}")
+    
     # ================================================================
     # GEMINI AI EXTRACTION
     # ================================================================
     def _extract_with_gemini(self, image):
         """Use Google Gemini AI to analyze prescription image and extract ALL medicines as a list"""
+        response_text = None
         try:
-            prompt = """Analyze this prescription/medicine image carefully. Extract ALL medicines/drugs found in the image.
-
-Return ONLY a valid JSON array (no markdown, no code blocks, no extra text). Each element is an object for one medicine:
-
-[
-  {
-    "medicine_name": "exact medicine/drug name",
-    "dosage": "numeric dosage value (e.g. 500)",
-    "dosage_unit": "unit like mg, ml, g, mcg",
-    "frequency": "how often to take (e.g. Once daily, Twice daily, Three times daily)",
-    "duration": "number of days as integer",
-    "route": "how to take it (e.g. oral, tablet, capsule, injection, syrup, cream)",
-    "instructions": "any special instructions for THIS medicine",
-    "raw_text": "all readable text from the image (include in first element only)"
-  }
-]
-
-Rules:
-- Extract EVERY medicine/drug listed in the prescription. Do NOT skip any.
-- medicine_name is the MOST IMPORTANT field for each entry.
-- If you see brand names, include them. If you see generic names, include those.
-- For dosage, only include the number (e.g. "500" not "500mg").
-- For duration, convert to days (e.g. "1 week" = 7, "1 month" = 30).
-- If you cannot determine a field, use null.
-- Even if there is only ONE medicine, return it as an array with one element.
-- Return ONLY the JSON array, nothing else."""
-
-            # Try multiple models — if one is rate-limited, wait and try another
-            models_to_try = ['gemini-2.5-flash', 'gemini-2.0-flash', 'gemini-2.0-flash-lite']
-            response_text = None
-            last_error = None
-            
-            for i, model_name in enumerate(models_to_try):
-                try:
-                    if i > 0:
-                        print(f"[OCR] Waiting 5s before trying next model...")
-                        time.sleep(5)
-                    print(f"[OCR] Trying model: {model_name}")
-                    response = self.gemini_client.models.generate_content(
-                        model=model_name,
-                        contents=[prompt, image]
-                    )
-                    response_text = response.text.strip()
-                    print(f"[OCR] ✓ Success with model: {model_name}")
-                    break  # Success
-                except Exception as model_err:
-                    err_str = str(model_err)
-                    last_error = err_str
-                    print(f"[OCR] {model_name} failed: {err_str[:200]}")
-                    if '429' in err_str or 'RESOURCE_EXHAUSTED' in err_str:
-                        print(f"[OCR] {model_name} rate-limited, trying next model...")
-                        continue
-                    else:
-                        raise model_err  # Non-rate-limit error, don't retry
+            # The shared scheduler picks a model with capacity (token bucket per
+            # model, cooldown after 429s) instead of walking the list with sleeps
+            response, model_name = self._rate_limited_gemini().generate_content([GEMINI_PRESCRIPTION_PROMPT, image])
+            response_text = response.text.strip()
             
             # Free image from memory after Gemini call
             image = None
             
-            if response_text is None:
-                print(f"[OCR] All Gemini models rate-limited. Last error: {last_error}")
-                raise Exception("All Gemini models are rate-limited. Please wait a few minutes and try again.")
-            
             print(f"[OCR] Gemini raw response: {response_text[:800]}")
             
             # Store raw response for debugging
             self._last_raw_response = response_text[:1000]
             
-            # Clean response - remove markdown code blocks if present
-            response_text = re.sub(r'^```(?:json)?\s*', '', response_text)
-            response_text = re.sub(r'\s*```$', '', response_text)
-            response_text = response_text.strip()
-            
-            # Parse JSON
-            data = json.loads(response_text)
-            
-            # Handle both array and single-object responses
-            if isinstance(data, dict):
-                data = [data]  # Wrap single object in array
-            
-            if not isinstance(data, list) or len(data) == 0:
-                print(f"[OCR] Gemini returned unexpected data type: {type(data)}")
-                raise Exception(f"Gemini returned empty or invalid data. Raw: {response_text[:200]}")
-            
-            prescriptions = []
-            for i, med in enumerate(data):
-                prescription = {
-                    "medicine_name": med.get("medicine_name"),
-                    "dosage": str(med["dosage"]) if med.get("dosage") else None,
-                    "dosage_unit": med.get("dosage_unit", "mg"),
-                    "frequency": med.get("frequency", "Once daily"),
-                    "duration": int(med["duration"]) if med.get("duration") else 30,
-                    "route": med.get("route", "oral"),
-                    "raw_text": med.get("raw_text", "") if i == 0 else "",
-                    "extraction_notes": [],
-                    "instructions": med.get("instructions"),
-                    "special_instructions": med.get("special_instructions"),
-                    "ocr_confidence": 0.9 if med.get("medicine_name") else 0.3,
-                    "requires_manual_confirmation": not bool(med.get("medicine_name")),
-                }
-                
-                if not prescription["medicine_name"]:
-                    prescription["extraction_notes"].append("AI could not identify medicine name - please enter manually")
-                if not prescription["dosage"]:
-                    prescription["extraction_notes"].append("Dosage unclear - please confirm")
-                if prescription["extraction_notes"]:
-                    prescription["requires_manual_confirmation"] = True
-                
-                prescriptions.append(prescription)
-            
-            # Filter out entries with no medicine name (noise)
-            valid = [p for p in prescriptions if p.get("medicine_name")]
-            return valid if valid else prescriptions[:1]  # Return at least one entry
+            return self._prescriptions_from_gemini(parse_gemini_json(response_text))
             
         except json.JSONDecodeError as e:
             print(f"[OCR] Gemini JSON parse error: {e}")
@@ -366,6 +426,47 @@ Rules:
             print(f"[OCR] Gemini error: {e}")
             raise  # Re-raise so caller gets the actual error message
     
+    def _prescriptions_from_gemini(self, data):
+        """Turn Gemini's parsed JSON (array of medicine objects, or one object)
+        into prescription dicts"""
+        # Handle both array and single-object responses
+        if isinstance(data, dict):
+            data = [data]  # Wrap single object in array
+        
+        if not isinstance(data, list) or len(data) == 0:
+            print(f"[OCR] Gemini returned unexpected data type: {type(data)}")
+            raise Exception(f"Gemini returned empty or invalid data. Raw: {str(data)[:200]}")
+        
+        prescriptions = []
+        for i, med in enumerate(data):
+            prescription = {
+                "medicine_name": med.get("medicine_name"),
+                "dosage": str(med["dosage"]) if med.get("dosage") else None,
+                "dosage_unit": med.get("dosage_unit", "mg"),
+                "frequency": med.get("frequency", "Once daily"),
+                "duration": int(med["duration"]) if med.get("duration") else 30,
+                "route": med.get("route", "oral"),
+                "raw_text": med.get("raw_text", "") if i == 0 else "",
+                "extraction_notes": [],
+                "instructions": med.get("instructions"),
+                "special_instructions": med.get("special_instructions"),
+                "ocr_confidence": 0.9 if med.get("medicine_name") else 0.3,
+                "requires_manual_confirmation": not bool(med.get("medicine_name")),
+            }
+
+            if not prescription["medicine_name"]:
+                prescription["extraction_notes"].append("AI could not identify medicine name - please enter manually")
+            if not prescription["dosage"]:
+                prescription["extraction_notes"].append("Dosage unclear - please confirm")
+            if prescription["extraction_notes"]:
+                prescription["requires_manual_confirmation"] = True
+
+            prescriptions.append(prescription)
+
+        # Filter out entries with no medicine name (noise)
+        valid = [p for p in prescriptions if p.get("medicine_name")]
+        return valid if valid else prescriptions[:1]  # Return at least one entry
+    
     def _parse_gemini_text_fallback(self, text):
         """If Gemini returns non-JSON text, try to extract medicine name from it"""
         if not text:
@@ -393,32 +494,77 @@ Rules:
     # ================================================================
     # TESSERACT OCR EXTRACTION (Fallback)
     # ================================================================
+    # (variant label, tesseract config) -> times it produced the best text.
+    # Shared by all instances so the search order adapts to the images we get.
+    _variant_wins = {}
+    _variant_wins_lock = threading.Lock()
+
+    def _ordered_tesseract_candidates(self, labels):
+        """All (label, config) pairs, historically best first (stable for ties)"""
+        candidates = [(label, cfg) for label in labels for cfg in TESSERACT_CONFIGS]
+        with self._variant_wins_lock:
+            wins = dict(self._variant_wins)
+        return sorted(candidates, key=lambda c: -wins.get(c, 0))
+
+    def _record_tesseract_win(self, label, cfg):
+        with self._variant_wins_lock:
+            key = (label, cfg)
+            self._variant_wins[key] = self._variant_wins.get(key, 0) + 1
+
+    def _run_tesseract(self, build_variant, cfg):
+        text = pytesseract.image_to_string(build_variant(), config=cfg)
+        return text, self._text_quality_score(text)
+
     def _extract_with_tesseract(self, image):
         """Use Tesseract OCR + regex parsing as fallback. Returns a LIST of prescription dicts."""
         text = ""
         if self.tesseract_available:
-            variants = self._get_image_variants(image)
-            configs = [
-                '--psm 6 --oem 3',
-                '--psm 4 --oem 3',
-                '--psm 3 --oem 3',
-            ]
+            variants = dict(self._get_image_variants(image))
+            candidates = self._ordered_tesseract_candidates(variants.keys())
             best_text = ""
             best_score = -1
-            best_label = ""
-            for label, img_variant in variants:
-                for cfg in configs:
+            best_candidate = None
+            passes = 0
+
+            # Keep at most OCR_TESSERACT_WORKERS passes in flight and stop
+            # submitting as soon as one clears OCR_EARLY_EXIT_SCORE
+            executor = _get_tesseract_executor()
+            pending = {}
+            queue = iter(candidates)
+            while True:
+                while len(pending) < OCR_TESSERACT_WORKERS and best_score < OCR_EARLY_EXIT_SCORE:
+                    candidate = next(queue, None)
+                    if candidate is None:
+                        break
+                    label, cfg = candidate
+                    pending[executor.submit(self._run_tesseract, variants[label], cfg)] = candidate
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    candidate = pending.pop(future)
+                    passes += 1
                     try:
-                        t = pytesseract.image_to_string(img_variant, config=cfg)
-                        score = self._text_quality_score(t)
-                        if score > best_score:
-                            best_score = score
-                            best_text = t
-                            best_label = f"{label}+{cfg}"
+                        t, score = future.result()
                     except Exception:
                         continue
+                    if score > best_score:
+                        best_score = score
+                        best_text = t
+                        best_candidate = candidate
+                if best_score >= OCR_EARLY_EXIT_SCORE:
+                    # Don't wait for passes still running; their results are discarded
+                    for future in pending:
+                        future.cancel()
+                    break
+
             text = best_text if best_text else ""
-            print(f"[OCR] Tesseract best variant: {best_label} (score={best_score})")
+            best_label = ""
+            if best_candidate:
+                self._record_tesseract_win(*best_candidate)
+                best_label = f"{best_candidate[0]}+{best_candidate[1]}"
+            print(f"[OCR] Tesseract best variant: {best_label} (score={best_score}, "
+                  f"{passes}/{len(candidates)} passes)")
             print(f"[OCR] Raw text ({len(text)} chars): {repr(text[:300])}")
         
         # Extract ALL medicines from the text
@@ -447,80 +593,70 @@ Rules:
         for kw in keywords:
             if kw in text_lower:
                 score += 50
-        for med in KNOWN_MEDICINES:
-            if med in text_lower:
-                score += 200
+        score += 200 * len(MEDICINE_MATCHER.find_exact(text_lower))
         return score
 
     def _get_image_variants(self, image):
-        """Generate multiple preprocessed variants of the image for OCR.
+        """Describe the preprocessed variants of the image to try with OCR.
         Different images respond better to different preprocessing.
-        Returns list of (label, image) tuples."""
-        from PIL import ImageEnhance, ImageOps
+        Returns a list of (label, builder) pairs; builder() renders the variant
+        on first use (thread-safe, memoized), so variants the search never
+        reaches are never built. All variants share one upscaled grayscale base."""
+        from PIL import ImageEnhance, ImageOps, ImageStat
         
-        variants = []
-        
-        # Convert to RGB first if necessary (handles RGBA, palette, etc.)
-        if image.mode not in ('RGB', 'L'):
-            image = image.convert('RGB')
-        
-        # Upscale small images — Tesseract works best at 300+ DPI
-        width, height = image.size
+        # Grayscale first, then upscale — a third of the pixels to resample
+        # compared with scaling RGB. Tesseract works best at 300+ DPI.
+        gray = image.convert('L')
+        width, height = gray.size
         if width < 1500 or height < 1500:
             scale = max(1500 / width, 1500 / height, 2.0)
             scale = min(scale, 4.0)  # Don't upscale more than 4x
             new_size = (int(width * scale), int(height * scale))
-            image = image.resize(new_size, Image.LANCZOS)
+            gray = gray.resize(new_size, Image.LANCZOS)
+        
+        # Autocontrast (cutoff=2) is shared by the binarized and inverted variants
+        autocontrast2 = _memoize(lambda: ImageOps.autocontrast(gray, cutoff=2))
         
         # === Variant 1: Grayscale with moderate contrast (gentle) ===
-        gray = image.convert('L')
-        enhanced = ImageEnhance.Contrast(gray).enhance(1.5)
-        enhanced = ImageEnhance.Sharpness(enhanced).enhance(2.0)
-        variants.append(('gentle', enhanced))
+        def gentle():
+            enhanced = ImageEnhance.Contrast(gray).enhance(1.5)
+            return ImageEnhance.Sharpness(enhanced).enhance(2.0)
         
         # === Variant 2: High-contrast grayscale with autocontrast ===
-        gray2 = image.convert('L')
-        gray2 = ImageOps.autocontrast(gray2, cutoff=1)
-        gray2 = ImageEnhance.Contrast(gray2).enhance(2.0)
-        gray2 = ImageEnhance.Sharpness(gray2).enhance(2.0)
-        variants.append(('high_contrast', gray2))
-        
-        # === Variant 3: Adaptive binarization (for clean printed text) ===
-        gray3 = image.convert('L')
-        gray3 = ImageOps.autocontrast(gray3, cutoff=2)
-        gray3 = ImageEnhance.Contrast(gray3).enhance(2.5)
-        # Use Otsu-style: compute mean pixel and use as threshold
-        import statistics
-        pixels = list(gray3.getdata())
-        try:
-            mean_val = statistics.mean(pixels)
-        except Exception:
-            mean_val = 128
-        threshold = int(mean_val * 0.85)  # Slightly below mean for dark text on light bg
-        gray3 = gray3.point(lambda x: 255 if x > threshold else 0, '1')
-        gray3 = gray3.convert('L')
-        gray3 = gray3.filter(ImageFilter.MedianFilter(size=3))
-        variants.append(('binarized', gray3))
+        def high_contrast():
+            gray2 = ImageOps.autocontrast(gray, cutoff=1)
+            gray2 = ImageEnhance.Contrast(gray2).enhance(2.0)
+            return ImageEnhance.Sharpness(gray2).enhance(2.0)
+        
+        # === Variant 3: Otsu binarization (for clean printed text) ===
+        def binarized():
+            gray3 = ImageEnhance.Contrast(autocontrast2()).enhance(2.5)
+            threshold = _otsu_threshold(gray3.histogram())
+            gray3 = gray3.point([255 if x > threshold else 0 for x in range(256)])
+            return gray3.filter(ImageFilter.MedianFilter(size=3))
         
         # === Variant 4: Inverted (for light text on dark background) ===
-        gray4 = image.convert('L')
-        gray4 = ImageOps.autocontrast(gray4, cutoff=2)
-        # Check if image is mostly dark (inverted prescription)
-        avg_pixel = statistics.mean(list(gray4.getdata()))
-        if avg_pixel < 128:  # Mostly dark — invert it
-            gray4 = ImageOps.invert(gray4)
-            gray4 = ImageEnhance.Contrast(gray4).enhance(2.0)
-            variants.append(('inverted', gray4))
+        def inverted():
+            gray4 = ImageOps.invert(autocontrast2())
+            return ImageEnhance.Contrast(gray4).enhance(2.0)
         
         # === Variant 5: Aggressive sharpen + denoise ===
-        gray5 = image.convert('L')
-        gray5 = gray5.filter(ImageFilter.SHARPEN)
-        gray5 = gray5.filter(ImageFilter.SHARPEN)
-        gray5 = ImageEnhance.Contrast(gray5).enhance(2.0)
-        gray5 = ImageEnhance.Brightness(gray5).enhance(1.1)
-        gray5 = ImageOps.autocontrast(gray5, cutoff=3)
-        variants.append(('sharp', gray5))
-        
+        def sharp():
+            gray5 = gray.filter(ImageFilter.SHARPEN)
+            gray5 = gray5.filter(ImageFilter.SHARPEN)
+            gray5 = ImageEnhance.Contrast(gray5).enhance(2.0)
+            gray5 = ImageEnhance.Brightness(gray5).enhance(1.1)
+            return ImageOps.autocontrast(gray5, cutoff=3)
+        
+        variants = [
+            ('gentle', _memoize(gentle)),
+            ('high_contrast', _memoize(high_contrast)),
+            ('binarized', _memoize(binarized)),
+        ]
+        # Only worth trying inversion when the page is mostly dark
+        if ImageStat.Stat(autocontrast2()).mean[0] < 128:
+            variants.append(('inverted', _memoize(inverted)))
+        variants.append(('sharp', _memoize(sharp)))
         return variants
     
     def _find_all_medicine_names(self, text):
@@ -530,29 +666,27 @@ Rules:
             return []
         
         text_lower = text.lower()
-        text_cleaned = re.sub(r'[|{}\[\]~`]', '', text_lower)
+        text_cleaned = OCR_NOISE_RE.sub('', text_lower)
         text_no_spaces = text_cleaned.replace(' ', '')
         found = []  # list of (name, position)
         found_lower = set()  # track what we've already found
         
         # Strategy 1: Exact match against known medicine database
+        exact = MEDICINE_MATCHER.find_exact(text_cleaned)
         for med in KNOWN_MEDICINES:
-            pos = text_cleaned.find(med)
-            if pos >= 0 and med not in found_lower:
-                found.append((med.capitalize(), pos))
+            if med in exact:
+                found.append((med.capitalize(), exact[med]))
                 found_lower.add(med)
         
         # Strategy 2: No-spaces match (OCR often splits words like "Met formin")
+        joined = MEDICINE_MATCHER.find_exact(text_no_spaces)
         for med in KNOWN_MEDICINES:
-            if med in found_lower:
-                continue
-            pos = text_no_spaces.find(med)
-            if pos >= 0:
-                found.append((med.capitalize(), pos))
+            if med in joined and med not in found_lower:
+                found.append((med.capitalize(), joined[med]))
                 found_lower.add(med)
         
         # Strategy 3: Fuzzy match words and word-pairs against known medicines
-        words = re.findall(r'[a-zA-Z]{2,}', text_cleaned)
+        words = WORD_RE.findall(text_cleaned)
         candidates = []
         for i, w in enumerate(words):
             candidates.append((w, i))
@@ -560,26 +694,18 @@ Rules:
                 candidates.append((w + words[i+1], i))
         
         for candidate, word_idx in candidates:
-            for med in KNOWN_MEDICINES:
-                if med in found_lower:
-                    continue
-                ratio = difflib.SequenceMatcher(None, candidate.lower(), med).ratio()
-                if ratio >= 0.80:
-                    # Approximate position from word index
-                    found.append((med.capitalize(), word_idx * 10))
-                    found_lower.add(med)
+            for med in MEDICINE_MATCHER.fuzzy_matches(candidate.lower(), 0.80, exclude=found_lower):
+                # Approximate position from word index
+                found.append((med.capitalize(), word_idx * 10))
+                found_lower.add(med)
         
         # Strategy 4: Medicine-suffix words (e.g. ending in -in, -ol, -ide, etc.)
-        med_suffix_re = r'\b([A-Za-z]{3,}(?:in|ol|ne|ide|ate|ine|one|cin|lin|min|pril|tan|pine|fen|lol|vir|zole|mab|nib|lam|pam|done|phil|mide|oxin|tide|arin|ulin|zide|sone))\b'
-        skip_words_lower = {'medicine', 'online', 'routine', 'determine', 'combine', 'examine',
-                            'define', 'decline', 'information', 'prescription', 'substitution',
-                            'permission', 'written'}
-        for m in re.finditer(med_suffix_re, text, re.IGNORECASE):
+        for m in MEDICINE_SUFFIX_RE.finditer(text):
             word = m.group(1)
-            if word.lower() in skip_words_lower or word.lower() in found_lower or len(word) < 4:
+            if word.lower() in SUFFIX_SKIP_WORDS or word.lower() in found_lower or len(word) < 4:
                 continue
-            close = difflib.get_close_matches(word.lower(), KNOWN_MEDICINES, n=1, cutoff=0.6)
-            name = close[0].capitalize() if close else word.capitalize()
+            close = MEDICINE_MATCHER.best_match(word.lower(), cutoff=0.6)
+            name = close.capitalize() if close else word.capitalize()
             if name.lower() not in found_lower:
                 found.append((name, m.start()))
                 found_lower.add(name.lower())
@@ -588,89 +714,6 @@ Rules:
         found.sort(key=lambda x: x[1])
         return found
     
-    def _extract_context_near(self, text, medicine_name, window=200):
-        """Extract text near a medicine name for parsing dosage/frequency/etc."""
-        text_lower = text.lower()
-        med_lower = medicine_name.lower()
-        pos = text_lower.find(med_lower)
-        if pos < 0:
-            # Try without spaces
-            pos = text_lower.replace(' ', '').find(med_lower)
-            if pos < 0:
-                return text  # Fallback: use full text
-        start = max(0, pos - 30)  # A little before
-        end = min(len(text), pos + len(medicine_name) + window)
-        return text[start:end]
-    
-    def _parse_dosage_freq_duration(self, context_text):
-        """Parse dosage, frequency, duration, and route from a text snippet."""
-        result = {"dosage": None, "dosage_unit": None, "frequency": None, "duration": None, "route": None}
-        
-        # Dosage
-        dosage_match = re.search(
-            r'(\d+(?:\.\d+)?)\s*(mg|ml|g|microgram|mcg|%|unit|IU)',
-            context_text, re.IGNORECASE
-        )
-        if dosage_match:
-            result["dosage"] = dosage_match.group(1)
-            result["dosage_unit"] = dosage_match.group(2).lower()
-        
-        # Frequency
-        frequency_patterns = [
-            (r'once\s+(?:a\s+)?(?:day|daily)', 'Once daily'),
-            (r'twice\s+(?:a\s+)?(?:day|daily)', 'Twice daily'),
-            (r'three\s+times\s+(?:a\s+)?(?:day|daily)', 'Three times daily'),
-            (r'(?:1|one)\s*(?:x|time)\s*(?:a\s+)?(?:day|daily)', 'Once daily'),
-            (r'(?:2|two)\s*(?:x|times?)\s*(?:a\s+)?(?:day|daily)', 'Twice daily'),
-            (r'(?:3|three)\s*(?:x|times?)\s*(?:a\s+)?(?:day|daily)', 'Three times daily'),
-            (r'every\s+(\d+)\s+hours?', 'Every \\1 hours'),
-            (r'morning\s+(?:and|&)\s+evening', 'Twice daily'),
-            (r'morning\s+(?:and|&)\s+night', 'Twice daily'),
-            (r'at\s+bedtime', 'At bedtime'),
-            (r'(\d+)\s+times\s+(?:a\s+)?(?:day|daily)', '\\1 times daily'),
-            (r'\b(?:bd|bid|b\.?\s*d\.?)\b', 'Twice daily'),
-            (r'\b(?:tds|tid|t\.?\s*d\.?\s*s\.?)\b', 'Three times daily'),
-            (r'\b(?:od|o\.?\s*d\.?)\b', 'Once daily'),
-            (r'\b(?:qid|q\.?\s*i\.?\s*d\.?)\b', 'Every 6 hours'),
-            (r'\b(?:qhs|h\.?\s*s\.?)\b', 'At bedtime'),
-            (r'\b(?:prn|p\.?\s*r\.?\s*n\.?)\b', 'As needed'),
-            (r'\btwice\b', 'Twice daily'),
-            (r'\bdaily\b', 'Once daily'),
-        ]
-        for pattern, replacement in frequency_patterns:
-            match = re.search(pattern, context_text, re.IGNORECASE)
-            if match:
-                freq = replacement
-                if '\\1' in freq and match.groups():
-                    freq = freq.replace('\\1', match.group(1))
-                result["frequency"] = freq
-                break
-        
-        # Duration
-        duration_match = re.search(
-            r'(?:for|x|duration)?\s*(\d+)\s+(?:days?|weeks?|months?)',
-            context_text, re.IGNORECASE
-        )
-        if duration_match:
-            days = int(duration_match.group(1))
-            if 'week' in duration_match.group(0).lower():
-                days *= 7
-            elif 'month' in duration_match.group(0).lower():
-                days *= 30
-            result["duration"] = days
-        
-        # Route
-        route_match = re.search(
-            r'\b(oral|tablet|tab|capsule|cap|injection|inj|intravenous|IV|topical|cream|ointment|drops|syrup|inhaler|patch|sublingual)\b',
-            context_text, re.IGNORECASE
-        )
-        if route_match:
-            route_map = {'tab': 'tablet', 'cap': 'capsule', 'inj': 'injection'}
-            route = route_match.group(1).lower()
-            result["route"] = route_map.get(route, route)
-        
-        return result
-    
     def _extract_all_medicines_from_text(self, text):
         """Extract ALL medicines from OCR text, returning a list of prescription dicts."""
         if not text or len(text.strip()) < 2:
@@ -705,11 +748,9 @@ Rules:
             }]
         
         results = []
-        for i, (med_name, _pos) in enumerate(medicine_hits):
-            # Get text context near this medicine for parsing details
-            context = self._extract_context_near(text, med_name)
-            details = self._parse_dosage_freq_duration(context)
-            
+        # One tokenization of the text; each medicine reads the details near its name
+        all_details = parse_medicine_details(text, [name for name, _pos in medicine_hits])
+        for i, ((med_name, _pos), details) in enumerate(zip(medicine_hits, all_details)):
             notes = []
             if not details["dosage"]:
                 notes.append("Dosage unclear - please confirm")
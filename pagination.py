@@ -0,0 +1,102 @@
+"""
+Keyset Pagination
+Listing endpoints page through a user's rows newest-first by a unique key such
+as (reminder_time, id): each page continues strictly after the last row of
+the previous one, so with an index on (user_id, <key>) a deep page costs the
+same as the first and rows inserted meanwhile neither repeat nor go missing.
+
+The position is handed to clients as an opaque cursor (base64 JSON naming the
+listing and the key values). Pass it back as ?cursor= with an optional
+?limit= (API_PAGE_SIZE by default, at most API_PAGE_SIZE_MAX).
+"""
+
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+API_PAGE_SIZE = max(1, int(os.getenv('API_PAGE_SIZE', 50)))
+API_PAGE_SIZE_MAX = max(API_PAGE_SIZE, int(os.getenv('API_PAGE_SIZE_MAX', 200)))
+
+# Key column types: how values go into the cursor and back
+_ENCODERS = {"timestamp": lambda value: value.isoformat(), "int": int}
+_DECODERS = {"timestamp": datetime.fromisoformat, "int": int}
+
+
+class InvalidPageRequest(ValueError):
+    """Malformed or foreign cursor, or a bad limit"""
+
+
+class Keyset:
+    """The key one listing is ordered and paged by: [(sql_expression, type)],
+    the last column unique (normally the id)"""
+
+    def __init__(self, name, columns, descending=True):
+        self.name = name
+        self.columns = columns
+        self.descending = descending
+
+    def condition(self):
+        """SQL for 'after the cursor position', taking the decoded values as parameters"""
+        names = ", ".join(column for column, _ in self.columns)
+        values = ", ".join(f"%s::{kind}" for _, kind in self.columns)
+        return f"({names}) {'<' if self.descending else '>'} ({values})"
+
+    def order_by(self):
+        direction = " DESC" if self.descending else ""
+        return ", ".join(column + direction for column, _ in self.columns)
+
+    def encode(self, values):
+        payload = {"k": self.name, "v": [_ENCODERS[kind](value) for (_, kind), value in zip(self.columns, values)]}
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+    def decode(self, token):
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            payload = json.loads(raw)
+            if payload["k"] != self.name or len(payload["v"]) != len(self.columns):
+                raise InvalidPageRequest(f"cursor is not for {self.name}")
+            return [_DECODERS[kind](value) for (_, kind), value in zip(self.columns, payload["v"])]
+        except InvalidPageRequest:
+            raise
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError):
+            raise InvalidPageRequest("invalid cursor")
+
+
+def page_params(args):
+    """(cursor, limit) from request args"""
+    limit = args.get("limit")
+    try:
+        limit = API_PAGE_SIZE if limit in (None, "") else int(limit)
+    except ValueError:
+        raise InvalidPageRequest("limit must be an integer")
+    if limit < 1:
+        raise InvalidPageRequest("limit must be at least 1")
+    return args.get("cursor") or None, min(limit, API_PAGE_SIZE_MAX)
+
+
+def fetch_page(cursor, keyset, query, params, key, after=None, limit=API_PAGE_SIZE):
+    """Run one page of a listing query.
+
+    query is a SELECT without ORDER BY / LIMIT whose WHERE clause contains
+    {keyset}, placed after every other %s parameter. key(row) returns the
+    row's keyset values. Returns (rows, next_cursor); next_cursor is None on
+    the last page."""
+    values = keyset.decode(after) if after else []
+    sql = query.format(keyset=keyset.condition() if after else "TRUE")
+    cursor.execute(f"{sql} ORDER BY {keyset.order_by()} LIMIT %s", list(params) + values + [limit + 1])
+    rows = cursor.fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, keyset.encode(key(rows[-1]))
+
+
+def page_info(next_cursor, limit):
+    """Pagination fields for a listing response"""
+    return {"next_cursor": next_cursor, "has_more": next_cursor is not None, "limit": limit}
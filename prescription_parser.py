@@ -0,0 +1,145 @@
+"""
+Prescription Text Parser
+Pulls dosage, frequency, duration and route out of OCR text for every medicine
+found in it. All patterns are compiled once at import; the text is tokenized in
+a single pass by one master regex (dosage | frequency rules | duration | route,
+each a named group), and each medicine then takes the first tokens that fall
+inside its context window instead of re-running every regex on its snippet.
+
+Frequency rules keep their priority: when several appear near a medicine, the
+rule listed first in FREQUENCY_RULES wins, whatever its position.
+"""
+
+import re
+from collections import namedtuple
+
+# Token patterns are matched against lowercased text.
+# (pattern, label) in priority order. A (?P<n>...) group fills {n} in the label.
+FREQUENCY_RULES = [
+    (r'once\s+(?:a\s+)?(?:day|daily)', 'Once daily'),
+    (r'twice\s+(?:a\s+)?(?:day|daily)', 'Twice daily'),
+    (r'three\s+times\s+(?:a\s+)?(?:day|daily)', 'Three times daily'),
+    (r'(?:1|one)\s*(?:x|time)\s*(?:a\s+)?(?:day|daily)', 'Once daily'),
+    (r'(?:2|two)\s*(?:x|times?)\s*(?:a\s+)?(?:day|daily)', 'Twice daily'),
+    (r'(?:3|three)\s*(?:x|times?)\s*(?:a\s+)?(?:day|daily)', 'Three times daily'),
+    (r'every\s+(?P<n>\d+)\s+hours?', 'Every {n} hours'),
+    (r'morning\s+(?:and|&)\s+evening', 'Twice daily'),
+    (r'morning\s+(?:and|&)\s+night', 'Twice daily'),
+    (r'at\s+bedtime', 'At bedtime'),
+    (r'(?P<n>\d+)\s+times\s+(?:a\s+)?(?:day|daily)', '{n} times daily'),
+    (r'\b(?:bd|bid|b\.?\s*d\.?)\b', 'Twice daily'),
+    (r'\b(?:tds|tid|t\.?\s*d\.?\s*s\.?)\b', 'Three times daily'),
+    (r'\b(?:od|o\.?\s*d\.?)\b', 'Once daily'),
+    (r'\b(?:qid|q\.?\s*i\.?\s*d\.?)\b', 'Every 6 hours'),
+    (r'\b(?:qhs|h\.?\s*s\.?)\b', 'At bedtime'),
+    (r'\b(?:prn|p\.?\s*r\.?\s*n\.?)\b', 'As needed'),
+    (r'\btwice\b', 'Twice daily'),
+    (r'\bdaily\b', 'Once daily'),
+]
+
+DOSAGE_PATTERN = r'(?P<dose>\d+(?:\.\d+)?)\s*(?P<unit>mg|ml|g|microgram|mcg|%|unit|iu)'
+DURATION_PATTERN = r'(?:(?:for|x|duration)\s*)?(?P<days>\d+)\s+(?P<period>days?|weeks?|months?)'
+ROUTE_PATTERN = (r'\b(?P<route_word>oral|tablet|tab|capsule|cap|injection|inj|intravenous|iv|topical|'
+                 r'cream|ointment|drops|syrup|inhaler|patch|sublingual)\b')
+
+ROUTE_ALIASES = {'tab': 'tablet', 'cap': 'capsule', 'inj': 'injection'}
+PERIOD_DAYS = {'d': 1, 'w': 7, 'm': 30}
+
+# Words ending like a drug name (-in, -ol, -pril, ...) — catches medicines missing from the list
+MEDICINE_SUFFIX_RE = re.compile(
+    r'\b([A-Za-z]{3,}(?:in|ol|ne|ide|ate|ine|one|cin|lin|min|pril|tan|pine|fen|lol|vir|zole|mab|nib|lam|pam|done|phil|mide|oxin|tide|arin|ulin|zide|sone))\b',
+    re.IGNORECASE)
+SUFFIX_SKIP_WORDS = frozenset({'medicine', 'online', 'routine', 'determine', 'combine', 'examine',
+                               'define', 'decline', 'information', 'prescription', 'substitution',
+                               'permission', 'written'})
+OCR_NOISE_RE = re.compile(r'[|{}\[\]~`]')
+WORD_RE = re.compile(r'[a-zA-Z]{2,}')
+
+# Every character a token can start with. Checking it first lets the scanner
+# skip most positions without trying each alternative; extend it with new rules.
+TOKEN_START = '[0-9a-fhimopqstx]'
+
+Token = namedtuple('Token', 'kind start end value')
+
+
+def _build_tokenizer():
+    parts = [f'(?P<dosage>{DOSAGE_PATTERN})']
+    for index, (pattern, _label) in enumerate(FREQUENCY_RULES):
+        parts.append(f'(?P<f{index}>{pattern.replace("(?P<n>", f"(?P<f{index}_n>")})')
+    parts.append(f'(?P<duration>{DURATION_PATTERN})')
+    parts.append(f'(?P<route>{ROUTE_PATTERN})')
+    return re.compile(f"(?={TOKEN_START})(?:{'|'.join(parts)})")
+
+
+TOKEN_RE = _build_tokenizer()
+# Group name of each frequency rule's number, if it has one
+_RULE_NUMBER_GROUPS = {f'f{i}': f'f{i}_n' for i, (pattern, _) in enumerate(FREQUENCY_RULES) if '(?P<n>' in pattern}
+
+
+def tokenize(text_lower):
+    """One pass over lowercased text -> list of Token(kind, start, end, value), kind
+    in dosage / frequency / duration / route. Frequency values are (rule index, label)."""
+    tokens = []
+    for m in TOKEN_RE.finditer(text_lower):
+        # lastgroup is the outer named group; inner groups (dose, unit, ...) close before it
+        kind = m.lastgroup
+        if kind == 'dosage':
+            tokens.append(Token(kind, m.start(), m.end(), (m.group('dose'), m.group('unit'))))
+        elif kind == 'duration':
+            days = int(m.group('days')) * PERIOD_DAYS[m.group('period')[0]]
+            tokens.append(Token(kind, m.start(), m.end(), days))
+        elif kind == 'route':
+            route = m.group('route_word')
+            tokens.append(Token(kind, m.start(), m.end(), ROUTE_ALIASES.get(route, route)))
+        else:
+            rule = int(kind[1:])
+            label = FREQUENCY_RULES[rule][1]
+            if kind in _RULE_NUMBER_GROUPS:
+                label = label.format(n=m.group(_RULE_NUMBER_GROUPS[kind]))
+            tokens.append(Token('frequency', m.start(), m.end(), (rule, label)))
+    return tokens
+
+
+def details_in_window(tokens, start, end):
+    """dosage / dosage_unit / frequency / duration / route from the tokens lying
+    entirely within text[start:end] (first of each kind; best-priority frequency)"""
+    result = {"dosage": None, "dosage_unit": None, "frequency": None, "duration": None, "route": None}
+    best_rule = None
+    for token in tokens:
+        if token.start < start:
+            continue
+        if token.end > end:
+            break
+        if token.kind == 'dosage':
+            if result["dosage"] is None:
+                result["dosage"], result["dosage_unit"] = token.value
+        elif token.kind == 'frequency':
+            if best_rule is None or token.value[0] < best_rule:
+                best_rule, result["frequency"] = token.value
+        elif token.kind == 'duration':
+            if result["duration"] is None:
+                result["duration"] = token.value
+        elif result["route"] is None:
+            result["route"] = token.value
+    return result
+
+
+def context_window(text, text_lower, medicine_name, window=200):
+    """(start, end) of the text around the first mention of medicine_name: a
+    little before it and `window` characters after. The whole text if not found."""
+    med_lower = medicine_name.lower()
+    pos = text_lower.find(med_lower)
+    if pos < 0:
+        # Try without spaces (OCR often splits words like "Met formin")
+        pos = text_lower.replace(' ', '').find(med_lower)
+        if pos < 0:
+            return 0, len(text)
+    return max(0, pos - 30), min(len(text), pos + len(medicine_name) + window)
+
+
+def parse_medicine_details(text, medicine_names, window=200):
+    """Details for each medicine name (in order) from one tokenization of text"""
+    text_lower = text.lower()
+    tokens = tokenize(text_lower)
+    return [details_in_window(tokens, *context_window(text, text_lower, name, window))
+            for name in medicine_names]
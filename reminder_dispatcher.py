@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Reminder Dispatcher
+Delivers due reminders through the channel named by reminders.reminder_method
+(app / email / sms). Any number of app processes can run it: each pass claims
+a batch of due reminders with FOR UPDATE SKIP LOCKED off the partial index
+idx_reminders_due, so a reminder is only ever handed to one worker, and marks
+the batch in the same transaction.
+
+Channels that talk to an outside service (SMS) don't send inside that
+transaction: the claim marks their reminders 'sending' and commits, then they
+are sent and their outcome recorded. A crash in between leaves a reminder
+'sending' rather than sending it twice.
+
+- Reminders later than REMINDER_MAX_LATENESS_MINUTES are marked 'expired'
+  instead of being sent; reminders whose dose is no longer pending are
+  'cancelled'.
+- If a reminder's channel is not configured (or fails), it is delivered in the
+  app instead and marked 'fallback' with the reason in last_error.
+
+Channels are pluggable: subclass ReminderChannel and register_channel() it.
+Run one pass with: python reminder_dispatcher.py
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+from db_connection import get_db_connection, close_db_connection
+import email_outbox
+
+load_dotenv()
+
+# Background dispatcher: poll interval in seconds (0 disables it), reminders per claimed batch
+REMINDER_DISPATCH_INTERVAL = float(os.getenv('REMINDER_DISPATCH_INTERVAL', 30))
+REMINDER_DISPATCH_BATCH = max(1, int(os.getenv('REMINDER_DISPATCH_BATCH', 100)))
+# Reminders further overdue than this are expired rather than sent
+REMINDER_MAX_LATENESS_MINUTES = int(os.getenv('REMINDER_MAX_LATENESS_MINUTES', 120))
+
+# SMS gateway: POST {"to": phone, "message": text} as JSON
+SMS_GATEWAY_URL = os.getenv('SMS_GATEWAY_URL')
+SMS_GATEWAY_TOKEN = os.getenv('SMS_GATEWAY_TOKEN')
+SMS_GATEWAY_TIMEOUT = float(os.getenv('SMS_GATEWAY_TIMEOUT', 10))
+
+
+class ReminderChannel:
+    """A delivery method. send() raises on failure; the reminder then falls back to the app."""
+    name = None
+    # False: send() runs after the claim commits, with cursor=None
+    in_transaction = True
+
+    def unavailable_reason(self, reminder):
+        """Why this reminder can't go out on this channel, or None"""
+        return None
+
+    def send(self, cursor, reminder):
+        raise NotImplementedError
+
+    def after_commit(self):
+        """Called once per batch after the claim transaction commits"""
+
+
+class AppChannel(ReminderChannel):
+    """In-app reminders: marking the reminder sent is what shows it in the app"""
+    name = "app"
+
+    def send(self, cursor, reminder):
+        pass
+
+
+class EmailChannel(ReminderChannel):
+    """Queues the reminder in the email outbox, in the claim transaction"""
+    name = "email"
+
+    def unavailable_reason(self, reminder):
+        if not email_outbox.email_configured():
+            return "email not configured"
+        if not reminder["email"] or '@' not in reminder["email"]:
+            return "no email address"
+        return None
+
+    def send(self, cursor, reminder):
+        email_outbox.enqueue_email(cursor, reminder["email"], "💊 Medication reminder",
+                                   f"Hi {reminder['username']},\n\n{reminder['reminder_text']}\n",
+                                   reminder["user_id"])
+
+    def after_commit(self):
+        email_outbox.wake_sender()
+
+
+class SmsChannel(ReminderChannel):
+    """Posts the reminder to SMS_GATEWAY_URL, outside the claim transaction"""
+    name = "sms"
+    in_transaction = False
+
+    def unavailable_reason(self, reminder):
+        if not SMS_GATEWAY_URL:
+            return "SMS gateway not configured"
+        if not reminder["phone"]:
+            return "no phone number"
+        return None
+
+    def send(self, cursor, reminder):
+        headers = {"Content-Type": "application/json"}
+        if SMS_GATEWAY_TOKEN:
+            headers["Authorization"] = f"Bearer {SMS_GATEWAY_TOKEN}"
+        body = json.dumps({"to": reminder["phone"], "message": reminder["reminder_text"]}).encode()
+        request = urllib.request.Request(SMS_GATEWAY_URL, data=body, headers=headers, method="POST")
+        with urllib.request.urlopen(request, timeout=SMS_GATEWAY_TIMEOUT):
+            pass  # non-2xx raises HTTPError
+
+
+CHANNELS = {}
+
+
+def register_channel(channel):
+    """Add or replace the channel for channel.name (a reminder_method value)"""
+    CHANNELS[channel.name] = channel
+
+
+for _channel in (AppChannel(), EmailChannel(), SmsChannel()):
+    register_channel(_channel)
+
+
+def _deliver(cursor, reminder, used, deferred):
+    """Send one reminder. Returns (delivery_status, error); reminders for channels
+    that send after the commit are added to deferred and come back 'sending'."""
+    channel = CHANNELS.get(reminder["reminder_method"] or "app")
+    if channel is None:
+        problem = f"unknown reminder method {reminder['reminder_method']!r}"
+    else:
+        problem = channel.unavailable_reason(reminder)
+    if problem is None and not channel.in_transaction:
+        deferred.append((channel, reminder))
+        return ('sending', None)
+    if problem is None:
+        # A failed send must not abort the batch transaction
+        cursor.execute("SAVEPOINT reminder_send")
+        try:
+            channel.send(cursor, reminder)
+            cursor.execute("RELEASE SAVEPOINT reminder_send")
+            used.add(channel)
+            return ('sent', None)
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT reminder_send")
+            problem = f"{channel.name} failed: {e}"
+    CHANNELS["app"].send(cursor, reminder)
+    used.add(CHANNELS["app"])
+    return ('fallback', problem[:1000])
+
+
+def _record_outcomes(cursor, outcomes):
+    """Take the reminders out of the queue with their delivery outcome"""
+    execute_values(cursor, """
+        UPDATE reminders AS r
+        SET is_sent = TRUE, delivery_status = v.status, last_error = v.error,
+            sent_at = CASE WHEN v.status IN ('sent', 'fallback') THEN CURRENT_TIMESTAMP END
+        FROM (VALUES %s) AS v(id, status, error)
+        WHERE r.id = v.id
+    """, outcomes, template="(%s::int, %s, %s)")
+
+
+def _send_deferred(conn, deferred):
+    """Send the batch's after-commit reminders and record each outcome.
+    Returns [(id, delivery_status, error)]."""
+    outcomes = []
+    for channel, reminder in deferred:
+        try:
+            channel.send(None, reminder)
+            outcomes.append((reminder["id"], 'sent', None))
+        except Exception as e:
+            # Already claimed and committed: in the app is all that's left
+            outcomes.append((reminder["id"], 'fallback', f"{channel.name} failed: {e}"[:1000]))
+    cursor = conn.cursor()
+    try:
+        _record_outcomes(cursor, outcomes)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return outcomes
+
+
+def dispatch_batch(conn, batch_size=REMINDER_DISPATCH_BATCH, max_lateness_minutes=REMINDER_MAX_LATENESS_MINUTES):
+    """Claim and deliver up to batch_size due reminders.
+    Returns {delivery_status: count} for the batch (empty when nothing was due)."""
+    cursor = conn.cursor()
+    used = set()
+    deferred = []
+    try:
+        cursor.execute("""
+            SELECT r.id, r.user_id, r.reminder_text, r.reminder_method,
+                   r.reminder_time < LOCALTIMESTAMP - make_interval(mins => %s) AS expired,
+                   dt.status, u.username, u.email, u.phone
+            FROM reminders r
+            JOIN users u ON u.id = r.user_id
+            JOIN dose_tracking dt ON dt.id = r.dose_tracking_id
+            WHERE NOT r.is_sent AND r.reminder_time <= LOCALTIMESTAMP
+            ORDER BY r.reminder_time
+            LIMIT %s
+            FOR UPDATE OF r SKIP LOCKED
+        """, (max_lateness_minutes, batch_size))
+        columns = [d[0] for d in cursor.description]
+        outcomes = []
+        for row in cursor.fetchall():
+            reminder = dict(zip(columns, row))
+            if reminder["expired"]:
+                outcome = ('expired', None)
+            elif reminder["status"] not in (None, 'pending'):
+                outcome = ('cancelled', None)
+            else:
+                outcome = _deliver(cursor, reminder, used, deferred)
+            outcomes.append((reminder["id"],) + outcome)
+
+        if outcomes:
+            _record_outcomes(cursor, outcomes)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    for channel in used:
+        channel.after_commit()
+    if deferred:
+        sent = {reminder_id: outcome for reminder_id, *outcome in _send_deferred(conn, deferred)}
+        outcomes = [(reminder_id, *sent.get(reminder_id, (status, error)))
+                    for reminder_id, status, error in outcomes]
+    counts = {}
+    for _, status, _ in outcomes:
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def dispatch_due(conn, batch_size=REMINDER_DISPATCH_BATCH):
+    """Dispatch batches until no reminder is due. Returns {delivery_status: count}."""
+    totals = {}
+    while True:
+        counts = dispatch_batch(conn, batch_size)
+        for status, count in counts.items():
+            totals[status] = totals.get(status, 0) + count
+        if sum(counts.values()) < batch_size:
+            return totals
+
+
+_dispatcher_thread = None
+
+
+def _dispatcher_loop(interval):
+    while True:
+        conn = None
+        try:
+            conn = get_db_connection(retry=False)
+            if conn:
+                totals = dispatch_due(conn)
+                if totals:
+                    print(f"✓ Reminders dispatched: {totals}")
+        except Exception as e:
+            print(f"⚠ Reminder dispatcher error: {e}")
+        finally:
+            close_db_connection(conn)
+        time.sleep(interval)
+
+
+def start_reminder_dispatcher(interval=None):
+    """Start the background thread that delivers due reminders"""
+    global _dispatcher_thread
+    interval = REMINDER_DISPATCH_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    if _dispatcher_thread is not None and _dispatcher_thread.is_alive():
+        return _dispatcher_thread
+    _dispatcher_thread = threading.Thread(target=_dispatcher_loop, args=(interval,),
+                                          name="reminder-dispatcher", daemon=True)
+    _dispatcher_thread.start()
+    return _dispatcher_thread
+
+
+if __name__ == "__main__":
+    # One dispatch pass (e.g. from cron, or with REMINDER_DISPATCH_INTERVAL=0)
+    conn = get_db_connection()
+    if not conn:
+        print("✗ Database connection failed")
+        sys.exit(1)
+    try:
+        print(f"Dispatched: {dispatch_due(conn) or 'nothing due'}")
+    finally:
+        close_db_connection(conn)
@@ -74,10 +74,16 @@ CREATE TABLE IF NOT EXISTS adherence_plans (
     why_important TEXT,
     nudge_reason TEXT,
     completion_percentage FLOAT DEFAULT 0,
+    doses_generated_through DATE, -- last day with dose_tracking rows written (rolling window)
+    schedule_end_date DATE, -- last day of the course
     last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Rolling dose window columns for databases created before they existed
+ALTER TABLE adherence_plans ADD COLUMN IF NOT EXISTS doses_generated_through DATE;
+ALTER TABLE adherence_plans ADD COLUMN IF NOT EXISTS schedule_end_date DATE;
+
 -- Dose Tracking Table
 CREATE TABLE IF NOT EXISTS dose_tracking (
     id SERIAL PRIMARY KEY,
@@ -133,6 +139,98 @@ CREATE TABLE IF NOT EXISTS adherence_summary (
     UNIQUE(user_id, date)
 );
 
+-- Keep adherence_summary current as dose_tracking changes. Statement-level
+-- triggers aggregate each INSERT/UPDATE/DELETE batch into per-(user, day)
+-- deltas, so bulk dose materialization costs one upsert per day touched.
+-- Run populate_adherence_summary.py once to backfill rows written before the
+-- triggers existed.
+CREATE OR REPLACE FUNCTION adherence_summary_apply(p_user_id INTEGER, p_date DATE,
+                                                   p_total INTEGER, p_taken INTEGER, p_missed INTEGER)
+RETURNS VOID AS $$
+    INSERT INTO adherence_summary AS s
+        (user_id, date, total_doses, doses_taken, doses_missed, adherence_percentage, week_of_month)
+    VALUES (p_user_id, p_date, p_total, p_taken, p_missed,
+            CASE WHEN p_total > 0 THEN p_taken * 100.0 / p_total ELSE 0 END,
+            ((EXTRACT(DAY FROM p_date)::int - 1) / 7 + 1)::text)
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        total_doses = s.total_doses + EXCLUDED.total_doses,
+        doses_taken = s.doses_taken + EXCLUDED.doses_taken,
+        doses_missed = s.doses_missed + EXCLUDED.doses_missed,
+        adherence_percentage = CASE WHEN s.total_doses + EXCLUDED.total_doses > 0
+            THEN (s.doses_taken + EXCLUDED.doses_taken) * 100.0 / (s.total_doses + EXCLUDED.total_doses)
+            ELSE 0 END;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION adherence_summary_sync()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM adherence_summary_apply(user_id, day, total, taken, missed)
+        FROM (SELECT user_id, scheduled_time::date AS day, COUNT(*)::int AS total,
+                     COUNT(*) FILTER (WHERE status = 'taken')::int AS taken,
+                     COUNT(*) FILTER (WHERE status = 'missed')::int AS missed
+              FROM new_doses GROUP BY 1, 2) d;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM adherence_summary_apply(user_id, day, -total, -taken, -missed)
+        FROM (SELECT user_id, scheduled_time::date AS day, COUNT(*)::int AS total,
+                     COUNT(*) FILTER (WHERE status = 'taken')::int AS taken,
+                     COUNT(*) FILTER (WHERE status = 'missed')::int AS missed
+              FROM old_doses GROUP BY 1, 2) d;
+    ELSE
+        PERFORM adherence_summary_apply(user_id, day, total, taken, missed)
+        FROM (SELECT user_id, day, SUM(total)::int AS total, SUM(taken)::int AS taken, SUM(missed)::int AS missed
+              FROM (SELECT user_id, scheduled_time::date AS day, 1 AS total,
+                           (status = 'taken')::int AS taken, (status = 'missed')::int AS missed
+                    FROM new_doses
+                    UNION ALL
+                    SELECT user_id, scheduled_time::date, -1,
+                           -(status = 'taken')::int, -(status = 'missed')::int
+                    FROM old_doses) changes
+              GROUP BY user_id, day
+              HAVING SUM(total) <> 0 OR SUM(taken) <> 0 OR SUM(missed) <> 0) d;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_dose_tracking_summary_insert ON dose_tracking;
+CREATE TRIGGER trg_dose_tracking_summary_insert
+    AFTER INSERT ON dose_tracking REFERENCING NEW TABLE AS new_doses
+    FOR EACH STATEMENT EXECUTE FUNCTION adherence_summary_sync();
+
+DROP TRIGGER IF EXISTS trg_dose_tracking_summary_update ON dose_tracking;
+CREATE TRIGGER trg_dose_tracking_summary_update
+    AFTER UPDATE ON dose_tracking REFERENCING OLD TABLE AS old_doses NEW TABLE AS new_doses
+    FOR EACH STATEMENT EXECUTE FUNCTION adherence_summary_sync();
+
+DROP TRIGGER IF EXISTS trg_dose_tracking_summary_delete ON dose_tracking;
+CREATE TRIGGER trg_dose_tracking_summary_delete
+    AFTER DELETE ON dose_tracking REFERENCING OLD TABLE AS old_doses
+    FOR EACH STATEMENT EXECUTE FUNCTION adherence_summary_sync();
+
+-- Recompute adherence_summary from scratch (backfill / repair). Blocks dose
+-- writes while it runs so no trigger delta is lost.
+CREATE OR REPLACE FUNCTION rebuild_adherence_summary()
+RETURNS INTEGER AS $$
+DECLARE
+    row_count INTEGER;
+BEGIN
+    LOCK TABLE dose_tracking IN SHARE MODE;
+    DELETE FROM adherence_summary;
+    INSERT INTO adherence_summary
+        (user_id, date, total_doses, doses_taken, doses_missed, adherence_percentage, week_of_month)
+    SELECT user_id, day, total, taken, missed,
+           CASE WHEN total > 0 THEN taken * 100.0 / total ELSE 0 END,
+           ((EXTRACT(DAY FROM day)::int - 1) / 7 + 1)::text
+    FROM (SELECT user_id, scheduled_time::date AS day, COUNT(*)::int AS total,
+                 COUNT(*) FILTER (WHERE status = 'taken')::int AS taken,
+                 COUNT(*) FILTER (WHERE status = 'missed')::int AS missed
+          FROM dose_tracking GROUP BY 1, 2) d;
+    GET DIAGNOSTICS row_count = ROW_COUNT;
+    RETURN row_count;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Caregiver Access Table
 CREATE TABLE IF NOT EXISTS caregiver_access (
     id SERIAL PRIMARY KEY,
@@ -155,11 +253,17 @@ CREATE TABLE IF NOT EXISTS healthcare_providers (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Indexes for better performance
-CREATE INDEX idx_user_prescriptions ON prescriptions(user_id);
-CREATE INDEX idx_prescription_medication ON prescriptions(medication_id);
-CREATE INDEX idx_dose_tracking_user ON dose_tracking(user_id);
-CREATE INDEX idx_dose_tracking_date ON dose_tracking(scheduled_time);
-CREATE INDEX idx_adherence_summary_user_date ON adherence_summary(user_id, date);
-CREATE INDEX idx_contraindication_prescription ON contraindication_checks(prescription_id);
-CREATE INDEX idx_reminders_sent ON reminders(is_sent);
+-- Indexes for better performance (IF NOT EXISTS so the schema can be re-applied)
+CREATE INDEX IF NOT EXISTS idx_user_prescriptions ON prescriptions(user_id);
+CREATE INDEX IF NOT EXISTS idx_prescription_medication ON prescriptions(medication_id);
+CREATE INDEX IF NOT EXISTS idx_dose_tracking_date ON dose_tracking(scheduled_time);
+CREATE INDEX IF NOT EXISTS idx_adherence_summary_user_date ON adherence_summary(user_id, date);
+CREATE INDEX IF NOT EXISTS idx_contraindication_prescription ON contraindication_checks(prescription_id);
+CREATE INDEX IF NOT EXISTS idx_reminders_sent ON reminders(is_sent);
+
+-- Per-user dose lookups by time range ("today's doses", history windows).
+-- Covers status/prescription_id so those queries can use index-only scans;
+-- it also serves plain user_id lookups, replacing idx_dose_tracking_user.
+CREATE INDEX IF NOT EXISTS idx_dose_tracking_user_time ON dose_tracking(user_id, scheduled_time)
+    INCLUDE (status, prescription_id);
+DROP INDEX IF EXISTS idx_dose_tracking_user;
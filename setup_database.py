@@ -1,40 +1,19 @@
 #!/usr/bin/env python3
 """Create all database tables if they don't exist"""
 
-from db_connection import get_db_connection, execute_update
+from db_connection import get_db_connection
+from db_migrations import migrate, current_version
 import traceback
 
-# Read schema file
-with open('schema.sql', 'r') as f:
-    schema_content = f.read()
-
 try:
     conn = get_db_connection()
     print("✅ Connected to database")
     
-    # Split by semicolon and execute each statement
-    statements = schema_content.split(';')
-    table_count = 0
-    
-    for statement in statements:
-        statement = statement.strip()
-        if statement and not statement.startswith('--'):
-            try:
-                execute_update(conn, statement)
-                if 'CREATE TABLE' in statement.upper():
-                    table_count += 1
-                    # Extract table name
-                    table_name = statement.split('CREATE TABLE IF NOT EXISTS')[1].strip().split('(')[0].strip()
-                    print(f"✅ Created table: {table_name}")
-            except Exception as e:
-                if 'already exists' in str(e):
-                    print(f"⚠️  Table already exists (skipping): {statement[:50]}...")
-                else:
-                    print(f"❌ Error executing: {statement[:50]}...")
-                    print(f"   Error: {e}")
-    
+    # schema.sql contains function bodies with embedded semicolons, so it is
+    # applied whole by the migration runner rather than split per statement
+    applied = migrate(conn)
     print(f"\n✅ Database schema setup complete!")
-    print(f"✅ Created/verified {table_count} tables")
+    print(f"✅ Schema at version {current_version(conn)} ({len(applied)} migration(s) applied)")
     
     # List all tables
     from db_connection import execute_query
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test the bulk import: its OCR runs through the shared job queue, so a small
+queue bounds concurrency and a full queue delays images instead of failing
+them, and no database connection is held while images are OCR'd; and a batch that includes a medicine the OCR could not read a dosage
+for is still saved in one transaction, with a plan and doses for every medicine.
+Run: python test_bulk_import.py   (the save test needs a database with the migrations applied)
+"""
+import threading
+import time
+from io import BytesIO
+
+from bulk_import import run_bulk_import, save_prescription_batch
+from ocr_jobs import OCRJobQueue
+from db_connection import get_db_connection, close_db_connection, get_pool_stats
+
+
+class SlowOCR:
+    """Stands in for PrescriptionOCR; records how many images it reads at once"""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.connections_in_use = []
+        self.lock = threading.Lock()
+
+    def extract_from_image(self, image_file):
+        self.connections_in_use.append(get_pool_stats().get("in_use", 0))
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        return [{"medicine_name": image_file.read().decode(), "dosage": "1"}]
+
+
+def test_ocr_goes_through_job_queue():
+    ocr = SlowOCR()
+    jobs = OCRJobQueue(workers=1, max_queued=1)
+    images = ((f"{n}.jpg", BytesIO(f"Medicine {n}".encode()), None) for n in range(6))
+    events = list(run_bulk_import(ocr, images, 1, "bulk_test", save_to_db=False, jobs=jobs))
+    done = events[-1]
+    assert done["event"] == "done" and done["images"] == 6 and done["images_failed"] == 0, events
+    assert sorted(e["medicines"][0]["medicine_name"] for e in events if e["event"] == "image") == \
+        [f"Medicine {n}" for n in range(6)]
+    assert ocr.peak == 1, ocr.peak
+    print("✓ 6 images OCR'd through a 1-worker job queue, one at a time, none rejected")
+
+
+def test_no_connection_held_during_ocr():
+    conn = get_db_connection()
+    assert conn, "database connection failed"
+    cursor = conn.cursor()
+    user_id = None
+    try:
+        cursor.execute("INSERT INTO users (username, email) VALUES ('bulk_pool_test', 'bulk_pool_test@example.test') RETURNING id")
+        user_id = cursor.fetchone()[0]
+        conn.commit()
+        cursor.close()
+        close_db_connection(conn)
+        conn = None
+
+        ocr = SlowOCR()
+        images = ((f"{n}.jpg", BytesIO(f"Medicine {n}".encode()), None) for n in range(3))
+        events = list(run_bulk_import(ocr, images, user_id, "bulk_pool_test", jobs=OCRJobQueue(workers=1)))
+        assert events[-1]["saved"] == 3, events
+        assert ocr.connections_in_use == [0, 0, 0], ocr.connections_in_use
+        assert get_pool_stats().get("in_use", 0) == 0
+        print("✓ Bulk import holds no pooled connection while OCR runs; 3 medicines saved")
+    finally:
+        conn = conn or get_db_connection()
+        cursor = conn.cursor()
+        if user_id:
+            cursor.execute("DELETE FROM dose_tracking WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM adherence_summary WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        close_db_connection(conn)
+
+
+def test_batch_with_missing_dosage():
+    conn = get_db_connection()
+    assert conn, "database connection failed"
+    cursor = conn.cursor()
+    user_id = None
+    try:
+        cursor.execute("INSERT INTO users (username, email) VALUES ('bulk_test', 'bulk_test@example.test') RETURNING id")
+        user_id = cursor.fetchone()[0]
+        conn.commit()
+        medicines = [
+            {"medicine_name": "Metformin", "dosage": "500", "frequency": "Twice daily", "duration": 5,
+             "source_file": "a.jpg"},
+            # _prescriptions_from_gemini leaves dosage None when it is unclear
+            {"medicine_name": "Amoxicillin", "dosage": None, "frequency": "Three times daily", "duration": 5,
+             "source_file": "b.jpg"},
+        ]
+        doses = save_prescription_batch(conn, user_id, medicines)
+        assert all(rx.get("saved") for rx in medicines), medicines
+        assert doses > 0
+        cursor.execute("""
+            SELECT p.medicine_name, p.dosage, COUNT(DISTINCT ap.id)
+            FROM prescriptions p JOIN adherence_plans ap ON ap.prescription_id = p.id
+            WHERE p.user_id = %s GROUP BY p.medicine_name, p.dosage ORDER BY p.medicine_name
+        """, (user_id,))
+        assert cursor.fetchall() == [("Amoxicillin", "", 1), ("Metformin", "500", 1)]
+        print(f"✓ Batch with a dosage-less medicine saved: 2 prescriptions, {doses} doses")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM dose_tracking WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM adherence_summary WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        close_db_connection(conn)
+    print("✓ PASSED")
+
+
+if __name__ == "__main__":
+    test_ocr_goes_through_job_queue()
+    test_no_connection_held_during_ocr()
+    test_batch_with_missing_dosage()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test the change stream: after a dose is marked taken, a subscribed stream
+receives the dose, reminder and adherence-summary deltas as server-sent
+events, other users' streams receive nothing, and a rolled-back change is
+never published.
+Run: python test_change_stream.py   (needs a database with the migrations applied)
+"""
+import json
+
+from change_stream import ChangeHub, stream_events
+from db_connection import get_db_connection, close_db_connection
+
+
+def read_events(chunks, count):
+    """Parse the next `count` named events from a stream_events() generator"""
+    events = []
+    while len(events) < count:
+        chunk = next(chunks)
+        if chunk.startswith(":"):
+            continue
+        lines = dict(line.split(": ", 1) for line in chunk.strip().split("\n") if not line.startswith("retry"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_change_stream():
+    conn = get_db_connection()
+    assert conn, "database connection failed"
+    cursor = conn.cursor()
+    user_id = None
+    hub = ChangeHub(max_clients=2)
+    try:
+        cursor.execute("INSERT INTO users (username, email) VALUES ('stream_test', 'stream_test@example.test') RETURNING id")
+        user_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO prescriptions (user_id, medicine_name, dosage, frequency, start_date)
+            VALUES (%s, 'Metformin', '500', 'Once daily', CURRENT_DATE) RETURNING id
+        """, (user_id,))
+        prescription_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO adherence_plans (prescription_id, user_id, daily_schedule)
+            VALUES (%s, %s, ARRAY['08:00']) RETURNING id
+        """, (prescription_id, user_id))
+        plan_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO dose_tracking (adherence_plan_id, prescription_id, user_id, scheduled_time)
+            VALUES (%s, %s, %s, CURRENT_DATE + TIME '08:00') RETURNING id
+        """, (plan_id, prescription_id, user_id))
+        dose_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO reminders (dose_tracking_id, user_id, reminder_time, reminder_method)
+            VALUES (%s, %s, CURRENT_DATE + TIME '07:45', 'app') RETURNING id
+        """, (dose_id, user_id))
+        reminder_id = cursor.fetchone()[0]
+        conn.commit()
+
+        mine = hub.subscribe(user_id)
+        other = hub.subscribe(user_id + 1)
+        assert hub.subscribe(user_id) is None, "max_clients not enforced"
+        chunks = stream_events(hub, mine, heartbeat=5, max_seconds=30)
+        assert read_events(chunks, 1) == [("ready", {"user_id": user_id, "listening": True})]
+        print("✓ Stream opened, listener connected, third stream refused")
+
+        # Rolled back: must not be published
+        cursor.execute("UPDATE dose_tracking SET status = 'missed' WHERE id = %s", (dose_id,))
+        conn.rollback()
+
+        cursor.execute("UPDATE dose_tracking SET status = 'taken', actual_time = NOW() WHERE id = %s", (dose_id,))
+        cursor.execute("UPDATE reminders SET is_sent = TRUE, delivery_status = 'cancelled' WHERE id = %s", (reminder_id,))
+        conn.commit()
+
+        events = dict(read_events(chunks, 3))
+        assert events["dose"]["rows"] == [{"dose_id": dose_id, "status": "taken",
+                                           "scheduled_time": events["dose"]["rows"][0]["scheduled_time"],
+                                           "today": True}], events["dose"]
+        summary = events["summary"]["rows"][0]
+        assert (summary["today"], summary["doses_taken"], summary["total_doses"]) == (True, 1, 1), summary
+        assert events["reminder"]["rows"][0]["reminder_id"] == reminder_id
+        assert events["reminder"]["rows"][0]["delivery_status"] == "cancelled"
+        print("✓ Dose, summary and reminder deltas streamed; rolled-back change was not")
+
+        assert other.get(0.5) is None, "another user's stream received the change"
+        print("✓ Other users' streams stay quiet")
+
+        chunks.close()
+        assert hub.stats()["streams"] == 1
+        print("✓ Closed stream unsubscribed")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM dose_tracking WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM adherence_summary WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        close_db_connection(conn)
+    print("✓ PASSED")
+
+
+if __name__ == "__main__":
+    test_change_stream()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test the batch contraindication scanner's evaluation step: scanned rows in,
+contraindication_checks rows (keyed by rule) out, with stored terms or text;
+and the write step, which replaces keyed rows but leaves unkeyed ones alone;
+and a scan dropping the unacknowledged warnings of prescriptions that ended.
+Run: python test_contraindication_scanner.py   (the write test needs a database)
+"""
+from contraindication_scanner import evaluate_chunk, _write_chunk, scan_contraindications
+from db_connection import get_db_connection, close_db_connection
+
+
+def test_evaluate_chunk():
+    print("\n" + "="*60)
+    print("Contraindication scanner: chunk evaluation")
+    print("="*60)
+    rows = [
+        # id, user, medicine, allergies, conditions, pregnant, breastfeeding, allergy terms, condition terms
+        (1, 10, "Brufen 400", "Advil", "Chronic kidney disease", False, False, None, None),
+        (2, 10, "Paracetamol 650", "Advil", "Chronic kidney disease", False, False, None, None),
+        (3, 11, "Lipitor 10", None, None, True, False, ["penicillin"], []),
+        (4, 12, "Metformin", None, None, None, None, None, None),  # no medical info on file
+    ]
+    prescription_ids, results = evaluate_chunk(rows)
+    assert prescription_ids == [1, 2, 3, 4]
+    assert [(row[0], row[3], row[7]) for row in results] == [
+        (1, "allergy", "allergy"), (1, "condition", "condition:kidney disease"), (3, "pregnancy", "pregnancy")]
+    assert all(len(row) == 8 and row[4] in ("high", "medium") for row in results)
+    print(f"✓ {len(rows)} prescriptions -> {len(results)} keyed warnings")
+    print("✓ PASSED")
+
+
+def test_write_chunk_keeps_unkeyed_rows():
+    conn = get_db_connection()
+    assert conn, "database connection failed"
+    cursor = conn.cursor()
+    user_id = None
+    try:
+        cursor.execute("INSERT INTO users (username, email) VALUES ('scanner_test', 'scanner_test@example.test') RETURNING id")
+        user_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO prescriptions (user_id, medicine_name, dosage, frequency, start_date)
+            VALUES (%s, 'Brufen 400', '400', 'Twice daily', CURRENT_DATE) RETURNING id
+        """, (user_id,))
+        prescription_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO contraindication_checks
+            (prescription_id, user_id, medication_name, check_type, risk_level, rule_key, is_acknowledged)
+            VALUES (%s, %s, 'Brufen 400', 'pregnancy', 'high', 'pregnancy', FALSE),
+                   (%s, %s, 'Brufen 400', 'allergy', 'high', NULL, TRUE),
+                   (%s, %s, 'brufen + aspirin', 'interaction', 'high', NULL, FALSE)
+        """, (prescription_id, user_id) * 3)
+        conn.commit()
+
+        _, results = evaluate_chunk([(prescription_id, user_id, "Brufen 400", "Advil", None, False, False, None, None)])
+        deleted = _write_chunk(conn, [prescription_id], results)
+        cursor.execute("""
+            SELECT check_type, rule_key FROM contraindication_checks
+            WHERE prescription_id = %s ORDER BY check_type
+        """, (prescription_id,))
+        assert cursor.fetchall() == [("allergy", None), ("allergy", "allergy"), ("interaction", None)]
+        assert deleted == 1
+        print("✓ Resolved keyed rule removed; unkeyed and interaction rows untouched")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        close_db_connection(conn)
+
+
+def test_scan_clears_ended_prescriptions():
+    conn = get_db_connection()
+    read_conn = get_db_connection()
+    assert conn and read_conn, "database connection failed"
+    cursor = conn.cursor()
+    user_id = None
+    try:
+        cursor.execute("INSERT INTO users (username, email) VALUES ('scanner_end_test', 'scanner_end_test@example.test') RETURNING id")
+        user_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO prescriptions (user_id, medicine_name, dosage, frequency, start_date, end_date)
+            VALUES (%s, 'Brufen 400', '400', 'Twice daily', CURRENT_DATE - 30, CURRENT_DATE - 1) RETURNING id
+        """, (user_id,))
+        prescription_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO contraindication_checks
+            (prescription_id, user_id, medication_name, check_type, risk_level, rule_key, is_acknowledged)
+            VALUES (%s, %s, 'Brufen 400', 'pregnancy', 'high', 'pregnancy', FALSE),
+                   (%s, %s, 'Brufen 400', 'allergy', 'high', 'allergy', TRUE),
+                   (%s, %s, 'Brufen 400', 'condition', 'high', NULL, FALSE)
+        """, (prescription_id, user_id) * 3)
+        conn.commit()
+
+        totals = scan_contraindications(read_conn, conn, full=True, workers=1)
+        cursor.execute("""
+            SELECT check_type FROM contraindication_checks
+            WHERE prescription_id = %s ORDER BY check_type
+        """, (prescription_id,))
+        assert cursor.fetchall() == [("allergy",), ("condition",)]
+        assert totals["ended_rows_deleted"] >= 1, totals
+        print("✓ Scan drops unacknowledged keyed warnings of an ended prescription")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        close_db_connection(read_conn)
+        close_db_connection(conn)
+
+
+if __name__ == "__main__":
+    test_evaluate_chunk()
+    test_write_chunk_keeps_unkeyed_rows()
+    test_scan_clears_ended_prescriptions()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN-based regression test for per-user dose queries.
+Seeds a throwaway dataset inside a transaction (rolled back at the end) and
+checks that "today's doses" uses idx_dose_tracking_user_time with a range on
+scheduled_time instead of filtering every dose the user has ever had.
+Run: python test_dose_query_plans.py   (needs a database with schema.sql applied)
+"""
+
+import json
+
+from db_connection import get_db_connection, close_db_connection
+
+SEED_USERS = 200
+SEED_DAYS = 180          # days of history/future per user, centred on today
+DOSES_PER_DAY = 4
+
+# The pre-fix form of the upcoming-reminders predicate (non-sargable)
+BEFORE_QUERY = """
+SELECT dt.id AS dose_id, dt.scheduled_time, dt.status,
+       pr.medicine_name, pr.dosage, pr.dosage_unit,
+       r.id AS reminder_id, r.reminder_text, r.reminder_time,
+       r.is_sent, r.sent_at, r.reminder_method
+FROM dose_tracking dt
+JOIN prescriptions pr ON dt.prescription_id = pr.id
+LEFT JOIN reminders r ON r.dose_tracking_id = dt.id
+WHERE dt.user_id = %s AND DATE(dt.scheduled_time) = CURRENT_DATE
+ORDER BY dt.scheduled_time
+"""
+
+# The form used by get_upcoming_reminders now (half-open timestamp range)
+AFTER_QUERY = """
+SELECT dt.id AS dose_id, dt.scheduled_time, dt.status,
+       pr.medicine_name, pr.dosage, pr.dosage_unit,
+       r.id AS reminder_id, r.reminder_text, r.reminder_time,
+       r.is_sent, r.sent_at, r.reminder_method
+FROM dose_tracking dt
+JOIN prescriptions pr ON dt.prescription_id = pr.id
+LEFT JOIN reminders r ON r.dose_tracking_id = dt.id
+WHERE dt.user_id = %s
+  AND dt.scheduled_time >= CURRENT_DATE
+  AND dt.scheduled_time < CURRENT_DATE + INTERVAL '1 day'
+ORDER BY dt.scheduled_time
+"""
+
+
+def seed(cursor):
+    """Insert SEED_USERS patients with SEED_DAYS x DOSES_PER_DAY doses each; returns one user id"""
+    cursor.execute("""
+        INSERT INTO users (username, email)
+        SELECT 'plan_test_' || g, 'plan_test_' || g || '@example.test'
+        FROM generate_series(1, %s) g
+        RETURNING id
+    """, (SEED_USERS,))
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+        INSERT INTO prescriptions (user_id, medicine_name, dosage, frequency, duration, start_date)
+        SELECT u, 'Metformin', '500', 'Four times daily', %s, CURRENT_DATE - %s
+        FROM unnest(%s::int[]) u
+    """, (SEED_DAYS, SEED_DAYS // 2, user_ids))
+    cursor.execute("""
+        INSERT INTO adherence_plans (prescription_id, user_id, daily_schedule)
+        SELECT id, user_id, ARRAY['08:00', '12:00', '16:00', '20:00']
+        FROM prescriptions WHERE user_id = ANY(%s)
+    """, (user_ids,))
+    cursor.execute("""
+        INSERT INTO dose_tracking (adherence_plan_id, prescription_id, user_id, scheduled_time, status)
+        SELECT ap.id, ap.prescription_id, ap.user_id,
+               d::date + make_time(8 + 4 * slot, 0, 0),
+               CASE WHEN d < CURRENT_DATE THEN 'taken' ELSE 'pending' END
+        FROM adherence_plans ap
+        CROSS JOIN generate_series(CURRENT_DATE - %s, CURRENT_DATE + %s, INTERVAL '1 day') d
+        CROSS JOIN generate_series(0, %s - 1) slot
+        WHERE ap.user_id = ANY(%s)
+    """, (SEED_DAYS // 2, SEED_DAYS // 2 - 1, DOSES_PER_DAY, user_ids))
+    cursor.execute("ANALYZE dose_tracking")
+    cursor.execute("ANALYZE prescriptions")
+    return user_ids[len(user_ids) // 2]
+
+
+def dose_tracking_scan(cursor, query, user_id):
+    """Run EXPLAIN ANALYZE and return the plan node that reads dose_tracking.
+    For bitmap scans the index name/condition are copied up from the child
+    Bitmap Index Scan so both plan shapes can be checked the same way."""
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query, (user_id,))
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    stack = [plan[0]["Plan"]]
+    while stack:
+        node = stack.pop()
+        if node.get("Relation Name") == "dose_tracking":
+            node = dict(node)
+            for child in node.get("Plans", []):
+                if child.get("Node Type") == "Bitmap Index Scan":
+                    node.setdefault("Index Name", child.get("Index Name"))
+                    node.setdefault("Index Cond", child.get("Index Cond"))
+            return node
+        stack.extend(node.get("Plans", []))
+    return None
+
+
+def test_today_doses_use_user_time_index():
+    """Today's doses must be an index range scan, not a per-user filter"""
+    print("\n" + "="*60)
+    print("EXPLAIN regression: per-user dose query plans")
+    print("="*60)
+
+    conn = get_db_connection()
+    assert conn, "database connection failed"
+
+    cursor = conn.cursor()
+    try:
+        user_id = seed(cursor)
+        before = dose_tracking_scan(cursor, BEFORE_QUERY, user_id)
+        after = dose_tracking_scan(cursor, AFTER_QUERY, user_id)
+
+        before_removed = before.get("Rows Removed by Filter", 0)
+        after_removed = after.get("Rows Removed by Filter", 0)
+        print(f"  before: {before['Node Type']} on {before.get('Index Name', '-')}, "
+              f"rows={before['Actual Rows']}, removed by filter={before_removed}")
+        print(f"  after:  {after['Node Type']} on {after.get('Index Name', '-')}, "
+              f"rows={after['Actual Rows']}, removed by filter={after_removed}, "
+              f"index cond={after.get('Index Cond')}")
+
+        assert after.get("Index Name") == "idx_dose_tracking_user_time", \
+            "Range query does not use idx_dose_tracking_user_time"
+        assert "scheduled_time" in (after.get("Index Cond") or ""), \
+            "scheduled_time range is not part of the index condition"
+        assert after_removed == 0, "Range query still filters rows after the index scan"
+        assert after["Actual Rows"] == before["Actual Rows"], \
+            "Rewritten predicate returns a different number of doses"
+        if before_removed <= after_removed:
+            print("⚠ Old predicate did not filter more rows — dataset may be too small to show the difference")
+
+        print("✓ PASSED")
+    finally:
+        conn.rollback()
+        cursor.close()
+        close_db_connection(conn)
+
+
+if __name__ == "__main__":
+    test_today_doses_use_user_time_index()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test the email outbox against a local debugging SMTP server: a batch goes out
+over one reused SMTP connection, and an unreachable server backs messages off
+instead of failing them.
+Run: python test_email_outbox.py   (needs a database with the migrations applied)
+"""
+import socket
+import threading
+import warnings
+
+import email_outbox
+from db_connection import get_db_connection, close_db_connection
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _debug_smtp_server(port):
+    """Start a local SMTP server that records what it receives.
+    Returns (received messages, connection count list, stop function)."""
+    received, connections = [], []
+    try:
+        from aiosmtpd.controller import Controller
+
+        class Handler:
+            async def handle_DATA(self, server, session, envelope):
+                received.append(envelope.rcpt_tos)
+                return "250 OK"
+
+            async def handle_EHLO(self, server, session, envelope, hostname, responses):
+                connections.append(hostname)
+                session.host_name = hostname
+                return responses
+
+        controller = Controller(Handler(), hostname="127.0.0.1", port=port)
+        controller.start()
+        return received, connections, controller.stop
+    except ImportError:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            import asyncore
+            import smtpd
+
+        class Server(smtpd.SMTPServer):
+            def handle_accepted(self, conn, addr):
+                connections.append(addr)
+                super().handle_accepted(conn, addr)
+
+            def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+                received.append(rcpttos)
+
+        server = Server(("127.0.0.1", port), None)
+        thread = threading.Thread(target=asyncore.loop, kwargs={"timeout": 0.05}, daemon=True)
+        thread.start()
+
+        def stop():
+            server.close()
+            thread.join(1)
+        return received, connections, stop
+
+
+def test_email_outbox():
+    print("\n" + "="*60)
+    print("Email outbox (local debugging SMTP server)")
+    print("="*60)
+    email_outbox.SMTP_EMAIL, email_outbox.SMTP_PASSWORD = "reports@example.test", None
+    port = _free_port()
+    received, connections, stop = _debug_smtp_server(port)
+    session = email_outbox.SMTPSession("127.0.0.1", port, use_tls=False)
+
+    conn = get_db_connection()
+    assert conn, "database connection failed"
+    cursor = conn.cursor()
+    try:
+        ids = [email_outbox.enqueue_email(cursor, f"patient{i}@example.test", "Report", "Body")
+               for i in range(5)]
+        conn.commit()
+
+        sent, failed = email_outbox.drain_outbox(conn, session, batch_size=2)
+        assert sent >= 5 and failed == 0, (sent, failed)
+        assert {f"patient{i}@example.test" for i in range(5)} <= {r for rcpts in received for r in rcpts}
+        assert len(connections) == 1, connections
+        cursor.execute("SELECT count(*) FROM email_outbox WHERE id = ANY(%s) AND status = 'sent'", (ids,))
+        assert cursor.fetchone()[0] == 5
+        print("✓ 5 emails in 3 batches over 1 SMTP connection")
+
+        # Server gone: the message is rescheduled with backoff, not lost
+        session.close()
+        stop()
+        retry_id = email_outbox.enqueue_email(cursor, "late@example.test", "Report", "Body")
+        conn.commit()
+        assert email_outbox.drain_outbox(conn, session)[0] == 0
+        cursor.execute("""SELECT status, attempts, next_attempt_at > CURRENT_TIMESTAMP
+                          FROM email_outbox WHERE id = %s""", (retry_id,))
+        assert cursor.fetchone() == ("pending", 1, True)
+        print("✓ Unreachable server: message kept and retried later")
+
+        cursor.execute("DELETE FROM email_outbox WHERE id = ANY(%s)", (ids + [retry_id],))
+        conn.commit()
+    finally:
+        session.close()
+        cursor.close()
+        close_db_connection(conn)
+    print("✓ PASSED")
+
+
+if __name__ == "__main__":
+    test_email_outbox()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test the rate-limit-aware Gemini client against a local stub of the
+generateContent REST endpoint (no API key or network needed).
+
+The stub answers 429 RESOURCE_EXHAUSTED (with a retryDelay) for models listed in
+EXHAUSTED and a canned JSON prescription for everything else. When google-genai
+is installed the real SDK is pointed at the stub (same as GEMINI_BASE_URL);
+otherwise a minimal HTTP client with the same .models.generate_content shape is used.
+Run: python test_gemini_client.py
+"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from gemini_client import ModelScheduler, RateLimitedGemini, GeminiRateLimited
+
+EXHAUSTED = {"gemini-2.5-flash"}
+CALLS = []
+ANSWER = '[{"medicine_name": "Metformin", "dosage": "500", "dosage_unit": "mg"}]'
+
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        # /v1beta/models/<model>:generateContent
+        model = self.path.rsplit('/', 1)[-1].split(':')[0]
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        CALLS.append(model)
+        if model in EXHAUSTED:
+            status, body = 429, {"error": {
+                "code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Quota exceeded",
+                "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "30s"}]}}
+        else:
+            status, body = 200, {"candidates": [{"content": {"role": "model", "parts": [{"text": ANSWER}]},
+                                                 "finishReason": "STOP"}]}
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class _HttpModels:
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def generate_content(self, model, contents):
+        body = json.dumps({"contents": [{"parts": [{"text": str(c)} for c in contents]}]}).encode()
+        req = urllib.request.Request(f"{self.base_url}/v1beta/models/{model}:generateContent", data=body,
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req) as resp:
+                data = json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            error = json.loads(e.read())["error"]
+            raise Exception(f"{error['code']} {error['status']}. {json.dumps(error)}")
+        return type("Response", (), {"text": data["candidates"][0]["content"]["parts"][0]["text"]})()
+
+
+def _client_for(base_url):
+    try:
+        from google import genai
+        return genai.Client(api_key="stub-key", http_options={'base_url': base_url}), "google-genai SDK"
+    except ImportError:
+        return type("HttpClient", (), {"models": _HttpModels(base_url)})(), "minimal HTTP client"
+
+
+def test_rate_limited_gemini_against_stub():
+    print("\n" + "="*60)
+    print("Rate-limited Gemini client vs local stub server")
+    print("="*60)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubGeminiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        client, kind = _client_for(base_url)
+        print(f"  using {kind} at {base_url}")
+        scheduler = ModelScheduler(
+            models=["gemini-2.5-flash", "gemini-2.0-flash", "gemini-2.0-flash-lite"],
+            model_rpm={"gemini-2.5-flash": 60, "gemini-2.0-flash": 60, "gemini-2.0-flash-lite": 60},
+        )
+        gemini = RateLimitedGemini(client, scheduler=scheduler, max_wait=0)
+
+        started = time.time()
+        response, model = gemini.generate_content(["prompt"])
+        assert model == "gemini-2.0-flash" and "Metformin" in response.text
+        assert CALLS == ["gemini-2.5-flash", "gemini-2.0-flash"]
+        assert time.time() - started < 2, "failover should not sleep"
+        assert scheduler.status()["gemini-2.5-flash"]["cooldown_seconds"] > 25
+        print("✓ 429 on the first model fails over immediately and honours retryDelay")
+
+        # The exhausted model is skipped entirely while it cools down
+        CALLS.clear()
+        for _ in range(5):
+            gemini.generate_content(["prompt"])
+        assert "gemini-2.5-flash" not in CALLS
+        print(f"✓ Cooling-down model skipped: {CALLS}")
+
+        # Token buckets: 60 rpm -> a burst of 10 per model, then nothing free
+        CALLS.clear()
+        served = 0
+        try:
+            for _ in range(50):
+                gemini.generate_content(["prompt"])
+                served += 1
+        except GeminiRateLimited as e:
+            print(f"✓ Buckets exhausted after {served} more requests; retry in ~{e.retry_after:.1f}s")
+        assert 0 < served < 50
+        assert CALLS.count("gemini-2.0-flash-lite") > 0
+        print("✓ PASSED")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_rate_limited_gemini_against_stub()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test the drug interaction engine: symmetric pair lookup, partners outside the
+KB ("alcohol", "potassium"), and splitting free-text medication lists; and a
+rescan dropping unacknowledged warnings of patients whose prescriptions ended.
+Run: python test_interaction_engine.py   (the rescan test needs a database)
+"""
+from interaction_engine import InteractionIndex, check_drug_interactions, split_medication_list, scan_all_patients
+from db_connection import get_db_connection, close_db_connection
+
+
+def test_interaction_engine():
+    print("\n" + "="*60)
+    print("Drug interaction engine")
+    print("="*60)
+
+    assert split_medication_list("Metformin 500mg, aspirin and potassium; Lipitor") == [
+        "Metformin 500mg", "aspirin", "potassium", "Lipitor"]
+    assert split_medication_list(None) == []
+    print("✓ Free-text medication lists split")
+
+    # Brand + brand, in either order
+    for names in (["Advil 400", "Ecosprin 75"], ["Ecosprin 75", "Advil 400"]):
+        warnings = check_drug_interactions(names)
+        assert len(warnings) == 1 and warnings[0]["pair"] == ["aspirin", "ibuprofen"], warnings
+        assert warnings[0]["risk"] == "HIGH"
+    print("✓ Pairs found by brand name, symmetric")
+
+    warnings = check_drug_interactions(["Glucophage 500", "Alcohol (occasional)", "Potassium supplements",
+                                        "Lisinopril 10mg", "Atorvastatin"])
+    assert [w["pair"] for w in warnings] == [["alcohol", "metformin"], ["lisinopril", "potassium"]], warnings
+    assert check_drug_interactions(["Metformin", "Atorvastatin", "Amoxicillin"]) == []
+    print("✓ Non-KB partners matched inside free text")
+
+    index = InteractionIndex({("metformin", "aspirin"): {"risk": "low", "message": "test"}})
+    warnings = index.check([{"medicine_name": "Aspirin", "prescription_id": 7},
+                            {"medicine_name": "Metformin", "prescription_id": 3},
+                            {"medicine_name": "Metformin XR", "prescription_id": 9}])
+    assert len(warnings) == 1 and warnings[0]["prescription_ids"] == [3, 7, 9]
+    print("✓ Duplicate medicines collapse to one warning")
+    print("✓ PASSED")
+
+
+def test_rescan_clears_ended_prescriptions():
+    conn = get_db_connection()
+    assert conn, "database connection failed"
+    cursor = conn.cursor()
+    user_id = None
+    try:
+        cursor.execute("INSERT INTO users (username, email) VALUES ('interaction_test', 'interaction_test@example.test') RETURNING id")
+        user_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO prescriptions (user_id, medicine_name, dosage, frequency, start_date, end_date)
+            VALUES (%s, 'Aspirin', '75', 'Once daily', CURRENT_DATE - 30, CURRENT_DATE - 1) RETURNING id
+        """, (user_id,))
+        prescription_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO contraindication_checks
+            (prescription_id, user_id, medication_name, check_type, risk_level, is_acknowledged)
+            VALUES (%s, %s, 'aspirin + ibuprofen', 'interaction', 'high', FALSE),
+                   (%s, %s, 'aspirin + warfarin', 'interaction', 'high', TRUE)
+        """, (prescription_id, user_id, prescription_id, user_id))
+        conn.commit()
+
+        totals = scan_all_patients(conn)
+        cursor.execute("SELECT medication_name FROM contraindication_checks WHERE user_id = %s", (user_id,))
+        assert cursor.fetchall() == [("aspirin + warfarin",)]
+        assert totals["stale_rows_removed"] >= 1, totals
+        print("✓ Rescan drops unacknowledged warnings of ended prescriptions, keeps acknowledged ones")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        close_db_connection(conn)
+
+
+if __name__ == "__main__":
+    test_interaction_engine()
+    test_rescan_clears_ended_prescriptions()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test the medication KB index: canonical, generic and brand-name lookups,
+longest-match semantics, lookup cost on a KB of thousands of drugs, and
+contraindication checks against precomputed allergy / condition terms.
+Run: python test_medication_kb.py   (no server or database needed)
+"""
+import os
+import tempfile
+import time
+
+from kb_store import MedicationStore, build_kb, builtin_source
+from medication_kb import (MedicationIndex, resolve_medication_name, get_medication_info,
+                           medical_terms, medical_profile, check_contraindications)
+
+
+def _letters(i):
+    """Drug names are letters only (digits are dropped as strengths): 12 -> 'aaabc'"""
+    return ''.join(chr(97 + int(d)) for d in f"{i:05d}")
+
+
+def test_medication_index():
+    print("\n" + "="*60)
+    print("Medication KB index")
+    print("="*60)
+
+    cases = {
+        "Metformin": "metformin",
+        "Tab. GLUCOPHAGE-500 mg": "metformin",         # brand, with form and strength
+        "Acetylsalicylic Acid 75mg": "aspirin",        # generic name
+        "Lipitor 10": "atorvastatin",
+        "atorv": "atorvastatin",                       # truncated by OCR
+        "Amoxicillin + Clavulanate": "amoxicillin",
+        "in": None,                                    # too short to be a prefix
+        "": None,
+        "Paracetamol": None,
+    }
+    for name, expected in cases.items():
+        assert resolve_medication_name(name) == expected, (name, resolve_medication_name(name))
+    assert get_medication_info("Advil")["generic_name"] == "Ibuprofen"
+    print(f"✓ {len(cases)} names resolved (canonical, generic, brand, prefix)")
+
+    # Longest alias wins over a shorter one inside it, whatever the order
+    index = MedicationIndex({
+        "calcium": {"generic_name": "Calcium"},
+        "calcium carbonate": {"generic_name": "Calcium Carbonate", "brand_names": ["Tums"]},
+    })
+    assert index.resolve("Calcium Carbonate 500mg") == "calcium carbonate"
+    assert index.resolve("calcium citrate") == "calcium"
+    print("✓ Longest match wins")
+
+    def kb(size):
+        return MedicationIndex({f"drug{_letters(i)}": {"generic_name": f"generic {_letters(i)}",
+                                                        "brand_names": [f"brand{_letters(i)}"]}
+                                for i in range(size)})
+    small, big = kb(6), kb(5000)
+
+    def timed(index, name):
+        started = time.perf_counter()
+        for _ in range(20000):
+            index.resolve(name)
+        return time.perf_counter() - started
+
+    small_time, big_time = timed(small, "Tab drugaaaab 500mg"), timed(big, "Tab drugaeeee 500mg")
+    assert big.resolve("Tab drugaeeee 500mg") == "drugaeeee"
+    assert big_time < small_time * 3, (small_time, big_time)
+    print(f"✓ 20k lookups: 6 drugs {small_time:.3f}s, 5000 drugs {big_time:.3f}s")
+    print("✓ PASSED")
+
+
+def test_compiled_kb_store():
+    """A compiled KB file answers exactly like the in-memory index"""
+    print("\n" + "="*60)
+    print("Compiled medication KB (kb_store)")
+    print("="*60)
+    entries, flags, interactions = builtin_source()
+    entries.update({f"drug{_letters(i)}": {"generic_name": f"generic {_letters(i)} sodium",
+                                           "brand_names": [f"brand{_letters(i)}"]} for i in range(2000)})
+    index = MedicationIndex(entries, interactions, pregnancy=[name for flag, name in flags if flag == "pregnancy"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "kb.sqlite")
+        build_kb(path, entries, flags, interactions)
+        store = MedicationStore(path)
+        names = ["Tab. Glucophage 500", "Acetylsalicylic acid", "atorv", "druga", "drugabc",
+                 "Generic abcde Sodium 10mg", "brandaabbc", "in", "", "unknown drug"]
+        names += [f"drug{_letters(i)}"[:4 + i % 6] for i in range(0, 2000, 37)]
+        for name in names:
+            assert store.resolve(name) == index.resolve(name), name
+            assert store.lookup(name) == index.lookup(name), name
+        assert store.flagged("pregnancy", "aspirin") and not store.flagged("breastfeeding", "metformin")
+        assert store.interactions == interactions
+        print(f"✓ {len(names)} lookups identical to the in-memory index ({store.size} drugs)")
+    print("✓ PASSED")
+
+
+def test_contraindication_terms():
+    print("\n" + "="*60)
+    print("Contraindication checks on precomputed terms")
+    print("="*60)
+    assert medical_terms("Chronic kidney disease; Penicillin") == [
+        "chronic", "chronic kidney", "chronic kidney disease", "disease", "kidney", "kidney disease", "penicillin"]
+    assert medical_terms(None) == []
+
+    info = {"drug_allergies": "Penicillin, Advil", "existing_conditions": "Stomach ulcers, kidney disease",
+            "is_pregnant": True}
+    profile = medical_profile(info)
+    for medical_info in (info, profile):  # from the text, or from stored terms
+        warnings = check_contraindications("Brufen 400mg (Ibuprofen)", medical_info)
+        assert [w["type"] for w in warnings] == ["ALLERGY", "PREGNANCY", "CONDITION", "CONDITION"], warnings
+    # Stored terms alone are enough (text columns not loaded)
+    stored = {"drug_allergy_terms": ["acetylsalicylic acid"], "condition_terms": []}
+    assert [w["type"] for w in check_contraindications("Ecosprin 75", stored)] == ["ALLERGY"]
+    assert check_contraindications("Metformin", medical_profile({"existing_conditions": "Asthma"})) == []
+    assert check_contraindications("Unknown drug", profile) == []
+    print("✓ Allergies by brand / generic name, conditions by phrase")
+    print("✓ PASSED")
+
+
+if __name__ == "__main__":
+    test_medication_index()
+    test_compiled_kb_store()
+    test_contraindication_terms()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test the indexed medicine-name matcher against the plain difflib scans it replaces.
+Run: python test_medicine_matcher.py   (no server or database needed)
+"""
+import difflib
+import random
+
+from medicine_matcher import MedicineMatcher
+from ocr_processor import KNOWN_MEDICINES
+
+TRIALS = 2000
+
+
+def _noisy(word, rng):
+    """Simulate OCR damage: substitutions, drops and stray inserts"""
+    chars = list(word)
+    for _ in range(rng.randint(0, 3)):
+        i = rng.randrange(len(chars))
+        op = rng.random()
+        if op < 0.4:
+            chars[i] = rng.choice('abcdeilmnorstu')
+        elif op < 0.7 and len(chars) > 3:
+            del chars[i]
+        else:
+            chars.insert(i, rng.choice('aeio'))
+    return ''.join(chars)
+
+
+def test_matcher_agrees_with_difflib():
+    """Exact, fuzzy (0.80) and best-match (0.6) results must equal the all-pairs versions"""
+    print("\n" + "="*60)
+    print("Medicine matcher vs difflib")
+    print("="*60)
+
+    matcher = MedicineMatcher(KNOWN_MEDICINES)
+    rng = random.Random(7)
+    mismatches = 0
+
+    text = "rx: tab metformin 500mg, atorvastatin 20 mg at night; amlodipine"
+    expected = {med: text.find(med) for med in KNOWN_MEDICINES if med in text}
+    if matcher.find_exact(text) != expected:
+        print(f"✗ Exact hits differ: {matcher.find_exact(text)} != {expected}")
+        mismatches += 1
+
+    for _ in range(TRIALS):
+        word = _noisy(rng.choice(KNOWN_MEDICINES), rng)
+        fuzzy = [med for med in KNOWN_MEDICINES
+                 if difflib.SequenceMatcher(None, word, med).ratio() >= 0.80]
+        if matcher.fuzzy_matches(word, 0.80) != fuzzy:
+            print(f"✗ Fuzzy matches differ for {word!r}")
+            mismatches += 1
+        close = difflib.get_close_matches(word, KNOWN_MEDICINES, n=1, cutoff=0.6)
+        if matcher.best_match(word, 0.6) != (close[0] if close else None):
+            print(f"✗ Best match differs for {word!r}")
+            mismatches += 1
+
+    print(f"  {TRIALS} noisy words checked, {mismatches} mismatch(es)")
+    print("✓ PASSED" if not mismatches else "✗ FAILED")
+    assert mismatches == 0
+
+
+if __name__ == "__main__":
+    test_matcher_agrees_with_difflib()
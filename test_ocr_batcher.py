@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test Gemini micro-batching offline with a fake model client.
+Checks that a burst of uploads becomes one multi-image call, that each upload
+gets its own medicines back, and that bad replies fall back to per-image calls.
+Run: python test_ocr_batcher.py
+"""
+import json
+import threading
+
+from PIL import Image
+
+from gemini_client import ModelScheduler, RateLimitedGemini
+from ocr_batcher import GeminiBatcher
+from ocr_processor import PrescriptionOCR, GEMINI_PRESCRIPTION_PROMPT, parse_gemini_json
+
+# Each fake "prescription" is identified by its width
+MEDICINE_BY_WIDTH = {101: "Metformin", 102: "Lisinopril", 103: "Amlodipine", 104: "Atorvastatin"}
+
+
+class FakeModels:
+    """Answers like Gemini: a JSON object keyed by image number for batches,
+    a JSON array for single images. mode='garbage' / 'missing' simulates bad batch replies."""
+
+    def __init__(self, mode="ok"):
+        self.mode = mode
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def generate_content(self, model, contents):
+        images = [c for c in contents if isinstance(c, Image.Image)]
+        with self.lock:
+            self.calls.append(len(images))
+        answers = [[{"medicine_name": MEDICINE_BY_WIDTH[img.size[0]], "dosage": "10"}] for img in images]
+        if len(images) == 1:
+            text = json.dumps(answers[0])
+        elif self.mode == "garbage":
+            text = "Sorry, I can only look at one image at a time."
+        else:
+            reply = {str(n): answer for n, answer in enumerate(answers, start=1)}
+            if self.mode == "missing":
+                reply.pop("2")
+            text = "```json\n" + json.dumps(reply) + "\n```"
+        return type("Response", (), {"text": text})()
+
+
+def _run_burst(mode):
+    models = FakeModels(mode)
+    ocr = PrescriptionOCR.__new__(PrescriptionOCR)
+    ocr.gemini_client = type("Client", (), {"models": models})()
+    scheduler = ModelScheduler(models=["fake-model"], model_rpm={"fake-model": 6000})
+    gemini = RateLimitedGemini(ocr.gemini_client, scheduler=scheduler)
+    ocr._gemini_wrapper = gemini
+    batcher = GeminiBatcher(gemini, GEMINI_PRESCRIPTION_PROMPT, parse_gemini_json,
+                            ocr._prescriptions_from_gemini, ocr._extract_with_gemini,
+                            window_ms=300, max_images=4)
+
+    results = {}
+
+    def upload(width):
+        meds = batcher.extract(Image.new('RGB', (width, 50), 'white'))
+        results[width] = [m["medicine_name"] for m in meds]
+
+    threads = [threading.Thread(target=upload, args=(w,)) for w in MEDICINE_BY_WIDTH]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return results, models.calls, batcher.stats
+
+
+def test_micro_batching():
+    print("\n" + "="*60)
+    print("Gemini micro-batching (fake client)")
+    print("="*60)
+    expected = {w: [name] for w, name in MEDICINE_BY_WIDTH.items()}
+
+    results, calls, stats = _run_burst("ok")
+    assert results == expected, results
+    assert calls == [4], calls
+    print(f"✓ 4 concurrent uploads -> {len(calls)} model call, results routed back: {stats}")
+
+    results, calls, stats = _run_burst("missing")
+    assert results == expected, results
+    assert sorted(calls) == [1, 4], calls
+    print(f"✓ Image missing from the reply re-run on its own: calls={calls}")
+
+    results, calls, stats = _run_burst("garbage")
+    assert results == expected, results
+    assert sorted(calls) == [1, 1, 1, 1, 4], calls
+    print(f"✓ Unparseable reply falls back to per-image calls: calls={calls}")
+    print("✓ PASSED")
+
+
+if __name__ == "__main__":
+    test_micro_batching()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test the on-disk OCR result cache: hits, TTL expiry, LRU eviction and near-duplicates.
+Run: python test_ocr_cache.py   (no server or database needed)
+"""
+import io
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+from ocr_cache import OCRCache, fingerprint
+
+RESULTS = [{"medicine_name": "Metformin", "dosage": "500mg", "ocr_engine": "gemini-ai"}]
+
+
+def _prescription_image(text="Metformin 500mg twice daily"):
+    image = Image.new('RGB', (600, 400), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 20, 580, 380), outline='black', width=4)
+    draw.text((40, 60), text, fill='black')
+    return image
+
+
+def test_ocr_cache():
+    print("\n" + "="*60)
+    print("OCR result cache")
+    print("="*60)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = OCRCache(directory, ttl_seconds=3600, max_entries=2, near_duplicate_bits=0)
+        key, dhash = fingerprint(_prescription_image())
+
+        assert cache.get(key, dhash) is None
+        cache.put(key, dhash, RESULTS)
+        started = time.time()
+        assert cache.get(key, dhash) == RESULTS
+        print(f"✓ Exact hit in {(time.time() - started) * 1000:.1f} ms")
+
+        # A reopened cache (new worker) sees the same entries
+        assert OCRCache(directory, max_entries=2).get(key, dhash) == RESULTS
+        print("✓ Entries survive reopening")
+
+        # Same photo re-encoded as JPEG: different bytes, (almost) the same dHash
+        buffer = io.BytesIO()
+        _prescription_image().save(buffer, 'JPEG', quality=70)
+        jpeg_key, jpeg_dhash = fingerprint(Image.open(io.BytesIO(buffer.getvalue())).convert('RGB'))
+        assert cache.get(jpeg_key, jpeg_dhash) is None
+        near = OCRCache(directory, max_entries=2, near_duplicate_bits=6)
+        assert near.get(jpeg_key, jpeg_dhash) == RESULTS
+        print("✓ Re-encoded photo only hits with near-duplicate matching enabled")
+
+        # LRU: touching the first entry keeps it; the untouched one is evicted
+        other = fingerprint(_prescription_image("Lisinopril 10mg once daily"))
+        cache.put(*other, [{"medicine_name": "Lisinopril"}])
+        time.sleep(0.01)
+        cache.get(key, dhash)
+        third = fingerprint(_prescription_image("Amlodipine 5mg at night"))
+        cache.put(*third, [{"medicine_name": "Amlodipine"}])
+        assert cache.get(*other) is None
+        assert cache.get(key, dhash) == RESULTS
+        assert cache.stats()["entries"] == 2
+        print("✓ Least recently used entry evicted at max_entries")
+
+        expired = OCRCache(directory, ttl_seconds=0)
+        time.sleep(0.01)
+        assert expired.get(key, dhash) is None
+        print("✓ Entries past the TTL are ignored")
+
+    print("✓ PASSED")
+
+
+if __name__ == "__main__":
+    test_ocr_cache()
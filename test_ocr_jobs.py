@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test the OCR job queue's on-disk state: a finished job is still found by a
+fresh queue (a recycled worker), and an unfinished job whose process is gone
+comes back as 'lost' so the client resubmits instead of getting a 404; and a
+job rejected with QueueFull leaves nothing behind in the store.
+Run: python test_ocr_jobs.py
+"""
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+
+from ocr_jobs import OCRJobQueue, JobStore, QueueFull
+
+
+def test_jobs_survive_restart():
+    with tempfile.TemporaryDirectory() as directory:
+        store = JobStore(directory)
+        jobs = OCRJobQueue(workers=1, max_queued=2, store=store)
+        job_id = jobs.submit(lambda: {"status": "success", "data": {"count": 1}})
+        assert jobs.wait(job_id, 5)["status"] == "done"
+
+        restarted = OCRJobQueue(workers=1, max_queued=2, store=JobStore(directory))
+        job = restarted.wait(job_id, 0)
+        assert job["status"] == "done" and job["result"]["data"]["count"] == 1, job
+        print("✓ A finished job is still found after a worker restart")
+
+        # A job the previous worker claimed but never finished
+        store.save({"id": "orphan", "status": "running", "created_at": time.time(), "started_at": time.time(),
+                    "finished_at": None, "result": None, "error": None})
+        job = restarted.status("orphan")
+        assert job["status"] == "lost" and job["error"], job
+        assert restarted.status("never-submitted") is None
+        print("✓ An unfinished job from a dead worker is reported lost; unknown ids stay unknown")
+    print("✓ PASSED")
+
+
+def test_rejected_job_not_stored():
+    with tempfile.TemporaryDirectory() as directory:
+        store = JobStore(directory)
+        jobs = OCRJobQueue(workers=1, max_queued=1, store=store)
+        release = threading.Event()
+        running = jobs.submit(release.wait, 5)
+        deadline = time.time() + 5
+        while jobs.status(running)["status"] != "running" and time.time() < deadline:
+            time.sleep(0.01)
+        queued = jobs.submit(lambda: None)
+        try:
+            jobs.submit(lambda: None)
+            raise AssertionError("a full queue accepted a job")
+        except QueueFull:
+            pass
+        with closing(sqlite3.connect(store.path)) as conn:
+            stored = {row[0] for row in conn.execute("SELECT id FROM ocr_jobs")}
+        release.set()
+        # Let the workers finish writing before the directory goes away
+        assert jobs.wait(queued, 5)["status"] == "done"
+        assert stored == {running, queued}, stored
+        print("✓ A job rejected with QueueFull is not left in the store")
+
+
+if __name__ == "__main__":
+    test_jobs_survive_restart()
+    test_rejected_job_not_stored()
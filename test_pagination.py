@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test keyset pagination: cursors round-trip and reject tampering or another
+listing's cursor; walking the reminder history page by page returns every
+row exactly once in order even with tied reminder_times; and a deep page is
+an index range scan on idx_reminders_user_time starting at the cursor.
+Run: python test_pagination.py   (the database part needs the migrations applied)
+"""
+from datetime import datetime
+
+from pagination import Keyset, InvalidPageRequest, fetch_page, page_params
+from db_connection import get_db_connection, close_db_connection
+
+REMINDERS = Keyset("reminders", [("r.reminder_time", "timestamp"), ("r.id", "int")])
+DOSES = Keyset("doses", [("dt.scheduled_time", "timestamp"), ("dt.id", "int")])
+HISTORY = 250
+PAGE = 40
+
+
+def test_cursors():
+    key = [datetime(2026, 3, 1, 8, 0, 0, 123456), 42]
+    token = REMINDERS.encode(key)
+    assert REMINDERS.decode(token) == key
+    for bad in ("not-a-cursor", token[:-3], DOSES.encode(key)):
+        try:
+            REMINDERS.decode(bad)
+            raise AssertionError(f"accepted {bad!r}")
+        except InvalidPageRequest:
+            pass
+    assert page_params({}) == (None, 50)
+    assert page_params({"limit": "100000", "cursor": token}) == (token, 200)
+    try:
+        page_params({"limit": "0"})
+        raise AssertionError("accepted limit=0")
+    except InvalidPageRequest:
+        pass
+    print("✓ Cursors round-trip; tampered, foreign cursors and bad limits are rejected")
+
+
+def find_scan(plan, node_type):
+    if node_type in plan["Node Type"]:
+        return plan
+    for child in plan.get("Plans", []):
+        found = find_scan(child, node_type)
+        if found:
+            return found
+    return None
+
+
+def test_reminder_pages():
+    conn = get_db_connection()
+    assert conn, "database connection failed"
+    cursor = conn.cursor()
+    user_id = None
+    try:
+        cursor.execute("INSERT INTO users (username, email) VALUES ('paging_test', 'paging_test@example.test') RETURNING id")
+        user_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO prescriptions (user_id, medicine_name, dosage, frequency, start_date)
+            VALUES (%s, 'Metformin', '500', 'Twice daily', CURRENT_DATE - 200) RETURNING id
+        """, (user_id,))
+        prescription_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO adherence_plans (prescription_id, user_id, daily_schedule)
+            VALUES (%s, %s, ARRAY['08:00', '20:00']) RETURNING id
+        """, (prescription_id, user_id))
+        plan_id = cursor.fetchone()[0]
+        # Pairs of reminders share a reminder_time, so id has to break the ties
+        cursor.execute("""
+            WITH doses AS (
+                INSERT INTO dose_tracking (adherence_plan_id, prescription_id, user_id, scheduled_time, status)
+                SELECT %s, %s, %s, CURRENT_DATE - (g / 2) * INTERVAL '1 day' + TIME '08:00', 'taken'
+                FROM generate_series(1, %s) g
+                RETURNING id, scheduled_time
+            )
+            INSERT INTO reminders (dose_tracking_id, user_id, reminder_time, is_sent)
+            SELECT id, %s, scheduled_time - INTERVAL '15 minutes', TRUE FROM doses
+        """, (plan_id, prescription_id, user_id, HISTORY, user_id))
+        conn.commit()
+
+        query = "SELECT r.id, r.reminder_time FROM reminders r WHERE r.user_id = %s AND {keyset}"
+        seen, after, pages = [], None, 0
+        while True:
+            rows, after = fetch_page(cursor, REMINDERS, query, (user_id,), key=lambda row: (row[1], row[0]),
+                                     after=after, limit=PAGE)
+            seen += rows
+            pages += 1
+            if after is None:
+                break
+        cursor.execute("SELECT id, reminder_time FROM reminders WHERE user_id = %s ORDER BY reminder_time DESC, id DESC",
+                       (user_id,))
+        assert seen == cursor.fetchall(), "pages skipped, repeated or reordered rows"
+        assert pages == -(-HISTORY // PAGE)
+        print(f"✓ {HISTORY} reminders over {pages} pages, each exactly once, newest first")
+
+        # A deep page: the cursor becomes the start of the index scan, with no
+        # sort. The test table is tiny, so rule out the seq scan it would prefer.
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        deep = REMINDERS.encode([seen[-10][1], seen[-10][0]])
+        cursor.execute(f"""
+            EXPLAIN (FORMAT JSON)
+            SELECT r.id FROM reminders r WHERE r.user_id = %s AND {REMINDERS.condition()}
+            ORDER BY {REMINDERS.order_by()} LIMIT {PAGE + 1}
+        """, [user_id] + REMINDERS.decode(deep))
+        plan = cursor.fetchone()[0][0]["Plan"]
+        conn.rollback()
+        assert find_scan(plan, "Sort") is None, plan
+        scan = find_scan(plan, "Index")
+        assert scan and scan.get("Index Name") == "idx_reminders_user_time", scan
+        assert "reminder_time" in scan.get("Index Cond", ""), scan
+        print("✓ Deep page is an index range scan on idx_reminders_user_time from the cursor")
+    finally:
+        if user_id:
+            cursor.execute("DELETE FROM dose_tracking WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM adherence_summary WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        close_db_connection(conn)
+    print("✓ PASSED")
+
+
+if __name__ == "__main__":
+    test_cursors()
+    test_reminder_pages()
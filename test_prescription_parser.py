@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Test the compiled prescription-text parser: details per medicine, frequency
+rule priority, and that the TOKEN_START guard never hides a token.
+Run: python test_prescription_parser.py   (no server or database needed)
+"""
+import re
+
+import prescription_parser as parser
+from bench_prescription_parser import SAMPLE_TRANSCRIPTS
+
+
+def _details(text, names):
+    return [(d["dosage"], d["dosage_unit"], d["frequency"], d["duration"], d["route"])
+            for d in parser.parse_medicine_details(text, names)]
+
+
+def test_prescription_parser():
+    print("\n" + "="*60)
+    print("Prescription text parser")
+    print("="*60)
+
+    text = ("Rx\nTab Metformin 500mg BD after food x 30 days\n" + " " * 200 +
+            "\nCap Amoxicillin 250 MG three times a day for 1 week\n" + " " * 200 +
+            "\nCetirizine 5 ml at bedtime, 2 months")
+    assert _details(text, ["Metformin", "Amoxicillin", "Cetirizine", "Unknown"]) == [
+        ("500", "mg", "Twice daily", 30, "tablet"),
+        ("250", "mg", "Three times daily", 7, "capsule"),
+        ("5", "ml", "At bedtime", 60, None),
+        ("500", "mg", "Three times daily", 30, "tablet"),  # not found -> whole text
+    ]
+    print("✓ Dosage / frequency / duration / route per medicine from one scan")
+
+    # The first rule in FREQUENCY_RULES wins wherever it appears in the window
+    assert _details("Aspirin daily, every 8 hours", ["Aspirin"])[0][2] == "Every 8 hours"
+    assert _details("Aspirin 12 times daily", ["Aspirin"])[0][2] == "12 times daily"
+    print("✓ Frequency rule priority kept")
+
+    unguarded = re.compile(parser.TOKEN_RE.pattern.split(')', 1)[1])
+    for sample in SAMPLE_TRANSCRIPTS:
+        sample = sample.lower()
+        assert ([m.span() for m in parser.TOKEN_RE.finditer(sample)] ==
+                [m.span() for m in unguarded.finditer(sample)])
+    print("✓ TOKEN_START covers every token in the sample transcripts")
+    print("✓ PASSED")
+
+
+if __name__ == "__main__":
+    test_prescription_parser()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Test the reminder dispatcher: two workers draining the due-queue concurrently
+deliver every reminder exactly once, overdue reminders expire, reminders for
+doses already taken are cancelled, an unconfigured channel falls back to the
+app, the claim query reads the partial idx_reminders_due index, and channels
+that call out (SMS) send only after the claim has committed.
+Run: python test_reminder_dispatcher.py   (needs a database with the migrations applied)
+"""
+import threading
+from collections import Counter
+
+import reminder_dispatcher
+from db_connection import get_db_connection, close_db_connection
+
+DUE_REMINDERS = 300
+
+
+class CountingChannel(reminder_dispatcher.ReminderChannel):
+    name = "test"
+
+    def __init__(self):
+        self.sent = Counter()
+        self.lock = threading.Lock()
+
+    def send(self, cursor, reminder):
+        with self.lock:
+            self.sent[reminder["id"]] += 1
+
+
+class AfterCommitChannel(reminder_dispatcher.ReminderChannel):
+    """Checks from another connection that each reminder is already claimed and unlocked"""
+    name = "later"
+    in_transaction = False
+
+    def __init__(self):
+        self.seen = {}
+
+    def send(self, cursor, reminder):
+        conn = get_db_connection()
+        try:
+            check = conn.cursor()
+            check.execute("SELECT delivery_status FROM reminders WHERE id = %s FOR UPDATE NOWAIT",
+                          (reminder["id"],))
+            self.seen[reminder["id"]] = check.fetchone()[0]
+            conn.rollback()
+        finally:
+            close_db_connection(conn)
+        if len(self.seen) == 1:
+            raise ConnectionError("gateway down")
+
+
+def seed(cursor):
+    """One patient with DUE_REMINDERS due 'test' reminders plus an expired, a
+    cancelled and an SMS one. Returns (user_id, {case: reminder_id})."""
+    cursor.execute("""
+        INSERT INTO users (username, email) VALUES ('dispatch_test', 'dispatch_test@example.test')
+        RETURNING id
+    """)
+    user_id = cursor.fetchone()[0]
+    cursor.execute("""
+        INSERT INTO prescriptions (user_id, medicine_name, dosage, frequency, start_date)
+        VALUES (%s, 'Metformin', '500', 'Once daily', CURRENT_DATE) RETURNING id
+    """, (user_id,))
+    prescription_id = cursor.fetchone()[0]
+    cursor.execute("""
+        INSERT INTO adherence_plans (prescription_id, user_id, daily_schedule)
+        VALUES (%s, %s, ARRAY['08:00']) RETURNING id
+    """, (prescription_id, user_id))
+    plan_id = cursor.fetchone()[0]
+    cursor.execute("""
+        WITH doses AS (
+            INSERT INTO dose_tracking (adherence_plan_id, prescription_id, user_id, scheduled_time, status)
+            SELECT %s, %s, %s, LOCALTIMESTAMP, CASE WHEN g = 2 THEN 'taken' ELSE 'pending' END
+            FROM generate_series(1, %s + 3) g
+            RETURNING id
+        )
+        INSERT INTO reminders (dose_tracking_id, user_id, reminder_text, reminder_time, reminder_method)
+        SELECT id, %s, 'Time to take Metformin',
+               LOCALTIMESTAMP - CASE WHEN row_number() OVER (ORDER BY id) = 1 THEN INTERVAL '1 day'
+                                     ELSE INTERVAL '1 minute' END,
+               CASE row_number() OVER (ORDER BY id) WHEN 3 THEN 'sms' ELSE 'test' END
+        FROM doses
+        RETURNING id
+    """, (plan_id, prescription_id, user_id, DUE_REMINDERS, user_id))
+    ids = sorted(row[0] for row in cursor.fetchall())
+    return user_id, {"expired": ids[0], "cancelled": ids[1], "sms": ids[2], "due": ids[3:]}
+
+
+def test_reminder_dispatch():
+    print("\n" + "="*60)
+    print("Reminder dispatcher: concurrent workers on the due-queue")
+    print("="*60)
+    channel = CountingChannel()
+    reminder_dispatcher.register_channel(channel)
+    sms_url, reminder_dispatcher.SMS_GATEWAY_URL = reminder_dispatcher.SMS_GATEWAY_URL, None
+
+    conn = get_db_connection()
+    assert conn, "database connection failed"
+    cursor = conn.cursor()
+    user_id = None
+    try:
+        user_id, ids = seed(cursor)
+        conn.commit()
+
+        cursor.execute("""EXPLAIN SELECT id FROM reminders
+                          WHERE NOT is_sent AND reminder_time <= LOCALTIMESTAMP
+                          ORDER BY reminder_time LIMIT 100""")
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+        conn.rollback()
+        assert "idx_reminders_due" in plan, plan
+        print("✓ Due-queue claim reads idx_reminders_due")
+
+        def worker():
+            worker_conn = get_db_connection()
+            try:
+                reminder_dispatcher.dispatch_due(worker_conn, batch_size=25)
+            finally:
+                close_db_connection(worker_conn)
+        workers = [threading.Thread(target=worker) for _ in range(2)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        assert set(channel.sent) >= set(ids["due"]), "some reminders were not sent"
+        assert max(channel.sent.values()) == 1, "a reminder was sent twice"
+        print(f"✓ {len(ids['due'])} reminders sent exactly once by 2 workers")
+
+        cursor.execute("""SELECT id, is_sent, delivery_status, sent_at IS NOT NULL
+                          FROM reminders WHERE id = ANY(%s)""",
+                       ([ids["expired"], ids["cancelled"], ids["sms"]],))
+        rows = {row[0]: row[1:] for row in cursor.fetchall()}
+        assert rows[ids["expired"]] == (True, "expired", False)
+        assert rows[ids["cancelled"]] == (True, "cancelled", False)
+        assert rows[ids["sms"]] == (True, "fallback", True)
+        print("✓ Overdue reminder expired, taken dose cancelled, SMS fell back to the app")
+    finally:
+        reminder_dispatcher.CHANNELS.pop("test", None)
+        reminder_dispatcher.SMS_GATEWAY_URL = sms_url
+        if user_id:
+            cursor.execute("DELETE FROM dose_tracking WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM adherence_summary WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        close_db_connection(conn)
+    print("✓ PASSED")
+
+
+def test_after_commit_channel():
+    channel = AfterCommitChannel()
+    reminder_dispatcher.register_channel(channel)
+    conn = get_db_connection()
+    assert conn, "database connection failed"
+    cursor = conn.cursor()
+    user_id = None
+    try:
+        user_id, ids = seed(cursor)
+        later = ids["due"][:3]
+        cursor.execute("UPDATE reminders SET reminder_method = 'later' WHERE id = ANY(%s)", (later,))
+        cursor.execute("UPDATE reminders SET is_sent = TRUE WHERE user_id = %s AND NOT (id = ANY(%s))",
+                       (user_id, later))
+        conn.commit()
+
+        counts = reminder_dispatcher.dispatch_due(conn)
+        assert channel.seen == {reminder_id: "sending" for reminder_id in later}, channel.seen
+        assert counts == {"fallback": 1, "sent": 2}, counts
+        cursor.execute("""SELECT delivery_status, last_error FROM reminders WHERE id = ANY(%s)
+                          ORDER BY delivery_status""", (later,))
+        rows = cursor.fetchall()
+        assert rows == [("fallback", "later failed: gateway down"), ("sent", None), ("sent", None)], rows
+        print("✓ After-commit channel sends claimed, unlocked reminders and records each outcome")
+    finally:
+        reminder_dispatcher.CHANNELS.pop("later", None)
+        if user_id:
+            cursor.execute("DELETE FROM dose_tracking WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM adherence_summary WHERE user_id = %s", (user_id,))
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cursor.close()
+        close_db_connection(conn)
+
+
+if __name__ == "__main__":
+    test_reminder_dispatch()
+    test_after_commit_channel()